@@ -5,7 +5,7 @@ import os
 from openfisca_core.taxbenefitsystems import TaxBenefitSystem
 
 from openfisca_france_dotations_locales import entities
-from openfisca_france_dotations_locales.situation_examples import communes_dsr
+from openfisca_france_dotations_locales.parameters_cache import load_parameter_tree
 
 
 COUNTRY_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -27,9 +27,32 @@ class CountryTaxBenefitSystem(TaxBenefitSystem):
         param_path = os.path.join(COUNTRY_DIR, 'parameters')
         self.load_parameters(param_path)
 
-        # We define which variable, parameter and simulation example will be used in the OpenAPI specification
-        self.open_api_config = {
-            "variable_example": "population_dgf_plafonnee",
-            "parameter_example": "dotation_solidarite_rurale.seuil_nombre_habitants",
-            "simulation_example": communes_dsr,
-            }
+        # The OpenAPI specification is only built by the web API: see `open_api_config`
+        self._open_api_config = None
+
+    def load_parameters(self, path_to_yaml_dir):
+        # Same as TaxBenefitSystem.load_parameters, except that the parsed parameter tree
+        # is cached on disk and reused as long as no parameter file changes
+        parameters = load_parameter_tree(path_to_yaml_dir)
+
+        if self.preprocess_parameters is not None:
+            parameters = self.preprocess_parameters(parameters)
+
+        self.parameters = parameters
+
+    # We define which variable, parameter and simulation example will be used in the OpenAPI specification
+    # The simulation example is read from disk on first access only
+    @property
+    def open_api_config(self):
+        if self._open_api_config is None:
+            from openfisca_france_dotations_locales.situation_examples import communes_dsr
+            self._open_api_config = {
+                "variable_example": "population_dgf_plafonnee",
+                "parameter_example": "dotation_solidarite_rurale.seuil_nombre_habitants",
+                "simulation_example": communes_dsr,
+                }
+        return self._open_api_config
+
+    @open_api_config.setter
+    def open_api_config(self, open_api_config):
+        self._open_api_config = open_api_config
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+'''
+Cache de l'arbre des paramètres, pour éviter de relire les fichiers YAML à chaque démarrage.
+
+L'arbre est sérialisé (`pickle`) avec la liste des fichiers de `parameters/`,
+leur taille et leur date de modification : toute modification d'un fichier
+provoque une nouvelle lecture des YAML et la réécriture du cache.
+
+Le cache est désactivé par défaut : il n'est utilisé que si la variable d'environnement
+`OPENFISCA_DOTATIONS_LOCALES_CACHE_DIR` désigne un répertoire, où il est écrit
+(ex. `~/.cache/openfisca-france-dotations-locales`). Sans elle, l'import du paquet n'écrit rien sur le disque.
+Le cache n'est lu que si ce répertoire et le fichier appartiennent à l'utilisateur courant
+et ne sont pas modifiables par d'autres : `pickle` peut exécuter du code à la lecture.
+'''
+
+import hashlib
+import inspect
+import os
+import pickle
+import stat
+import sys
+import tempfile
+
+from openfisca_core.parameters import ParameterNode
+
+
+CACHE_DIRECTORY_VARIABLE = 'OPENFISCA_DOTATIONS_LOCALES_CACHE_DIR'
+
+
+def get_cache_directory():
+    # Répertoire du cache, ou None si le cache n'est pas activé
+    return os.environ.get(CACHE_DIRECTORY_VARIABLE) or None
+
+
+def get_files_manifest(directory):
+    '''
+    Renvoie la liste triée des fichiers de `directory` avec leur taille et leur date de modification.
+    '''
+    manifest = []
+    for root, directories, file_names in os.walk(directory):
+        directories.sort()
+        for file_name in sorted(file_names):
+            path = os.path.join(root, file_name)
+            status = os.stat(path)
+            manifest.append((os.path.relpath(path, directory), status.st_size, status.st_mtime_ns))
+    return manifest
+
+
+def is_private(status):
+    '''
+    Indique si le fichier de statut `status` appartient à l'utilisateur courant
+    et n'est modifiable ni par son groupe ni par les autres.
+    '''
+    if hasattr(os, 'getuid') and status.st_uid != os.getuid():
+        return False
+    return not status.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def get_cache_path(cache_directory, parameters_directory):
+    # Le cache dépend aussi de la version d'OpenFisca-Core, dont les classes sont sérialisées
+    core_module = inspect.getfile(ParameterNode)
+    core_status = os.stat(core_module)
+    description = repr((
+        os.path.abspath(parameters_directory),
+        core_module, core_status.st_size, core_status.st_mtime_ns,
+        sys.version_info[:2],
+        ))
+    return os.path.join(cache_directory, 'parameters-{}.pickle'.format(hashlib.sha1(description.encode('utf-8')).hexdigest()))
+
+
+def load_parameter_tree(parameters_directory, cache_directory = None):
+    '''
+    Renvoie l'arbre des paramètres de `parameters_directory`, lu depuis le cache s'il est à jour.
+    '''
+    if cache_directory is None:
+        cache_directory = get_cache_directory()
+    if cache_directory is None:
+        return ParameterNode('', directory_path = parameters_directory)
+
+    cache_path = get_cache_path(cache_directory, parameters_directory)
+    manifest = get_files_manifest(parameters_directory)
+    try:
+        os.makedirs(cache_directory, mode = 0o700, exist_ok = True)
+        if not is_private(os.stat(cache_directory)):
+            # Répertoire partagé : un autre utilisateur pourrait y déposer un fichier malveillant
+            return ParameterNode('', directory_path = parameters_directory)
+    except OSError:
+        return ParameterNode('', directory_path = parameters_directory)
+
+    try:
+        with open(cache_path, 'rb') as file:
+            if not is_private(os.fstat(file.fileno())):
+                raise ValueError(cache_path)
+            cached = pickle.load(file)
+        if cached['manifest'] == manifest:
+            return cached['parameters']
+    except Exception:
+        # Cache absent, illisible, écrit par une autre version ou par un autre utilisateur
+        pass
+
+    parameters = ParameterNode('', directory_path = parameters_directory)
+    try:
+        descriptor, temporary_path = tempfile.mkstemp(dir = cache_directory, suffix = '.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                pickle.dump({'manifest': manifest, 'parameters': parameters}, file, protocol = pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, cache_path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+    except (OSError, pickle.PicklingError):
+        # Un cache qui ne peut être écrit (ex. système de fichiers en lecture seule) n'empêche pas le démarrage
+        pass
+    return parameters
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+import os
+import weakref
+
+import numpy as np
+
+from openfisca_core import periods
+from openfisca_core.holders import Holder
+from openfisca_core.periods import ETERNITY
+from openfisca_core.populations import GroupPopulation
+from openfisca_core.simulation_builder import SimulationBuilder
+from openfisca_core.simulations import Simulation
+
+from openfisca_france_dotations_locales.simulations.liveness import LivenessTracker
+from openfisca_france_dotations_locales.simulations.parameters import ParameterNodeOverride
+from openfisca_france_dotations_locales.simulations.precision import retype_variable
+from openfisca_france_dotations_locales.simulations.storage import SpillStorage, create_spill_directory, get_threshold, remove_spill_directory
+
+
+class ReformSimulation(Simulation):
+    '''
+    Simulation dont certains paramètres sont remplacés, sans modifier le système socio-fiscal.
+
+    `parameter_overrides` associe des chemins de paramètres
+    (ex. `dotation_solidarite_rurale.augmentation_montant`) aux valeurs à utiliser.
+    `dtypes` est un profil de précision (cf. `precision`) : il remplace le type de stockage
+    de certaines variables, par type de valeur ou par nom de variable.
+    Avec `outputs`, les variables que l'appelant demandera, chaque résultat intermédiaire
+    est retiré du cache dès que plus aucune formule restant à calculer ne le lit (cf. `liveness`) ;
+    le demander ensuite lève une `ValueError`.
+    Avec `spill_threshold`, en octets, les grands tableaux sont écrits dans un répertoire de travail
+    créé dans `spill_directory`, et relus par projection en mémoire (cf. `storage`) ;
+    `close()` supprime ce répertoire.
+    '''
+
+    def __init__(self, tax_benefit_system, populations, parameter_overrides = None, dtypes = None, outputs = None,
+            spill_threshold = None, spill_directory = None):
+        super(ReformSimulation, self).__init__(tax_benefit_system, populations)
+        self.liveness = LivenessTracker(self, outputs) if outputs is not None else None
+        self._calculation_depth = 0
+        self.parameter_overrides = dict(parameter_overrides or {})
+        self.dtypes = dict(dtypes or {})
+        if self.dtypes:
+            for population in self.populations.values():
+                for variable in tax_benefit_system.get_variables(population.entity).values():
+                    retyped_variable = retype_variable(variable, self.dtypes)
+                    if retyped_variable is not variable:
+                        population._holders[variable.name] = Holder(retyped_variable, population)
+        self.spill_directory = None
+        if spill_threshold is not None:
+            self.spill_directory = create_spill_directory(spill_directory)
+            self._remove_spill_directory = weakref.finalize(self, remove_spill_directory, self.spill_directory)
+            for population in self.populations.values():
+                for variable in tax_benefit_system.get_variables(population.entity).values():
+                    threshold = get_threshold(variable, spill_threshold)
+                    if threshold is not None:
+                        population.get_holder(variable.name)._memory_storage = SpillStorage(
+                            os.path.join(self.spill_directory, variable.name),
+                            threshold,
+                            is_eternal = variable.definition_period == ETERNITY,
+                            )
+
+    def close(self):
+        '''
+        Supprime les tableaux écrits sur disque et leur répertoire de travail.
+        '''
+        if self.spill_directory is not None:
+            for population in self.populations.values():
+                for holder in population._holders.values():
+                    if isinstance(holder._memory_storage, SpillStorage):
+                        holder._memory_storage.delete_spilled()
+            self._remove_spill_directory()
+            self.spill_directory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def calculate(self, variable_name, period):
+        if self.liveness is not None and self._calculation_depth == 0:
+            period = periods.period(period)
+            if self.liveness.is_released((variable_name, period)):
+                raise ValueError("'{}' for {} was released after its last reader ran: add it to `outputs` to keep it.".format(variable_name, period))
+            self.liveness.plan(variable_name, period)
+        self._calculation_depth += 1
+        try:
+            return super(ReformSimulation, self).calculate(variable_name, period)
+        finally:
+            self._calculation_depth -= 1
+
+    def _calculate(self, variable_name, period):
+        if self.liveness is None or self.liveness.is_known((variable_name, period)):
+            return super(ReformSimulation, self)._calculate(variable_name, period)
+        array = super(ReformSimulation, self)._calculate(variable_name, period)
+        self.liveness.consume(variable_name, period)
+        return array
+
+    def parameters_at(self, instant):
+        if self.trace:
+            parameters = self.trace_parameters_at_instant(instant)
+        else:
+            parameters = self.tax_benefit_system.get_parameters_at_instant(instant)
+        if not self.parameter_overrides:
+            return parameters
+        return ParameterNodeOverride(parameters, self.parameter_overrides)
+
+    def _run_formula(self, variable, population, period):
+        formula = variable.get_formula(period)
+        if formula is None:
+            return None
+
+        if formula.__code__.co_argcount == 2:
+            return formula(population, period)
+        return formula(population, period, self.parameters_at)
+
+    def _cast_formula_result(self, value, variable):
+        # Type de stockage propre à cette simulation
+        return super(ReformSimulation, self)._cast_formula_result(value, self.get_holder(variable.name).variable)
+
+
+def build_simulation(tax_benefit_system, inputs, period, simulation_class = Simulation, group_population_class = GroupPopulation, **kwargs):
+    '''
+    Construit une simulation nationale : toutes les communes sont membres d'un unique État.
+
+    `inputs` associe à chaque variable d'entrée un tableau de valeurs pour `period`,
+    ou un dictionnaire {période: tableau} pour renseigner plusieurs années
+    (par exemple les montants perçus l'année précédente).
+    Les arguments supplémentaires sont transmis au constructeur de `simulation_class`.
+    '''
+    inputs = {
+        variable_name: values if isinstance(values, dict) else {period: values}
+        for variable_name, values in inputs.items()
+        }
+    nombre_communes = next(
+        len(array)
+        for variable_name, values in inputs.items()
+        if tax_benefit_system.get_variable(variable_name, check_existence = True).entity.key == 'commune'
+        for array in values.values()
+        )
+
+    builder = SimulationBuilder()
+    builder.create_entities(tax_benefit_system)
+    communes = builder.populations['commune']
+    builder.populations['etat'] = group_population_class(builder.populations['etat'].entity, communes)
+    builder.declare_person_entity('commune', range(nombre_communes))
+    etat = builder.declare_entity('etat', ['etat'])
+    builder.join_with_persons(etat, np.zeros(nombre_communes, dtype = int), ['commune'] * nombre_communes)
+
+    simulation = simulation_class(tax_benefit_system, builder.populations, **kwargs)
+    for variable_name, values in inputs.items():
+        for input_period, array in values.items():
+            simulation.set_input(variable_name, input_period, array)
+    return simulation
+
+
+def cast_inputs(tax_benefit_system, inputs):
+    '''
+    Convertit les données d'entrée au type de leur variable,
+    pour que les simulations successives les utilisent sans copie.
+    '''
+    def cast(variable_name, array):
+        return np.asarray(array, dtype = tax_benefit_system.get_variable(variable_name, check_existence = True).dtype)
+
+    return {
+        variable_name: (
+            {input_period: cast(variable_name, array) for input_period, array in values.items()}
+            if isinstance(values, dict)
+            else cast(variable_name, values)
+            )
+        for variable_name, values in inputs.items()
+        }
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from openfisca_core.populations import GroupPopulation
+
+from openfisca_france_dotations_locales.simulations.base import ReformSimulation, build_simulation
+
+
+class BatchGroupPopulation(GroupPopulation):
+    '''
+    Population de groupe dont les tableaux peuvent porter une colonne par variante.
+    Seule la première dimension doit correspondre au nombre d'entités.
+    '''
+
+    def project(self, array, role = None):
+        if role is None and np.ndim(array) == 2:
+            if len(array) != self.count:
+                raise ValueError("Input {} is not a valid value for the entity {} (length = {} != {} = count)".format(
+                    array, self.entity.key, len(array), self.count))
+            return array[self.members_entity_id]
+        return super(BatchGroupPopulation, self).project(array, role)
+
+
+class BatchSimulation(ReformSimulation):
+    '''
+    Simulation qui évalue en une seule passe N variantes de paramètres.
+
+    `variants` associe des chemins de paramètres à des séquences de N valeurs.
+    Les tableaux sont stockés communes en lignes, variantes en colonnes :
+    une variable qui ne dépend d'aucun paramètre modifié garde une seule colonne
+    et n'est calculée qu'une fois pour toutes les variantes.
+    Les réductions nationales (sommes, classements) se font selon l'axe des communes.
+    '''
+
+    def __init__(self, tax_benefit_system, populations, variants, dtypes = None, outputs = None, spill_threshold = None, spill_directory = None):
+        variants = {path: np.asarray(values) for path, values in variants.items()}
+        super(BatchSimulation, self).__init__(tax_benefit_system, populations, variants, dtypes, outputs, spill_threshold, spill_directory)
+        sizes = {len(values) for values in variants.values()}
+        if len(sizes) != 1:
+            raise ValueError("All parameter variants must have the same length, got lengths {}.".format(sorted(sizes)))
+        self.batch_size = sizes.pop()
+
+    @property
+    def variants(self):
+        return self.parameter_overrides
+
+    def _run_formula(self, variable, population, period):
+        array = super(BatchSimulation, self)._run_formula(variable, population, period)
+        if isinstance(array, np.ndarray) and array.ndim == 1:
+            # Un tableau à une dimension issu d'une formule est une réduction nationale :
+            # une valeur par variante, identique pour toutes les entités.
+            array = np.broadcast_to(array, (population.count, len(array)))
+        return array
+
+    def _calculate(self, variable_name, period):
+        array = super(BatchSimulation, self)._calculate(variable_name, period)
+        # Les valeurs par défaut renvoyées en cas de récursion (SpiralError) ne passent pas par le cache
+        if array.ndim == 1:
+            array = array.reshape(-1, 1)
+        return array
+
+    def _cast_formula_result(self, value, variable):
+        value = super(BatchSimulation, self)._cast_formula_result(value, variable)
+        if value.ndim == 1:
+            value = value.reshape(-1, 1)
+        return value
+
+    def set_input(self, variable_name, period, value):
+        value = np.asarray(value)
+        if value.ndim == 1:
+            value = value.reshape(-1, 1)
+        super(BatchSimulation, self).set_input(variable_name, period, value)
+
+    def calculate_variants(self, variable_name, period):
+        '''
+        Renvoie un tableau (N variantes, nombre d'entités) des valeurs de `variable_name`.
+        '''
+        array = self.calculate(variable_name, period)
+        return np.broadcast_to(array, (len(array), self.batch_size)).T
+
+
+def build_batch_simulation(tax_benefit_system, inputs, period, variants, dtypes = None, outputs = None, spill_threshold = None, spill_directory = None):
+    '''
+    Construit une simulation nationale par lots à partir des données d'entrée des communes
+    (cf. `build_simulation`) et des variantes de paramètres, avec le profil de précision `dtypes`
+    (cf. `precision`). Avec `outputs`, les résultats intermédiaires sont libérés au fil du calcul (cf. `liveness`) ;
+    avec `spill_threshold`, les grands tableaux sont écrits sur disque (cf. `storage`).
+
+    Exemple, pour trois montants d'augmentation de la DSR :
+
+        simulation = build_batch_simulation(
+            tax_benefit_system, inputs, '2020',
+            {'dotation_solidarite_rurale.augmentation_montant': [0, 90_000_000, 180_000_000]}
+            )
+        simulation.calculate_variants('dotation_solidarite_rurale', '2020')  # tableau (3, nombre de communes)
+    '''
+    return build_simulation(
+        tax_benefit_system, inputs, period,
+        simulation_class = BatchSimulation,
+        group_population_class = BatchGroupPopulation,
+        variants = variants,
+        dtypes = dtypes,
+        outputs = outputs,
+        spill_threshold = spill_threshold,
+        spill_directory = spill_directory,
+        )
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+'''
+Mesure des temps de calcul des dotations sur un nombre de communes de taille nationale.
+
+Usage :
+
+    python -m openfisca_france_dotations_locales.simulations.benchmark --output resultats.json
+
+Le résultat, au format JSON, donne pour chaque variable et chaque année le temps de calcul,
+le pic de mémoire résidente du processus, le nombre de tableaux calculés et la taille des tableaux en cache.
+Toutes les mesures ont lieu dans le même processus : le pic de mémoire (`cumulative_peak_rss`)
+est le maximum atteint depuis son démarrage, il ne peut que croître d'une mesure à l'autre
+et n'est propre à une variable que si elle est seule mesurée (`--variable` et `--annee`).
+Avec `--liveness`, les résultats intermédiaires sont libérés au fil du calcul (cf. `liveness`) :
+seuls les tableaux encore en cache à la fin du calcul sont comptés.
+
+Avec `--precision`, il donne à la place, pour chaque montant final, l'écart maximal en euros
+entre le calcul en types compacts (ceux d'OpenFisca) et un calcul de référence sur 64 bits.
+'''
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from openfisca_france_dotations_locales.simulations.base import ReformSimulation, build_simulation
+from openfisca_france_dotations_locales.simulations.cache import get_package_version
+from openfisca_france_dotations_locales.simulations.precision import DOUBLE, MONTANTS
+from openfisca_france_dotations_locales.simulations.synthetic import NOMBRE_COMMUNES_NATIONAL, generate_communes
+
+
+VARIABLES = [
+    'dotation_forfaitaire',
+    'dotation_solidarite_rurale',
+    'dsr_fraction_bourg_centre',
+    'dsr_fraction_perequation',
+    'dsr_fraction_cible',
+    'dsu_montant',
+    ]
+
+ANNEES = ['2019', '2020', '2021']
+
+
+def get_peak_rss():
+    '''
+    Renvoie le pic de mémoire résidente du processus depuis son démarrage en octets, ou `None` si le système ne le fournit pas.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kio sous Linux, octets sous macOS
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024
+
+
+def count_arrays(simulation):
+    return sum(
+        len(simulation.get_holder(variable_name).get_known_periods())
+        for variable_name in simulation.tax_benefit_system.variables
+        )
+
+
+def count_bytes(simulation):
+    return sum(
+        holder.get_array(period).nbytes
+        for holder in (simulation.get_holder(variable_name) for variable_name in simulation.tax_benefit_system.variables)
+        for period in holder.get_known_periods()
+        )
+
+
+def run_benchmark(tax_benefit_system, nombre_communes = NOMBRE_COMMUNES_NATIONAL, variables = VARIABLES, annees = ANNEES, seed = 0, liveness = False):
+    '''
+    Calcule chaque variable de `variables` pour chaque année de `annees`, dans une simulation neuve,
+    et renvoie les mesures sous forme de dictionnaire sérialisable en JSON.
+    Avec `liveness`, la variable calculée est déclarée à la simulation, qui libère les résultats intermédiaires.
+    '''
+    resultats = []
+    for annee in annees:
+        inputs = generate_communes(nombre_communes, annee, seed, tax_benefit_system)
+        for variable_name in variables:
+            simulation = build_simulation(
+                tax_benefit_system, inputs, annee,
+                simulation_class = ReformSimulation,
+                outputs = [variable_name] if liveness else None,
+                )
+            nombre_entrees = count_arrays(simulation)
+            debut = time.perf_counter()
+            simulation.calculate(variable_name, annee)
+            duree = time.perf_counter() - debut
+            resultats.append({
+                'variable': variable_name,
+                'period': annee,
+                'wall_time': duree,
+                'cumulative_peak_rss': get_peak_rss(),
+                'computed_arrays': count_arrays(simulation) - nombre_entrees,
+                'cached_bytes': count_bytes(simulation),
+                })
+    return {
+        'metadata': {
+            'version': get_package_version(),
+            'communes': nombre_communes,
+            'seed': seed,
+            'liveness': liveness,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            },
+        'results': resultats,
+        }
+
+
+def run_precision_report(tax_benefit_system, inputs, period, variables = MONTANTS, dtypes = None, reference = DOUBLE):
+    '''
+    Calcule `variables` avec le profil de précision `dtypes` (par défaut, les types d'OpenFisca), puis avec le profil `reference`,
+    et renvoie pour chaque variable l'écart absolu maximal entre les deux calculs (en euros pour un montant),
+    la somme des écarts rapportée au total national de référence, et la taille en octets des deux résultats.
+
+    `inputs`, au format de `build_simulation`, doit garder sa précision d'origine (sans `cast_inputs`),
+    pour que la référence ne soit pas arrondie dès les données d'entrée.
+    '''
+    simulation = build_simulation(tax_benefit_system, inputs, period, simulation_class = ReformSimulation, dtypes = dtypes)
+    simulation_reference = build_simulation(tax_benefit_system, inputs, period, simulation_class = ReformSimulation, dtypes = reference)
+    rapport = {}
+    for variable_name in variables:
+        valeurs = simulation.calculate(variable_name, period)
+        valeurs_reference = simulation_reference.calculate(variable_name, period)
+        ecarts = np.abs(valeurs.astype(np.float64) - valeurs_reference.astype(np.float64))
+        total = np.sum(np.abs(valeurs_reference), dtype = np.float64)
+        rapport[variable_name] = {
+            'max_deviation': float(ecarts.max()) if ecarts.size else 0.,
+            'relative_deviation': float(ecarts.sum() / total) if total else 0.,
+            'bytes': valeurs.nbytes,
+            'reference_bytes': valeurs_reference.nbytes,
+            }
+    return rapport
+
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = "Mesure des temps de calcul des dotations à l'échelle nationale.")
+    parser.add_argument('--communes', type = int, default = NOMBRE_COMMUNES_NATIONAL, help = "nombre de communes simulées (ex. 350560 ou 3505600 pour 10 ou 100 fois la France)")
+    parser.add_argument('--variable', action = 'append', help = "variable à calculer (par défaut, les dotations et chaque fraction de la DSR)")
+    parser.add_argument('--annee', action = 'append', help = "année de calcul (par défaut, {})".format(', '.join(ANNEES)))
+    parser.add_argument('--seed', type = int, default = 0, help = "graine des données générées")
+    parser.add_argument('--liveness', action = 'store_true', help = "libère les résultats intermédiaires dès qu'ils ne sont plus lus")
+    parser.add_argument('--precision', action = 'store_true', help = "mesure l'écart des montants entre les types compacts et un calcul sur 64 bits, au lieu des temps de calcul")
+    parser.add_argument('--output', help = "fichier JSON où écrire les résultats (par défaut, la sortie standard)")
+    arguments = parser.parse_args(arguments)
+
+    from openfisca_france_dotations_locales import CountryTaxBenefitSystem
+    tax_benefit_system = CountryTaxBenefitSystem()
+    if arguments.precision:
+        resultats = {
+            annee: run_precision_report(
+                tax_benefit_system,
+                generate_communes(arguments.communes, annee, arguments.seed),
+                annee,
+                variables = arguments.variable or MONTANTS,
+                )
+            for annee in arguments.annee or ANNEES
+            }
+    else:
+        resultats = run_benchmark(
+            tax_benefit_system,
+            nombre_communes = arguments.communes,
+            variables = arguments.variable or VARIABLES,
+            annees = arguments.annee or ANNEES,
+            seed = arguments.seed,
+            liveness = arguments.liveness,
+            )
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(resultats, file, indent = 2)
+    else:
+        json.dump(resultats, sys.stdout, indent = 2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
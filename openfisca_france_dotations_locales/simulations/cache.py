@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+
+from openfisca_core import periods
+from openfisca_core.parameters import ParameterNodeAtInstant
+
+from openfisca_france_dotations_locales.simulations.base import ReformSimulation
+from openfisca_france_dotations_locales.simulations.dependencies import get_formula_dependencies
+from openfisca_france_dotations_locales.simulations.parameters import ParameterNodeOverride, get_parameter
+
+
+def get_package_version():
+    try:
+        import pkg_resources
+        return pkg_resources.get_distribution('OpenFisca-France-Dotations-Locales').version
+    except Exception:
+        return 'unknown'
+
+
+class ResultCache(object):
+    '''
+    Cache persistant sur disque des tableaux calculés, limité à `max_size` octets.
+
+    Les tableaux sont stockés dans des fichiers `.npy` nommés d'après leur clef.
+    Chaque lecture met à jour la date de modification du fichier :
+    lorsque la taille limite est dépassée, les tableaux les moins récemment utilisés sont supprimés.
+    '''
+
+    def __init__(self, directory, max_size = 2 ** 30, version = None):
+        self.directory = directory
+        self.max_size = max_size
+        self.version = get_package_version() if version is None else version
+        os.makedirs(directory, exist_ok = True)
+
+    def _array_path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def get(self, key):
+        path = self._array_path(key)
+        try:
+            array = np.load(path)
+        except (IOError, ValueError):
+            return None
+        os.utime(path)
+        return array
+
+    def put(self, key, array):
+        self._write(self._array_path(key), lambda file: np.save(file, np.asarray(array)))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith('.npy'):
+                path = os.path.join(self.directory, file_name)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((status.st_mtime, status.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+
+    def _write(self, path, write):
+        # Écriture atomique : plusieurs processus peuvent partager le même cache
+        descriptor, temporary_path = tempfile.mkstemp(dir = os.path.dirname(path), suffix = '.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                write(file)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+
+def hash_array(array):
+    array = np.ascontiguousarray(array)
+    digest = hashlib.sha1(array.view(np.uint8) if array.size else b'')
+    digest.update(str((array.dtype.str, array.shape)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def hash_parameter(value):
+    if hasattr(value, 'thresholds'):  # barème
+        value = (type(value).__name__, value.thresholds, getattr(value, 'amounts', None), getattr(value, 'rates', None))
+        return hashlib.sha1(repr(value).encode('utf-8')).hexdigest()
+    if isinstance(value, np.ndarray):
+        return hash_array(value)
+    return hashlib.sha1(repr(value).encode('utf-8')).hexdigest()
+
+
+# Dépendances statiques de chaque formule, extraites une fois pour toutes les simulations
+_formula_dependencies = {}
+
+# Données d'entrée (variable, période), paramètres (chemin, instant) et variables dont dépend une valeur.
+# `complete` est faux si la période d'une lecture ne peut être déterminée statiquement ;
+# `spiral` est vrai si le parcours s'arrête sur une récursion sur les périodes, ce qui dépend des variables en cours de parcours.
+Closure = namedtuple('Closure', ['inputs', 'parameters', 'variables', 'complete', 'spiral'])
+
+
+class CachedSimulation(ReformSimulation):
+    '''
+    Simulation qui réutilise les tableaux calculés lors de simulations précédentes, via un `ResultCache`.
+
+    La clef d'un tableau combine la version du paquet, la variable, la période,
+    l'empreinte des données d'entrée dont la variable dépend
+    et celle des valeurs des paramètres qu'elle lit, directement ou à travers ses dépendances.
+    Ces dépendances sont celles du graphe statique des formules (cf. `dependencies`),
+    parcouru jusqu'aux données d'entrée : la clef est connue avant le calcul,
+    et ne dépend pas des seules lectures d'un calcul précédent.
+    Modifier un paramètre de la DSU laisse ainsi valides les tableaux de la DSR et de la DF.
+    '''
+
+    def __init__(self, tax_benefit_system, populations, cache, parameter_overrides = None):
+        super(CachedSimulation, self).__init__(tax_benefit_system, populations, parameter_overrides)
+        self.cache = cache
+        self._inputs = set()
+        self._closures = {}
+        self._input_hashes = {}
+
+    def set_input(self, variable_name, period, value):
+        self._inputs.add((variable_name, str(periods.period(period))))
+        self._closures = {}
+        self._input_hashes = {}
+        super(CachedSimulation, self).set_input(variable_name, period, value)
+
+    def _calculate(self, variable_name, period):
+        variable = self.tax_benefit_system.get_variable(variable_name, check_existence = True)
+        holder = self.get_holder(variable_name)
+        if holder.get_array(period) is not None or variable.get_formula(period) is None:
+            # Donnée d'entrée, valeur déjà calculée ou valeur par défaut
+            return super(CachedSimulation, self)._calculate(variable_name, period)
+
+        # Lors d'une récursion sur les périodes, OpenFisca renvoie la valeur par défaut
+        # d'une variable déjà en cours de calcul : le cache n'est pas utilisé pour ne pas changer ce comportement.
+        closure = self._get_closure(variable_name, period)
+        calculating = {frame['name'] for frame in self.tracer.stack[:-1]}
+        key = None
+        if closure.complete and not closure.variables & calculating:
+            key = self._get_key(variable_name, period, closure)
+        if key is not None:
+            array = self.cache.get(key)
+            if array is not None:
+                holder.put_in_cache(array, period)
+                # Le conteneur rend le tableau typé de la variable (ex. `EnumArray` pour une énumération)
+                return holder.get_array(period)
+
+        array = super(CachedSimulation, self)._calculate(variable_name, period)
+        if key is None or holder.get_array(period) is None or (variable_name, period) in self.invalidated_caches:
+            # Valeur issue d'une récursion sur les périodes, qu'OpenFisca ne conserve pas non plus
+            return array
+        self.cache.put(key, array)
+        return array
+
+    def _is_input(self, variable_name, period):
+        variable = self.tax_benefit_system.get_variable(variable_name, check_existence = True)
+        return (variable_name, str(period)) in self._inputs or variable.get_formula(period) is None
+
+    def _get_closure(self, variable_name, period, path = ()):
+        '''
+        Renvoie les données d'entrée et les paramètres dont dépend `variable_name` pour `period`,
+        d'après les dépendances statiques des formules.
+
+        `path` contient les variables en cours de parcours : comme OpenFisca, une variable lue à nouveau
+        à une autre période au cours de son propre calcul vaut sa valeur par défaut.
+        '''
+        node = (variable_name, period)
+        if node in self._closures:
+            return self._closures[node]
+        formula = self.tax_benefit_system.get_variable(variable_name).get_formula(period)
+        if formula not in _formula_dependencies:
+            _formula_dependencies[formula] = get_formula_dependencies(formula)
+        dependencies, parameters = _formula_dependencies[formula]
+
+        inputs = set()
+        parameter_instants = set()
+        variables = {variable_name}
+        complete = True
+        spiral = False
+        for parameter in parameters:
+            if parameter.period_offset is None:
+                complete = False
+                continue
+            parameter_instants.add((parameter.path, str(period.offset(parameter.period_offset, 'year').start)))
+        for dependency in dependencies:
+            if dependency.period_offset is None:
+                complete = False
+                continue
+            dependency_period = period.offset(dependency.period_offset, 'year')
+            if self._is_input(dependency.variable, dependency_period):
+                inputs.add((dependency.variable, str(dependency_period)))
+                continue
+            if (path + (variable_name, )).count(dependency.variable) >= self.max_spiral_loops:
+                # SpiralError : OpenFisca renvoie la valeur par défaut
+                spiral = True
+                continue
+            closure = self._get_closure(dependency.variable, dependency_period, path + (variable_name, ))
+            inputs.update(closure.inputs)
+            parameter_instants.update(closure.parameters)
+            variables.update(closure.variables)
+            complete = complete and closure.complete
+            spiral = spiral or closure.spiral
+
+        closure = Closure(frozenset(inputs), frozenset(parameter_instants), frozenset(variables), complete, spiral)
+        if not spiral:
+            self._closures[node] = closure
+        return closure
+
+    def _get_key(self, variable_name, period, closure):
+        inputs = []
+        for input_name, input_period in sorted(closure.inputs):
+            input_hash = self._hash_input(input_name, input_period)
+            if input_hash is None:
+                return None
+            inputs.append((input_name, input_period, input_hash))
+        parameters = []
+        for path, instant in sorted(closure.parameters):
+            value = get_parameter(super(CachedSimulation, self).parameters_at(periods.instant(instant)), path)
+            if isinstance(value, (ParameterNodeAtInstant, ParameterNodeOverride)):
+                # Nœud lu en entier : son empreinte ne tiendrait pas compte des valeurs remplacées
+                return None
+            parameters.append((path, instant, hash_parameter(value)))
+        description = json.dumps([self.cache.version, variable_name, str(period), inputs, parameters])
+        return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+    def _hash_input(self, variable_name, period_key):
+        if (variable_name, period_key) in self._input_hashes:
+            return self._input_hashes[(variable_name, period_key)]
+        period = periods.period(period_key)
+        array = self.get_holder(variable_name).get_array(period)
+        if self.tax_benefit_system.get_variable(variable_name).get_formula(period) is not None:
+            # Donnée d'entrée d'une variable qui a aussi une formule
+            return None if array is None else hash_array(array)
+        if array is None:
+            array = super(CachedSimulation, self)._calculate(variable_name, period)
+        self._input_hashes[(variable_name, period_key)] = hash_array(array)
+        return self._input_hashes[(variable_name, period_key)]
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+
+'''
+Graphe statique des dépendances entre variables, extrait du code des formules.
+
+Les formules ne lisent leurs entrées qu'à travers des appels `commune('x', period)`,
+`etat('x', period)`, `etat.members('x', period)` ou `commune.etat('x', period)`,
+et des accès `parameters(period).a.b.c` : leur arbre syntaxique suffit à reconstituer le graphe.
+
+Usage :
+
+    python -m openfisca_france_dotations_locales.simulations.dependencies dotation_solidarite_rurale --upstream
+'''
+
+import argparse
+import ast
+import inspect
+import json
+import sys
+import textwrap
+from collections import namedtuple
+
+
+# Dépendance d'une formule envers une variable, à la période de la formule décalée de `period_offset` années
+# (`None` lorsque le décalage ne peut être déterminé statiquement)
+Dependency = namedtuple('Dependency', ['variable', 'period_offset'])
+
+# Lecture d'un paramètre, à l'instant de la formule décalé de `period_offset` années
+ParameterDependency = namedtuple('ParameterDependency', ['path', 'period_offset'])
+
+
+def get_period_offset(node, period_name):
+    '''
+    Renvoie le décalage en années de l'expression de période `node` : 0 pour `period`,
+    -1 pour `period.last_year`, n pour `period.offset(n, 'year')`, et `None` sinon.
+    '''
+    if isinstance(node, ast.Name) and node.id == period_name:
+        return 0
+    if isinstance(node, ast.Attribute) and node.attr in ('this_year', 'last_year'):
+        offset = get_period_offset(node.value, period_name)
+        if offset is not None:
+            return offset - 1 if node.attr == 'last_year' else offset
+        return None
+    if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr == 'offset'
+            and len(node.args) == 2
+            ):
+        offset = get_period_offset(node.func.value, period_name)
+        delta, unit = (get_constant(argument) for argument in node.args)
+        if offset is not None and isinstance(delta, int) and unit == 'year':
+            return offset + delta
+    return None
+
+
+def get_constant(node):
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = get_constant(node.operand)
+        return -value if isinstance(value, int) else None
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Num):  # Python 3.7
+        return node.n
+    if isinstance(node, ast.Str):
+        return node.s
+    return None
+
+
+class FormulaVisitor(ast.NodeVisitor):
+    '''
+    Relève les variables et paramètres lus par une formule `def formula(population, period, parameters)`.
+    '''
+
+    def __init__(self, population_name, period_name, parameters_name):
+        self.population_name = population_name
+        self.period_name = period_name
+        self.parameters_name = parameters_name
+        self.dependencies = set()
+        self.parameters = set()
+        # Noms locaux désignant un nœud de paramètres, ex. `parameters_dsr = parameters(period).dotation_solidarite_rurale`
+        self.aliases = {}
+
+    def visit_Assign(self, node):
+        self.generic_visit(node)
+        if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            parameter = self.get_parameter(node.value)
+            if parameter is not None:
+                self.aliases[node.targets[0].id] = parameter
+
+    def visit_Call(self, node):
+        if self.is_population(node.func) and node.args and isinstance(get_constant(node.args[0]), str):
+            period_offset = get_period_offset(node.args[1], self.period_name) if len(node.args) > 1 else None
+            self.dependencies.add(Dependency(get_constant(node.args[0]), period_offset))
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node):
+        parameter = self.get_parameter(node)
+        if parameter is None:
+            self.generic_visit(node)
+            return
+        self.parameters.add(parameter)
+        # Visite les arguments de `parameters(...)` sans relever les nœuds intermédiaires
+        while isinstance(node, ast.Attribute):
+            node = node.value
+        self.generic_visit(node)
+
+    def is_population(self, node):
+        # `commune`, `etat`, `etat.members`, `commune.etat`
+        while isinstance(node, ast.Attribute):
+            node = node.value
+        return isinstance(node, ast.Name) and node.id == self.population_name
+
+    def get_parameter(self, node):
+        keys = []
+        while isinstance(node, ast.Attribute):
+            keys.insert(0, node.attr)
+            node = node.value
+        if isinstance(node, ast.Name) and node.id in self.aliases:
+            path, period_offset = self.aliases[node.id]
+            return ParameterDependency('.'.join([path] + keys), period_offset)
+        if (
+                keys
+                and isinstance(node, ast.Call)
+                and isinstance(node.func, ast.Name)
+                and node.func.id == self.parameters_name
+                and node.args
+                ):
+            return ParameterDependency('.'.join(keys), get_period_offset(node.args[0], self.period_name))
+        return None
+
+
+def get_formula_dependencies(formula):
+    '''
+    Renvoie les variables (`Dependency`) et les paramètres (`ParameterDependency`) lus par `formula`.
+    '''
+    tree = ast.parse(textwrap.dedent(inspect.getsource(formula)))
+    function = tree.body[0]
+    names = [argument.arg for argument in function.args.args] + [None, None, None]
+    visitor = FormulaVisitor(*names[:3])
+    visitor.visit(function)
+    parameters = {
+        parameter
+        for parameter in visitor.parameters
+        # Un alias n'est pas lu en tant que tel : seuls comptent les chemins complets
+        if not any(other.path.startswith(parameter.path + '.') for other in visitor.parameters)
+        }
+    return visitor.dependencies, parameters
+
+
+class DependencyGraph(object):
+    '''
+    Graphe des dépendances entre les variables d'un système socio-fiscal.
+
+    `dependencies[variable]` contient les `Dependency` lues par l'ensemble des formules de la variable,
+    `parameters[variable]` les `ParameterDependency`.
+    Les variables sans formule (données d'entrée) n'ont aucune dépendance.
+    '''
+
+    def __init__(self, dependencies, parameters):
+        self.dependencies = dependencies
+        self.parameters = parameters
+        self.dependents = {variable_name: set() for variable_name in dependencies}
+        for variable_name, variable_dependencies in dependencies.items():
+            for dependency in variable_dependencies:
+                self.dependents.setdefault(dependency.variable, set()).add(variable_name)
+
+    @classmethod
+    def from_tax_benefit_system(cls, tax_benefit_system):
+        dependencies = {}
+        parameters = {}
+        for variable_name, variable in tax_benefit_system.variables.items():
+            dependencies[variable_name] = set()
+            parameters[variable_name] = set()
+            for formula in variable.formulas.values():
+                formula_dependencies, formula_parameters = get_formula_dependencies(formula)
+                dependencies[variable_name].update(formula_dependencies)
+                parameters[variable_name].update(formula_parameters)
+        return cls(dependencies, parameters)
+
+    def upstream(self, variable_names):
+        '''
+        Renvoie l'ensemble des variables dont dépendent, directement ou non, `variable_names`.
+        '''
+        return self._reach(variable_names, lambda variable_name: {
+            dependency.variable for dependency in self.dependencies.get(variable_name, ())
+            })
+
+    def downstream(self, variable_names):
+        '''
+        Renvoie l'ensemble des variables qui dépendent, directement ou non, de `variable_names`.
+        '''
+        return self._reach(variable_names, lambda variable_name: self.dependents.get(variable_name, ()))
+
+    def previous_year_state(self, variable_names):
+        '''
+        Renvoie les variables lues l'année précédente (`period.last_year`) par les formules de `variable_names`
+        ou par celles dont elles dépendent : l'état à conserver d'une année sur l'autre pour les calculer.
+        '''
+        if isinstance(variable_names, str):
+            variable_names = [variable_names]
+        return {
+            dependency.variable
+            for variable_name in self.upstream(variable_names) | set(variable_names)
+            for dependency in self.dependencies.get(variable_name, ())
+            if dependency.period_offset == -1
+            }
+
+    def parameter_readers(self, path):
+        '''
+        Renvoie les variables qui lisent le paramètre `path`, l'un de ses descendants ou l'un de ses ancêtres.
+        '''
+        return {
+            variable_name
+            for variable_name, parameters in self.parameters.items()
+            if any(
+                parameter.path == path
+                or parameter.path.startswith(path + '.')
+                or path.startswith(parameter.path + '.')
+                for parameter in parameters
+                )
+            }
+
+    def topological_order(self, variable_names = None):
+        '''
+        Renvoie les variables (par défaut, toutes) triées de sorte que chacune suive
+        celles dont elle dépend à la même période.
+
+        Les dépendances envers d'autres périodes sont ignorées : elles relient des calculs distincts.
+        '''
+        variable_names = set(self.dependencies) if variable_names is None else set(variable_names)
+        order = []
+        state = {}  # 1 : en cours de visite, 2 : visitée
+
+        def visit(variable_name):
+            stack = [(variable_name, iter(self._same_period_dependencies(variable_name, variable_names)))]
+            state[variable_name] = 1
+            while stack:
+                current, remaining = stack[-1]
+                for dependency in remaining:
+                    if state.get(dependency) == 1:
+                        raise ValueError("Dependency cycle between '{}' and '{}'".format(current, dependency))
+                    if dependency not in state:
+                        state[dependency] = 1
+                        stack.append((dependency, iter(self._same_period_dependencies(dependency, variable_names))))
+                        break
+                else:
+                    stack.pop()
+                    state[current] = 2
+                    order.append(current)
+
+        for variable_name in sorted(variable_names):
+            if variable_name not in state:
+                visit(variable_name)
+        return order
+
+    def _same_period_dependencies(self, variable_name, variable_names):
+        return sorted({
+            dependency.variable
+            for dependency in self.dependencies.get(variable_name, ())
+            if dependency.period_offset == 0 and dependency.variable in variable_names
+            })
+
+    def _reach(self, variable_names, neighbours):
+        if isinstance(variable_names, str):
+            variable_names = [variable_names]
+        reached = set()
+        pending = list(variable_names)
+        while pending:
+            for neighbour in neighbours(pending.pop()):
+                if neighbour not in reached:
+                    reached.add(neighbour)
+                    pending.append(neighbour)
+        return reached
+
+    def to_json(self):
+        return {
+            variable_name: {
+                'dependencies': sorted(
+                    [{'variable': dependency.variable, 'period_offset': dependency.period_offset}
+                        for dependency in self.dependencies[variable_name]],
+                    key = lambda item: (item['variable'], str(item['period_offset'])),
+                    ),
+                'parameters': sorted(
+                    [{'path': parameter.path, 'period_offset': parameter.period_offset}
+                        for parameter in self.parameters[variable_name]],
+                    key = lambda item: (item['path'], str(item['period_offset'])),
+                    ),
+                }
+            for variable_name in sorted(self.dependencies)
+            }
+
+
+def build_dependency_graph(tax_benefit_system = None):
+    if tax_benefit_system is None:
+        from openfisca_france_dotations_locales import CountryTaxBenefitSystem
+        tax_benefit_system = CountryTaxBenefitSystem()
+    return DependencyGraph.from_tax_benefit_system(tax_benefit_system)
+
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = "Graphe des dépendances entre les variables d'OpenFisca-France-Dotations-Locales.")
+    parser.add_argument('variables', nargs = '*', help = "variables à partir desquelles parcourir le graphe (par défaut, toutes)")
+    direction = parser.add_mutually_exclusive_group()
+    direction.add_argument('--upstream', action = 'store_true', help = "inclut les variables dont dépendent les variables demandées")
+    direction.add_argument('--downstream', action = 'store_true', help = "inclut les variables qui dépendent des variables demandées")
+    parser.add_argument('--parameter', action = 'append', default = [], help = "inclut les variables qui lisent ce paramètre")
+    parser.add_argument('--order', action = 'store_true', help = "affiche les variables dans un ordre de calcul possible")
+    parser.add_argument('--json', action = 'store_true', help = "affiche le graphe au format JSON")
+    arguments = parser.parse_args(arguments)
+
+    graph = build_dependency_graph()
+    variable_names = set(arguments.variables)
+    for path in arguments.parameter:
+        variable_names.update(graph.parameter_readers(path))
+    if arguments.upstream:
+        variable_names.update(graph.upstream(variable_names))
+    elif arguments.downstream:
+        variable_names.update(graph.downstream(variable_names))
+    if not variable_names and not arguments.parameter:
+        variable_names = set(graph.dependencies)
+    unknown_variables = variable_names - set(graph.dependencies)
+    if unknown_variables:
+        parser.error("unknown variables: {}".format(', '.join(sorted(unknown_variables))))
+
+    if arguments.order:
+        for variable_name in graph.topological_order(variable_names):
+            print(variable_name)
+    elif arguments.json:
+        graph_json = graph.to_json()
+        json.dump({variable_name: graph_json[variable_name] for variable_name in sorted(variable_names)}, sys.stdout, indent = 2, ensure_ascii = False)
+        print()
+    else:
+        graph_json = graph.to_json()
+        for variable_name in sorted(variable_names):
+            print(variable_name)
+            for dependency in graph_json[variable_name]['dependencies']:
+                print('  <- {} ({})'.format(dependency['variable'], dependency['period_offset']))
+            for parameter in graph_json[variable_name]['parameters']:
+                print('  <- parameters.{} ({})'.format(parameter['path'], parameter['period_offset']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+from openfisca_core import periods
+
+from openfisca_france_dotations_locales.simulations.base import ReformSimulation
+from openfisca_france_dotations_locales.simulations.dependencies import DependencyGraph
+
+
+class IncrementalSimulation(ReformSimulation):
+    '''
+    Simulation qui conserve ses résultats lorsque des paramètres sont modifiés,
+    et ne recalcule que les variables qui en dépendent.
+
+    Après `update_parameters({'dotation_solidarite_rurale.bourg_centre.attribution.coefficient_zrr': 2})`,
+    seules `dsr_score_attribution_fraction_bourg_centre` et les variables calculées à partir d'elle
+    (jusqu'à `dotation_solidarite_rurale`) sont recalculées ; la DSU et la DF restent en cache.
+
+    Les dépendances sont celles du graphe statique `dependency_graph`, construit à partir
+    du système socio-fiscal s'il n'est pas fourni.
+    '''
+
+    def __init__(self, tax_benefit_system, populations, parameter_overrides = None, dependency_graph = None):
+        super(IncrementalSimulation, self).__init__(tax_benefit_system, populations, parameter_overrides)
+        if dependency_graph is None:
+            dependency_graph = DependencyGraph.from_tax_benefit_system(tax_benefit_system)
+        self.dependency_graph = dependency_graph
+        self._input_periods = {}
+
+    def set_input(self, variable_name, period, value):
+        super(IncrementalSimulation, self).set_input(variable_name, period, value)
+        self._input_periods.setdefault(variable_name, set()).add(periods.period(period))
+
+    def update_parameters(self, parameter_overrides):
+        '''
+        Remplace les paramètres de `parameter_overrides` ({chemin: valeur})
+        et retire du cache les valeurs calculées qui en dépendent.
+        Les données d'entrée sont conservées.
+
+        Renvoie l'ensemble des variables invalidées.
+        '''
+        readers = set()
+        for path in parameter_overrides:
+            readers.update(self.dependency_graph.parameter_readers(path))
+        invalidated = readers | self.dependency_graph.downstream(readers)
+
+        self.parameter_overrides.update(parameter_overrides)
+        for variable_name in invalidated:
+            holder = self.get_holder(variable_name)
+            input_periods = self._input_periods.get(variable_name, ())
+            for period in holder.get_known_periods():
+                if period not in input_periods:
+                    holder.delete_arrays(period)
+        return invalidated
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+'''
+Libération des résultats intermédiaires d'une simulation dès qu'ils ne sont plus lus.
+
+Une simulation OpenFisca garde en cache chaque variable calculée, pour chaque période,
+jusqu'à sa destruction : scores, rangs, parts de la DSR, chaînes d'années précédentes…
+Lorsque l'appelant déclare les variables qu'il demande (`outputs`), le plan de calcul est déduit
+des dépendances des formules, et chaque résultat intermédiaire est retiré du cache
+après le calcul de la dernière variable qui le lit :
+
+    simulation = build_simulation(tax_benefit_system, inputs, '2020', simulation_class = ReformSimulation, outputs = ['dotation_solidarite_rurale'])
+
+Les données d'entrée, les variables demandées et les variables définies pour l'éternité ne sont jamais libérées.
+Demander directement un résultat libéré (`simulation.calculate`) lève une `ValueError` : il faut l'ajouter à `outputs`.
+Une formule qui le lit à nouveau, par exemple pour une autre variable demandée, le recalcule.
+
+Le suivi repose sur la surcharge de `Simulation._calculate` par `ReformSimulation` (cf. `base`),
+une méthode interne d'OpenFisca-Core : il ne s'applique qu'aux versions d'OpenFisca-Core prévues par `setup.py`.
+'''
+
+from collections import Counter
+
+from openfisca_core.periods import ETERNITY
+
+from openfisca_france_dotations_locales.simulations.dependencies import get_formula_dependencies
+
+
+# Dépendances de chaque formule dont la période est connue, extraites une fois pour toutes les simulations
+_formula_dependencies = {}
+
+
+class LivenessTracker(object):
+    '''
+    Compte, pour chaque couple (variable, période) du plan de calcul, les formules restant à calculer qui le lisent.
+    '''
+
+    def __init__(self, simulation, outputs):
+        self.simulation = simulation
+        self.outputs = set(outputs)
+        # Couples (variable, période) demandés directement : jamais libérés
+        self.roots = set()
+        # Couples dont la formule reste à calculer
+        self.planned = set()
+        # Couples calculés par une formule, seuls candidats à la libération
+        self.computed = set()
+        # Couples retirés du cache
+        self.released = set()
+        self.readers = Counter()
+
+    def plan(self, variable_name, period):
+        '''
+        Ajoute au plan le calcul de `variable_name` et des variables demandées pour `period`.
+        '''
+        self.roots.add((variable_name, period))
+        pending = [((variable_name, period), ())] + [((output, period), ()) for output in sorted(self.outputs)]
+        while pending:
+            node, path = pending.pop()
+            if node in self.planned or self.is_known(node):
+                continue
+            self.planned.add(node)
+            path = path + (node[0], )
+            for dependency in self.get_dependencies(node):
+                # Au-delà de `max_spiral_loops` années d'une même variable, OpenFisca renvoie la valeur par défaut
+                if path.count(dependency[0]) > self.simulation.max_spiral_loops:
+                    continue
+                self.readers[dependency] += 1
+                pending.append((dependency, path))
+
+    def consume(self, variable_name, period):
+        '''
+        Enregistre le calcul de `variable_name` pour `period`, et libère les variables qu'il était le dernier à lire.
+        '''
+        node = (variable_name, period)
+        self.computed.add(node)
+        self.released.discard(node)
+        # Un calcul hors du plan (ex. après une définition circulaire) ne décompte pas ses lectures
+        if node not in self.planned:
+            return
+        self.planned.discard(node)
+        for dependency in self.get_dependencies(node):
+            if self.readers[dependency] <= 0:
+                continue
+            self.readers[dependency] -= 1
+            if self.readers[dependency] == 0:
+                del self.readers[dependency]
+                self.release(dependency)
+
+    def release(self, node):
+        variable_name, period = node
+        if node not in self.computed or node in self.roots or variable_name in self.outputs:
+            return
+        self.computed.discard(node)
+        self.released.add(node)
+        self.simulation.get_holder(variable_name).delete_arrays(period)
+
+    def is_released(self, node):
+        return node in self.released and not self.is_known(node)
+
+    def is_known(self, node):
+        variable_name, period = node
+        return self.simulation.get_holder(variable_name).get_array(period) is not None
+
+    def get_dependencies(self, node):
+        '''
+        Renvoie les couples (variable, période) lus par la formule de `node`, lorsque leur période est connue.
+        '''
+        variable_name, period = node
+        variable = self.simulation.tax_benefit_system.get_variable(variable_name, check_existence = True)
+        if variable.definition_period == ETERNITY:
+            return []
+        formula = variable.get_formula(period)
+        if formula is None:
+            return []
+        if formula not in _formula_dependencies:
+            dependencies, _ = get_formula_dependencies(formula)
+            _formula_dependencies[formula] = sorted(
+                (dependency.variable, dependency.period_offset)
+                for dependency in dependencies
+                if dependency.period_offset is not None
+                )
+        tax_benefit_system = self.simulation.tax_benefit_system
+        return [
+            (dependency_name, period.offset(period_offset, 'year'))
+            for dependency_name, period_offset in _formula_dependencies[formula]
+            if tax_benefit_system.get_variable(dependency_name).definition_period != ETERNITY
+            ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+
+class ParameterNodeOverride(object):
+    '''
+    Nœud de paramètres à un instant donné dont certaines feuilles sont remplacées.
+
+    `overrides` associe un chemin complet de paramètre
+    (ex. `dotation_solidarite_rurale.augmentation_montant`) à la valeur à utiliser
+    en lieu et place de celle de la législation, quel que soit l'instant.
+    Les nœuds qui ne contiennent aucune valeur remplacée sont renvoyés tels quels.
+    '''
+
+    def __init__(self, node, overrides, path = None):
+        self._node = node
+        self._overrides = overrides
+        self._path = path
+
+    def __getattr__(self, key):
+        path = key if self._path is None else '.'.join((self._path, key))
+        if path in self._overrides:
+            return self._overrides[path]
+        child = getattr(self._node, key)
+        prefix = path + '.'
+        if any(overridden_path.startswith(prefix) for overridden_path in self._overrides):
+            return ParameterNodeOverride(child, self._overrides, path)
+        return child
+
+    def __getitem__(self, key):
+        return self.__getattr__(key)
+
+    def __repr__(self):
+        return repr(self._node)
+
+
+def get_parameter(node, path):
+    '''
+    Renvoie la valeur du paramètre de chemin `path` (ex. `population.plafond_dgf`) dans `node`.
+    '''
+    for key in path.split('.'):
+        node = getattr(node, key)
+    return node
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+'''
+Précision de stockage des variables d'une simulation.
+
+OpenFisca stocke déjà les variables dans des types compacts : booléens en `bool`,
+entiers (populations, nombres de logements…) en `int32` et réels (scores, rapports, montants) en `float32`.
+Ces types sont ceux d'une simulation sans profil. Un profil de précision les élargit, par type de valeur (`float`, `int`)
+ou par nom de variable :
+
+    simulation = build_simulation(tax_benefit_system, inputs, '2020', simulation_class = ReformSimulation, dtypes = MONTANTS_DOUBLE)
+
+`benchmark.run_precision_report` mesure l'écart, en euros, entre un profil et un calcul de référence entièrement sur 64 bits.
+'''
+
+import copy
+
+import numpy as np
+
+
+# Calcul de référence : réels et entiers sur 64 bits
+DOUBLE = {float: np.float64, int: np.int64}
+
+# Montants finaux des dotations, en euros
+MONTANTS = [
+    'dotation_forfaitaire',
+    'dsr_fraction_bourg_centre',
+    'dsr_fraction_perequation',
+    'dsr_fraction_cible',
+    'dotation_solidarite_rurale',
+    'dsu_montant',
+    ]
+
+# Types compacts, sauf pour les montants finaux
+MONTANTS_DOUBLE = {variable_name: np.float64 for variable_name in MONTANTS}
+
+
+def get_dtype(variable, dtypes):
+    return np.dtype(dtypes.get(variable.name, dtypes.get(variable.value_type, variable.dtype)))
+
+
+def retype_variable(variable, dtypes):
+    '''
+    Renvoie `variable`, ou une copie de `variable` stockée dans le type que lui attribue `dtypes`.
+    '''
+    dtype = get_dtype(variable, dtypes)
+    if dtype == variable.dtype:
+        return variable
+    variable = copy.copy(variable)
+    variable.dtype = dtype
+    return variable
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+'''
+Projection pluriannuelle des dotations, année après année.
+
+Les montants totaux et les montants de l'année précédente (`period.last_year`) sont chaînés d'une année sur l'autre.
+Calculer directement une année lointaine remonte toutes les années antérieures et les garde en mémoire ;
+la projection calcule au contraire les années dans l'ordre, ne conserve que l'année N-1 dont l'année N a besoin,
+et renvoie les résultats au fil de l'eau.
+'''
+
+from openfisca_core import periods
+from openfisca_core.periods import ETERNITY
+
+from openfisca_france_dotations_locales.simulations.dependencies import DependencyGraph, get_formula_dependencies
+
+
+VARIABLES = [
+    'dotation_forfaitaire',
+    'dotation_solidarite_rurale',
+    'dsu_montant',
+    ]
+
+
+def carry_inputs_forward(simulation, annee):
+    '''
+    Reconduit en `annee` les variables d'entrée connues l'année précédente et non renseignées pour `annee`
+    (projection à données constantes).
+    '''
+    annee_precedente = periods.period(annee).last_year
+    for variable_name, variable in simulation.tax_benefit_system.variables.items():
+        if variable.formulas or variable.definition_period == ETERNITY:
+            continue
+        holder = simulation.get_holder(variable_name)
+        if holder.get_array(annee) is None:
+            array = holder.get_array(annee_precedente)
+            if array is not None:
+                simulation.set_input(variable_name, annee, array)
+
+
+def calculate_history(simulation, variable_name, period, visiting = None):
+    '''
+    Calcule `variable_name` pour `period` si sa valeur ne dépend que de données connues
+    ou de montants constants (ex. `dsu_montant_total` : montant inscrit pour 2019, puis chaîné chaque année),
+    en partant des années les plus anciennes. Renvoie `False` si une donnée manque.
+
+    OpenFisca ne remonte qu'une année d'une même variable (garde contre les définitions circulaires) :
+    sans ce calcul préalable, un montant chaîné sur plusieurs années vaudrait sa valeur par défaut.
+    '''
+    period = periods.period(period)
+    if simulation.get_holder(variable_name).get_array(period) is not None:
+        return True
+    formula = simulation.tax_benefit_system.get_variable(variable_name).get_formula(period)
+    visiting = set() if visiting is None else visiting
+    if formula is None or (variable_name, period) in visiting:
+        return False
+    visiting.add((variable_name, period))
+    dependencies, _ = get_formula_dependencies(formula)
+    for dependency in dependencies:
+        if dependency.period_offset is None or not calculate_history(
+                simulation, dependency.variable, period.offset(dependency.period_offset, 'year'), visiting,
+                ):
+            return False
+    simulation.calculate(variable_name, period)
+    return True
+
+
+def forget_years_before(simulation, annee):
+    debut = periods.period(annee).start
+    for variable_name, variable in simulation.tax_benefit_system.variables.items():
+        if variable.definition_period == ETERNITY:
+            continue
+        holder = simulation.get_holder(variable_name)
+        for period in holder.get_known_periods():
+            if period.start < debut:
+                holder.delete_arrays(period)
+
+
+def project(simulation, premiere_annee, derniere_annee, variables = VARIABLES, dependency_graph = None):
+    '''
+    Calcule `variables` pour chaque année de `premiere_annee` à `derniere_annee` incluses
+    et produit, année par année, des couples (année, {variable: tableau}).
+
+    `simulation` contient les données d'entrée de `premiere_annee` (cf. `build_simulation`),
+    et éventuellement celles des années suivantes ; à défaut, les données de l'année précédente sont reconduites.
+    Dès qu'une année est produite, seules ses valeurs restent en mémoire, pour le calcul de l'année suivante.
+    '''
+    if dependency_graph is None:
+        dependency_graph = DependencyGraph.from_tax_benefit_system(simulation.tax_benefit_system)
+    # Variables lues en `period.last_year` (ex. historique de la garantie pluriannuelle de la DSU) :
+    # elles sont calculées chaque année, même si aucun résultat de l'année ne les utilise.
+    etat = sorted(dependency_graph.previous_year_state(variables) - set(variables))
+    # Avec `outputs` (cf. `liveness`), elles sont conservées comme les variables demandées
+    if getattr(simulation, 'liveness', None) is not None:
+        simulation.liveness.outputs.update(etat)
+    for variable_name in sorted(dependency_graph.previous_year_state(variables)):
+        calculate_history(simulation, variable_name, periods.period(str(premiere_annee)).last_year)
+
+    for annee in range(int(premiere_annee), int(derniere_annee) + 1):
+        annee = str(annee)
+        if annee != str(premiere_annee):
+            carry_inputs_forward(simulation, annee)
+        resultats = {
+            variable_name: simulation.calculate(variable_name, annee)
+            for variable_name in variables
+            }
+        for variable_name in etat:
+            simulation.calculate(variable_name, annee)
+        forget_years_before(simulation, annee)
+        yield annee, resultats
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from openfisca_france_dotations_locales.simulations.base import cast_inputs
+
+
+class SharedInputs(object):
+    '''
+    Données d'entrée communales partagées entre processus sans copie.
+
+    Chaque colonne est écrite une seule fois dans un fichier `.npy`, au type de sa variable.
+    Les processus projettent ensuite ces fichiers en mémoire (`mmap`) en lecture seule :
+    les pages sont partagées par le système d'exploitation, et les tableaux obtenus
+    servent directement de valeurs d'entrée aux simulations.
+
+    Un objet `SharedInputs` ne contient que des chemins : il se transmet à bas coût
+    aux processus (par exemple à `run_sweep`).
+    '''
+
+    def __init__(self, directory, index, owner = False):
+        self.directory = directory
+        self.index = index
+        self.owner = owner
+
+    @classmethod
+    def create(cls, tax_benefit_system, inputs, directory = None):
+        '''
+        Écrit les données d'entrée `inputs` (cf. `build_simulation`) dans `directory`,
+        ou dans un répertoire temporaire supprimé par `close`.
+        '''
+        owner = directory is None
+        if owner:
+            directory = tempfile.mkdtemp(prefix = 'openfisca-dotations-locales-')
+        index = {}
+        for variable_name, values in cast_inputs(tax_benefit_system, inputs).items():
+            values = values if isinstance(values, dict) else {None: values}
+            index[variable_name] = {}
+            for position, (input_period, array) in enumerate(values.items()):
+                file_name = '{}_{}.npy'.format(variable_name, position)
+                np.save(os.path.join(directory, file_name), array)
+                index[variable_name][input_period] = file_name
+        return cls(directory, index, owner)
+
+    def load(self):
+        '''
+        Renvoie les données d'entrée projetées en mémoire, au format de `build_simulation`.
+        '''
+        def open_memmap(file_name):
+            return np.load(os.path.join(self.directory, file_name), mmap_mode = 'r')
+
+        return {
+            variable_name: (
+                open_memmap(files[None])
+                if None in files
+                else {input_period: open_memmap(file_name) for input_period, file_name in files.items()}
+                )
+            for variable_name, files in self.index.items()
+            }
+
+    def close(self):
+        if self.owner and os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        # Seul le processus qui a créé les fichiers les supprime
+        state = self.__dict__.copy()
+        state['owner'] = False
+        return state
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+'''
+Stockage des grands tableaux d'une simulation dans des fichiers `.npy` projetés en mémoire.
+
+Une simulation par lots produit des tableaux (communes, variantes) — indices synthétiques, scores, rangs —
+qui peuvent dépasser la mémoire disponible. Au-delà d'un seuil de taille, un tableau est écrit
+dans un répertoire de travail et relu par projection en mémoire (`np.load(..., mmap_mode = 'r')`) :
+le système ne charge que les pages lues, et peut les libérer à tout moment.
+Les formules lisent ces tableaux comme les autres, avec `commune('x', period)`.
+
+    simulation = build_batch_simulation(tax_benefit_system, inputs, '2020', variants, spill_threshold = 64 * 2 ** 20)
+    ...
+    simulation.close()  # supprime le répertoire de travail
+
+Les tableaux lus depuis le disque ne sont pas modifiables.
+'''
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from openfisca_core import periods
+from openfisca_core.data_storage import InMemoryStorage
+from openfisca_core.indexed_enums import EnumArray
+from openfisca_core.periods import ETERNITY
+
+
+def get_threshold(variable, thresholds):
+    '''
+    Renvoie le seuil, en octets, au-delà duquel les tableaux de `variable` sont écrits sur disque, ou `None`.
+
+    `thresholds` est un nombre d'octets commun à toutes les variables,
+    ou un dictionnaire {nom de variable: octets}, dont la clef `None` donne le seuil par défaut.
+    '''
+    if not isinstance(thresholds, dict):
+        return thresholds
+    return thresholds.get(variable.name, thresholds.get(None))
+
+
+class SpillStorage(InMemoryStorage):
+    '''
+    Stockage des valeurs d'une variable : en mémoire, ou dans `directory` pour les tableaux d'au moins `threshold` octets.
+    '''
+
+    def __init__(self, directory, threshold, is_eternal = False):
+        super(SpillStorage, self).__init__(is_eternal = is_eternal)
+        self.directory = directory
+        self.threshold = threshold
+        self._files = {}
+        self._enums = {}
+
+    def get(self, period):
+        value = super(SpillStorage, self).get(period)
+        if value is not None:
+            return value
+        path = self._files.get(self._period(period))
+        if path is None:
+            return None
+        array = np.load(path, mmap_mode = 'r')
+        enum = self._enums.get(path)
+        return EnumArray(array, enum) if enum is not None else array
+
+    def put(self, value, period):
+        period = self._period(period)
+        self._delete_files(period)
+        # Un tableau diffusé (ex. une valeur nationale par variante) n'occupe qu'une ligne en mémoire
+        if value.nbytes < self.threshold or 0 in value.strides:
+            super(SpillStorage, self).put(value, period)
+            return
+        super(SpillStorage, self).delete(period)
+        os.makedirs(self.directory, exist_ok = True)
+        path = os.path.join(self.directory, str(period).replace(':', '_') + '.npy')
+        if isinstance(value, EnumArray):
+            self._enums[path] = value.possible_values
+            value = value.view(np.ndarray)
+        np.save(path, value)
+        self._files[period] = path
+
+    def delete(self, period = None):
+        super(SpillStorage, self).delete(period)
+        self._delete_files(None if period is None else self._period(period))
+
+    def get_known_periods(self):
+        return list(super(SpillStorage, self).get_known_periods()) + list(self._files)
+
+    def delete_spilled(self):
+        self._delete_files(None)
+
+    def get_spilled_bytes(self):
+        return sum(os.path.getsize(path) for path in self._files.values())
+
+    def _delete_files(self, period):
+        for period_item in list(self._files):
+            if period is None or period.contains(period_item):
+                path = self._files.pop(period_item)
+                self._enums.pop(path, None)
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Fichier encore projeté en mémoire sous Windows : il sera supprimé avec le répertoire de travail
+                    pass
+
+    def _period(self, period):
+        return periods.period(ETERNITY) if self.is_eternal else periods.period(period)
+
+
+def create_spill_directory(directory = None):
+    return tempfile.mkdtemp(prefix = 'openfisca_dotations_', dir = directory)
+
+
+def remove_spill_directory(directory):
+    shutil.rmtree(directory, ignore_errors = True)
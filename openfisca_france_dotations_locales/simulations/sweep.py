@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+from openfisca_france_dotations_locales.simulations.base import ReformSimulation, build_simulation, cast_inputs
+from openfisca_france_dotations_locales.simulations.shared_inputs import SharedInputs
+
+
+# État de chaque processus de calcul, initialisé une seule fois par `_initialize_worker`
+_tax_benefit_system = None
+_inputs = None
+
+
+def _initialize_worker(inputs):
+    global _tax_benefit_system, _inputs
+    from openfisca_france_dotations_locales import CountryTaxBenefitSystem
+
+    _tax_benefit_system = CountryTaxBenefitSystem()
+    if isinstance(inputs, SharedInputs):
+        _inputs = inputs.load()
+    else:
+        _inputs = cast_inputs(_tax_benefit_system, inputs)
+
+
+def _run_variant(period, parameter_overrides, outputs):
+    simulation = build_simulation(
+        _tax_benefit_system, _inputs, period,
+        simulation_class = ReformSimulation,
+        parameter_overrides = parameter_overrides,
+        )
+    return [simulation.calculate(output, period) for output in outputs]
+
+
+def run_sweep(inputs, period, variants, outputs, max_workers = None, chunksize = 1):
+    '''
+    Calcule `outputs` pour chacune des variantes de paramètres de `variants`,
+    réparties entre plusieurs processus.
+
+    `variants` est une liste de dictionnaires {chemin de paramètre: valeur}.
+    Chaque processus construit le système socio-fiscal et reçoit les données
+    d'entrée des communes une seule fois, puis les réutilise pour toutes ses variantes.
+    Avec des `inputs` de type `SharedInputs`, les processus partagent une même copie
+    des données au lieu d'en recevoir chacun une.
+
+    Renvoie un dictionnaire {variable: tableau (nombre de variantes, nombre de communes)}.
+    '''
+    outputs = list(outputs)
+    with ProcessPoolExecutor(max_workers = max_workers, initializer = _initialize_worker, initargs = (inputs,)) as executor:
+        results = list(executor.map(_run_variant, repeat(period), variants, repeat(outputs), chunksize = chunksize))
+    return {
+        output: np.stack([result[index] for result in results]) if results else np.empty((0, 0))
+        for index, output in enumerate(outputs)
+        }
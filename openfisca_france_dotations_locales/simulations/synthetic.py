@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+'''
+Générateur de communes synthétiques, pour mesurer les performances au-delà des 35 000 communes françaises.
+
+Les communes sont réparties en départements, arrondissements, cantons et agglomérations ;
+les attributs qui en dépendent (chefs-lieux, population de l'agglomération, part de la population du canton…)
+sont calculés à partir de ce découpage, pour que les règles d'éligibilité se déclenchent
+dans des proportions proches de la réalité.
+'''
+
+import numpy as np
+
+from openfisca_france_dotations_locales.simulations.base import cast_inputs
+from openfisca_france_dotations_locales.variables.base import group_sum
+
+
+# Ordres de grandeur français, utilisés quel que soit le nombre de communes générées
+NOMBRE_DEPARTEMENTS = 101
+COMMUNES_PAR_CANTON = 17
+COMMUNES_PAR_ARRONDISSEMENT = 105
+COMMUNES_PAR_AGGLOMERATION = 15
+PART_OUTRE_MER = 0.0037
+PART_COMMUNES_AGGLOMERATION = 0.45
+
+# Nombres de communes pour des tests de montée en charge
+NOMBRE_COMMUNES_NATIONAL = 35056
+NOMBRE_COMMUNES_X10 = 10 * NOMBRE_COMMUNES_NATIONAL
+NOMBRE_COMMUNES_X100 = 100 * NOMBRE_COMMUNES_NATIONAL
+
+
+def group_maximum(groups, values):
+    maximum = np.zeros(groups.max() + 1, dtype = values.dtype)
+    np.maximum.at(maximum, groups, values)
+    return maximum[groups]
+
+
+def group_leader(groups, values):
+    '''
+    Renvoie un masque désignant, dans chaque groupe, l'élément de plus grande valeur.
+    '''
+    order = np.lexsort((values, groups))
+    last = np.ones(len(order), dtype = bool)
+    last[:-1] = groups[order][1:] != groups[order][:-1]
+    leader = np.zeros(len(groups), dtype = bool)
+    leader[order[last]] = True
+    return leader
+
+
+def subgroups(aleatoire, groups, nombre_groupes, taille_moyenne, nombre_communes):
+    # Subdivise chaque groupe en sous-groupes, d'environ `taille_moyenne` communes
+    par_groupe = max(1, int(round(nombre_communes / taille_moyenne / nombre_groupes)))
+    return groups * par_groupe + aleatoire.randint(par_groupe, size = nombre_communes)
+
+
+def generate_communes(nombre_communes, period, seed = 0, tax_benefit_system = None):
+    '''
+    Génère les données d'entrée de `nombre_communes` communes pour `period`,
+    ainsi que les montants perçus l'année précédente, au format de `build_simulation`.
+
+    Le résultat ne dépend que de `nombre_communes`, `period` et `seed`.
+    Avec `tax_benefit_system`, les tableaux sont convertis au type de leur variable.
+    '''
+    aleatoire = np.random.RandomState(seed)
+    annee_precedente = str(int(period) - 1)
+
+    def uniform(low = 0, high = 1):
+        return aleatoire.uniform(low, high, nombre_communes)
+
+    # Découpage territorial
+    outre_mer = uniform() < PART_OUTRE_MER
+    nombre_departements_outre_mer = 5
+    departement = np.where(
+        outre_mer,
+        NOMBRE_DEPARTEMENTS - nombre_departements_outre_mer + aleatoire.randint(nombre_departements_outre_mer, size = nombre_communes),
+        aleatoire.randint(NOMBRE_DEPARTEMENTS - nombre_departements_outre_mer, size = nombre_communes),
+        )
+    arrondissement = subgroups(aleatoire, departement, NOMBRE_DEPARTEMENTS, COMMUNES_PAR_ARRONDISSEMENT, nombre_communes)
+    canton = subgroups(aleatoire, arrondissement, arrondissement.max() + 1, COMMUNES_PAR_CANTON, nombre_communes)
+    dans_agglomeration = uniform() < PART_COMMUNES_AGGLOMERATION
+    agglomeration = np.where(
+        dans_agglomeration,
+        subgroups(aleatoire, departement, NOMBRE_DEPARTEMENTS, COMMUNES_PAR_AGGLOMERATION / PART_COMMUNES_AGGLOMERATION, nombre_communes),
+        0,
+        )
+    # Une commune hors agglomération forme sa propre agglomération
+    agglomeration = np.where(dans_agglomeration, agglomeration, agglomeration.max() + 1 + np.arange(nombre_communes))
+
+    # Population : log-normale, plus élevée dans les agglomérations (médiane d'environ 450 habitants)
+    population_dgf = np.maximum(1, aleatoire.lognormal(6.0, 1.3, nombre_communes) * np.where(dans_agglomeration, 1.8, 1)).astype(np.int64)
+    population_insee = (population_dgf * uniform(0.85, 1)).astype(np.int64)
+    logements = (population_dgf * uniform(0.45, 0.6)).astype(np.int64)
+    grande_commune = population_dgf >= 5000
+
+    chef_lieu_de_canton = group_leader(canton, population_dgf)
+    chef_lieu_departement = group_leader(departement, population_dgf)
+    agglomerations_chef_lieu_departement = np.zeros(agglomeration.max() + 1, dtype = bool)
+    agglomerations_chef_lieu_departement[agglomeration[chef_lieu_departement]] = True
+    population_canton = group_sum(canton, population_dgf)[canton]
+
+    potentiel_financier = population_dgf * 850 * aleatoire.lognormal(0, 0.35, nombre_communes) * (1 + 0.08 * np.log10(population_dgf))
+    superficie = aleatoire.lognormal(np.log(1100), 0.8, nombre_communes)
+    population_qpv = (grande_commune * (uniform() < 0.3) * population_insee * uniform(0, 0.3)).astype(np.int64)
+    petite_commune = population_dgf < 10000
+    dsu_montant_eligible = grande_commune * (uniform() < 0.6) * population_dgf * uniform(20, 80)
+    # Quelques communes ont perdu leur éligibilité à la DSU au cours des années précédentes
+    ancienne_eligible_dsu = (dsu_montant_eligible == 0) & (uniform() < 0.01)
+
+    inputs = {
+        'outre_mer': outre_mer,
+        'insulaire': uniform() < 0.002,
+        'zone_de_montagne': uniform() < 0.18,
+        'zrr': (uniform() < 0.4) & petite_commune,
+        'population_dgf': population_dgf,
+        'population_insee': population_insee,
+        'population_dgf_majoree': {
+            annee_precedente: population_dgf * uniform(1, 1.05),
+            period: population_dgf * uniform(1, 1.05),
+            },
+        'population_enfants': (population_insee * uniform(0.12, 0.2)).astype(np.int64),
+        'population_qpv': population_qpv,
+        'population_zfu': ((uniform() < 0.1) * population_qpv * uniform(0, 0.5)).astype(np.int64),
+        'chef_lieu_de_canton': chef_lieu_de_canton,
+        'bureau_centralisateur': chef_lieu_de_canton & (uniform() < 0.5),
+        'chef_lieu_arrondissement': group_leader(arrondissement, population_dgf),
+        'part_population_canton': population_dgf / population_canton,
+        'population_dgf_chef_lieu_de_canton': group_maximum(canton, population_dgf),
+        'population_dgf_agglomeration': group_sum(agglomeration, population_dgf)[agglomeration].astype(np.int64),
+        'population_dgf_maximum_commune_agglomeration': group_maximum(agglomeration, population_dgf),
+        'population_dgf_departement_agglomeration': group_sum(departement, population_dgf)[departement].astype(np.int64),
+        'chef_lieu_departement_dans_agglomeration': agglomerations_chef_lieu_departement[agglomeration],
+        'potentiel_financier': potentiel_financier,
+        'potentiel_fiscal': (potentiel_financier * uniform(0.8, 0.9)).astype(np.int64),
+        'revenu_total': population_insee * 14000 * aleatoire.lognormal(0, 0.25, nombre_communes),
+        'recettes_reelles_fonctionnement': population_dgf * 900 * aleatoire.lognormal(0, 0.3, nombre_communes),
+        'effort_fiscal': aleatoire.lognormal(0, 0.2, nombre_communes),
+        'superficie': superficie,
+        'longueur_voirie': (superficie * uniform(5, 15)).astype(np.int64),
+        'nombre_logements': logements,
+        'nombre_logements_sociaux': (logements * aleatoire.beta(0.8, 8, nombre_communes)).astype(np.int64),
+        'nombre_beneficiaires_aides_au_logement': (logements * aleatoire.beta(1.5, 10, nombre_communes)).astype(np.int64),
+        'dsr_garantie_commune_nouvelle_fraction_bourg_centre': (uniform() < 0.02) * population_dgf * uniform(10, 40),
+        'dsr_garantie_commune_nouvelle_fraction_perequation': (uniform() < 0.02) * population_dgf * uniform(5, 20),
+        'dsr_garantie_commune_nouvelle_fraction_cible': (uniform() < 0.02) * population_dgf * uniform(10, 30),
+        # Montants perçus l'année précédente
+        'dotation_forfaitaire': {annee_precedente: population_dgf * uniform(100, 200)},
+        'dsr_montant_eligible_fraction_bourg_centre': {annee_precedente: (chef_lieu_de_canton & petite_commune) * population_dgf * uniform(20, 60)},
+        'dsr_montant_eligible_fraction_perequation': {annee_precedente: petite_commune * population_dgf * uniform(10, 30)},
+        'dsr_montant_hors_garanties_fraction_cible': {annee_precedente: (uniform() < 0.3) * petite_commune * population_dgf * uniform(20, 40)},
+        'dsu_montant_eligible': {annee_precedente: dsu_montant_eligible},
+        'dsu_montant_derniere_annee_eligible': {annee_precedente: np.where(ancienne_eligible_dsu, population_dgf * uniform(20, 80), dsu_montant_eligible)},
+        'dsu_nombre_annees_depuis_eligibilite': {annee_precedente: np.where(ancienne_eligible_dsu, aleatoire.randint(1, 10, nombre_communes), 0)},
+        }
+    # Montant national, proportionnel au nombre de communes
+    inputs['df_montant_total_ecretement_hors_dsu_dsr'] = np.array([int(0.01 * inputs['dotation_forfaitaire'][annee_precedente].sum())])
+
+    if tax_benefit_system is not None:
+        inputs = cast_inputs(tax_benefit_system, inputs)
+    return inputs
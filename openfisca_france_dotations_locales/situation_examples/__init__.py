@@ -6,6 +6,11 @@ import os
 
 DIR_PATH = os.path.dirname(os.path.abspath(__file__))
 
+# Situations d'exemple, lues à leur premier accès (ex. `situation_examples.communes_dsr`)
+EXAMPLES = {
+    'communes_dsr': 'communes_dsr.json',
+    }
+
 
 def parse(file_name):
     file_path = os.path.join(DIR_PATH, file_name)
@@ -13,4 +18,9 @@ def parse(file_name):
         return json.loads(file.read())
 
 
-communes_dsr = parse('communes_dsr.json')
+def __getattr__(name):
+    if name not in EXAMPLES:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    example = parse(EXAMPLES[name])
+    globals()[name] = example
+    return example
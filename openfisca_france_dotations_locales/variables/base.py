@@ -1,6 +1,209 @@
 import numpy as np
 
+from openfisca_core.indexed_enums import Enum
+
 
 def safe_divide(a, b, value_if_error=0):
     with np.errstate(divide='ignore', invalid='ignore'):
         return np.where(b != 0, np.divide(a, b), value_if_error)
+
+
+# Agrégations par groupe (ex. par strate démographique), en un seul parcours des communes.
+# `groups` contient le numéro de groupe (entier positif) de chaque commune, `where` exclut des communes.
+# Pour des tableaux (communes, variantes), le résultat est un tableau (groupes, variantes),
+# que `np.take_along_axis(resultat, groups, axis = 0)` redistribue aux communes.
+
+def group_sum(groups, values, where = None, size = None):
+    if where is not None:
+        values = values * where
+    groups, values = np.broadcast_arrays(groups, values)
+    if size is None:
+        size = int(groups.max()) + 1 if groups.size else 0
+    if values.ndim == 1:
+        return np.bincount(groups, weights = values, minlength = size)
+    columns = values.shape[1]
+    index = groups * columns + np.arange(columns)
+    return np.bincount(index.ravel(), weights = values.ravel(), minlength = size * columns).reshape(size, columns)
+
+
+def group_count(groups, where = None, size = None):
+    return group_sum(groups, np.ones(1) if where is None else where, size = size)
+
+
+def group_ratio(groups, numerators, denominators, where = None, size = None):
+    # Rapport des sommes par groupe (ex. potentiel financier par habitant de la strate), 0 si le dénominateur est nul
+    if size is None:
+        size = int(groups.max()) + 1 if groups.size else 0
+    return safe_divide(group_sum(groups, numerators, where, size), group_sum(groups, denominators, where, size))
+
+
+def group_weighted_mean(groups, values, weights, where = None, size = None):
+    return group_ratio(groups, values * weights, weights, where, size)
+
+
+# Sommes de plusieurs colonnes sur plusieurs sous-ensembles de communes (ex. seuil bas et seuil haut de la DSU).
+# Les communes de chaque masque sont extraites une fois pour toutes les colonnes : seules ces communes sont lues,
+# sans tableau intermédiaire de la taille de la France par couple (masque, colonne).
+# Le résultat est un tableau (masques, colonnes), avec une dernière dimension par variante
+# pour des tableaux (communes, variantes).
+
+def masked_sums(masks, columns):
+    columns = [np.asarray(column) for column in columns]
+    sums = []
+    for mask in masks:
+        mask = np.asarray(mask)
+        if mask.ndim == 1 or mask.shape[1] == 1:
+            index = np.flatnonzero(mask)
+            sums.extend(np.sum(column[index], axis = 0) for column in columns)
+        else:
+            # Masque différent selon la variante
+            sums.extend(np.sum(mask * column, axis = 0) for column in columns)
+    sums = np.array(np.broadcast_arrays(*sums))
+    return sums.reshape((len(masks), len(columns)) + sums.shape[1:])
+
+
+def masked_ratios(masks, ratios):
+    # Rapports des sommes (numérateur, dénominateur) de `ratios` sur chaque masque, 0 si le dénominateur est nul.
+    # Un tableau présent dans plusieurs rapports n'est sommé qu'une fois.
+    columns = []
+    positions = {}
+    for array in (array for ratio in ratios for array in ratio):
+        if id(array) not in positions:
+            positions[id(array)] = len(columns)
+            columns.append(array)
+    sums = masked_sums(masks, columns)
+    return safe_divide(
+        sums[:, [positions[id(numerator)] for numerator, _ in ratios]],
+        sums[:, [positions[id(denominator)] for _, denominator in ratios]],
+        )
+
+
+def masked_ratio(mask, numerator, denominator):
+    # Rapport des sommes de `numerator` et `denominator` sur les communes de `mask`, 0 si le dénominateur est nul
+    return masked_ratios([mask], [(numerator, denominator)])[0, 0]
+
+
+def single_etat_value(values):
+    # Valeur d'une variable de l'Etat lue par `commune.etat(...)`, pour une simulation à un seul Etat :
+    # toutes les communes en reçoivent la même valeur, celle de la première commune suffit
+    # (un scalaire, ou un vecteur par variante pour des tableaux (communes, variantes)).
+    return values[0]
+
+
+class DoublePrecision(object):
+    # À placer avant `Variable` dans les classes de base d'une variable réelle stockée sur 64 bits au lieu de float32
+    # (ex. une moyenne nationale, qui garde la précision du rapport de sommes dont elle est issue).
+
+    def __init__(self, baseline_variable = None):
+        super(DoublePrecision, self).__init__(baseline_variable)
+        self.dtype = np.float64
+
+
+# Répartition de plusieurs enveloppes entre les communes, chacune au prorata d'un score (ex. les quatre parts
+# des fractions péréquation et cible de la DSR) : le montant d'une commune pour une part est son score
+# multiplié par la valeur du point de la part. La matrice des parts reste locale à la formule qui la calcule.
+
+def allocate(scores, valeurs_point):
+    '''
+    Renvoie la matrice des montants de chaque commune pour chaque part.
+
+    `scores` est la liste des scores de chaque part, `valeurs_point` la liste des valeurs du point correspondantes.
+    Les parts sont sur la dernière dimension : (communes, parts), ou (communes, variantes, parts)
+    pour des tableaux (communes, variantes).
+    '''
+    return np.stack(np.broadcast_arrays(*scores), axis = -1) * np.stack(np.broadcast_arrays(*valeurs_point), axis = -1)
+
+
+# Garanties d'une dotation par rapport au montant perçu l'année précédente : encadrement de la progression
+# (ex. entre 90 % et 120 % pour la DSR), augmentation plafonnée en euros (DSU), garantie de sortie
+# pour les communes qui perdent leur éligibilité (ex. 50 % du montant de l'année précédente).
+# Les règles sont appliquées en un seul passage sur une copie des montants, qui est modifiée sur place ;
+# la règle retenue pour chaque commune est renvoyée sous forme de codes `RegleGarantie`.
+
+class RegleGarantie(Enum):
+    aucune = "Montant calculé, sans garantie"
+    plafond = "Montant plafonné par rapport au montant de l'année précédente"
+    augmentation_max = "Augmentation plafonnée"
+    plancher = "Montant garanti par rapport au montant de l'année précédente"
+    sortie = "Garantie de sortie"
+
+
+def apply_guarantees(montants, montants_an_precedent, eligible = True, plancher = None, plafond = None, sortie = None, augmentation_max = None):
+    '''
+    Renvoie les montants après garanties et, pour chaque commune, l'indice de la `RegleGarantie` appliquée.
+
+    Une commune éligible qui percevait déjà la dotation (montant et montant de l'année précédente positifs)
+    perçoit au plus `plafond` fois le montant de l'année précédente, augmenté d'au plus `augmentation_max` euros,
+    et au moins `plancher` fois ce montant (le plancher l'emporte sur les plafonds).
+    Une commune non éligible perçoit `sortie` fois le montant de l'année précédente.
+    Une règle absente (`None`) ne s'applique pas.
+    '''
+    montants_an_precedent = np.asarray(montants_an_precedent)
+    shape = np.broadcast(montants, montants_an_precedent, eligible).shape
+    resultat = np.array(np.broadcast_to(montants, shape), dtype = np.result_type(montants, montants_an_precedent))
+    codes = np.zeros(shape, dtype = np.int8)
+    garanti = (resultat > 0) & (montants_an_precedent > 0) & eligible
+
+    def borner(borne, depasse, regle):
+        applique = garanti & depasse(resultat, borne)
+        np.copyto(resultat, borne, where = applique, casting = 'unsafe')
+        codes[applique] = regle.index
+
+    if plafond is not None:
+        borner(plafond * montants_an_precedent, np.greater, RegleGarantie.plafond)
+    if augmentation_max is not None:
+        borner(montants_an_precedent + augmentation_max, np.greater, RegleGarantie.augmentation_max)
+    if plancher is not None:
+        borner(plancher * montants_an_precedent, np.less, RegleGarantie.plancher)
+    if sortie is not None:
+        sortant = ~np.broadcast_to(eligible, shape)
+        np.copyto(resultat, sortie * montants_an_precedent, where = sortant, casting = 'unsafe')
+        codes[sortant & (montants_an_precedent > 0)] = RegleGarantie.sortie.index
+    return resultat, codes
+
+
+# Tranches d'un barème à montant unique (ex. `parameters(period).population.strates_demographiques`)
+# déterminées par une seule recherche dichotomique dans les seuils.
+# Une valeur égale à un seuil appartient à la tranche qui commence à ce seuil ;
+# une valeur inférieure au premier seuil est rattachée à la première tranche.
+
+def bracket_index(scale, values):
+    return np.maximum(np.searchsorted(scale.thresholds, values, side = 'right') - 1, 0)
+
+
+def bracket_amount(scale, values):
+    return np.asarray(scale.amounts)[bracket_index(scale, values)]
+
+
+# Classement décroissant des communes selon un score (rang 1 pour le plus élevé).
+# Les ex-aequo sont départagés par l'ordre des communes : à score égal, la première commune est la mieux classée.
+# Pour des tableaux (communes, variantes), chaque variante est classée séparément.
+
+def rank(scores, top = None):
+    '''
+    Renvoie le rang de chaque commune.
+
+    Avec `top`, seuls les `top` premiers rangs sont calculés : les autres communes
+    reçoivent le rang `top + 1`, ce qui suffit à comparer le rang à un nombre de communes éligibles
+    inférieur ou égal à `top` (`np.argpartition`, puis tri des seules `top` premières communes).
+    '''
+    scores = np.asarray(scores)
+    if top is not None:
+        top = int(np.max(top))
+    if top is None or top >= len(scores):
+        order = np.argsort(-scores, axis = 0, kind = 'stable')
+        ranks = np.empty(scores.shape, dtype = np.int64)
+        np.put_along_axis(ranks, order, np.arange(1, len(scores) + 1).reshape((-1,) + (1,) * (scores.ndim - 1)), axis = 0)
+        return ranks
+    if scores.ndim == 2:
+        return np.stack([rank(column, top) for column in scores.T], axis = 1)
+    ranks = np.full(scores.shape, top + 1, dtype = np.int64)
+    if top <= 0:
+        return ranks
+    oppose = -scores
+    limite = oppose[np.argpartition(oppose, top - 1)[top - 1]]
+    # Toutes les communes à égalité avec la dernière retenue sont candidates, pour départager selon leur ordre
+    candidates = np.flatnonzero(~(oppose > limite))
+    premieres = candidates[np.argsort(oppose[candidates], kind = 'stable')[:top]]
+    ranks[premieres] = np.arange(1, top + 1)
+    return ranks
@@ -89,7 +89,7 @@ class montant_total_ecretement(Variable):
         accroissement_dsu = parameters(period).dotation_solidarite_urbaine.augmentation_montant
         acroissement_intercommunalite = parameters(period).dotation_intercommunalite.augmentation_montant
         df_evolution_part_dynamique = etat.members('df_evolution_part_dynamique', period)
-        total_evolution_part_dynamique = df_evolution_part_dynamique.sum()
+        total_evolution_part_dynamique = df_evolution_part_dynamique.sum(axis = 0)
         return (accroissement_dsr
             + accroissement_dsu
             + df_montant_total_ecretement_hors_dsu_dsr
@@ -211,7 +211,7 @@ class df_montant_ecretement(Variable):
         df_montant_total_ecretement = commune.etat("df_montant_total_ecretement", period)
         df_score_attribution_ecretement = commune('df_score_attribution_ecretement', period)
 
-        valeur_point = df_montant_total_ecretement / df_score_attribution_ecretement.sum()
+        valeur_point = df_montant_total_ecretement / df_score_attribution_ecretement.sum(axis = 0)
 
         ecretement = valeur_point * df_score_attribution_ecretement
         df_an_dernier = commune('dotation_forfaitaire', period.last_year)
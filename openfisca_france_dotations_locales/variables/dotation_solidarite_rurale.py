@@ -1,5 +1,6 @@
 from openfisca_core.model_api import *
 from openfisca_france_dotations_locales.entities import *
+from openfisca_france_dotations_locales.variables.base import DoublePrecision, masked_ratio
 
 
 class dotation_solidarite_rurale(Variable):
@@ -14,3 +15,49 @@ class dotation_solidarite_rurale(Variable):
         dsr_fraction_bourg_centre = commune("dsr_fraction_bourg_centre", period)
         dsr_fraction_perequation = commune("dsr_fraction_perequation", period)
         return dsr_fraction_cible + dsr_fraction_bourg_centre + dsr_fraction_perequation
+
+
+class dsr_commune_moins_10000_habitants(Variable):
+    value_type = bool
+    entity = Commune
+    definition_period = YEAR
+    label = "Commune de métropole de moins de 10 000 habitants (population DGF):\
+        Communes de référence des moyennes de potentiel financier de la DSR"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000037994647&cidTexte=LEGITEXT000006070633"
+
+    def formula(commune, period, parameters):
+        population_dgf = commune('population_dgf', period)
+        outre_mer = commune('outre_mer', period)
+        # oui le seuil est le même que pour le seuil d'éligibilité, notre paramétrisation est ainsi
+        taille_max_commune = parameters(period).dotation_solidarite_rurale.seuil_nombre_habitants
+        return (~outre_mer) * (population_dgf < taille_max_commune)
+
+
+class dsr_potentiel_financier_par_habitant_moyen_10000(DoublePrecision, Variable):
+    value_type = float
+    entity = Etat
+    definition_period = YEAR
+    label = "Potentiel financier moyen par habitant des communes de moins de 10 000 habitants:\
+        Référence de l'exclusion et de l'attribution de la fraction bourg-centre de la DSR"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000037994647&cidTexte=LEGITEXT000006070633"
+
+    def formula(etat, period, parameters):
+        communes_moins_10000 = etat.members('dsr_commune_moins_10000_habitants', period)
+        potentiel_financier = etat.members('potentiel_financier', period)
+        population_dgf = etat.members('population_dgf', period)
+        return masked_ratio(communes_moins_10000, potentiel_financier, population_dgf)
+
+
+class dsr_potentiel_financier_par_hectare_moyen_10000(DoublePrecision, Variable):
+    value_type = float
+    entity = Etat
+    definition_period = YEAR
+    label = "Potentiel financier moyen par hectare des communes de moins de 10 000 habitants:\
+        Référence des parts potentiel financier par hectare des fractions péréquation et cible de la DSR"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000037994647&cidTexte=LEGITEXT000006070633"
+
+    def formula(etat, period, parameters):
+        communes_moins_10000 = etat.members('dsr_commune_moins_10000_habitants', period)
+        potentiel_financier = etat.members('potentiel_financier', period)
+        superficie = etat.members('superficie', period)
+        return masked_ratio(communes_moins_10000, potentiel_financier, superficie)
@@ -1,6 +1,20 @@
-from numpy import sum as sum_, where
+from numpy import where
 from openfisca_core.model_api import *
 from openfisca_france_dotations_locales.entities import *
+from openfisca_france_dotations_locales.variables.base import RegleGarantie, apply_guarantees, single_etat_value
+
+
+# Garanties de la fraction bourg-centre, appelées par les variables des montants garantis
+# et par dsr_regle_garantie_fraction_bourg_centre : montants et règles retenues proviennent du même calcul.
+# La garantie de sortie est calculée à part, car elle est retirée de l'enveloppe répartie entre les communes éligibles.
+
+def garantie_stabilite_fraction_bourg_centre(montants, montants_an_precedent, plancher_progression, plafond_progression):
+    return apply_guarantees(montants, montants_an_precedent, plancher = plancher_progression, plafond = plafond_progression)
+
+
+def garantie_sortie_fraction_bourg_centre(montants_an_precedent, eligible):
+    part_garantie = 0.5
+    return apply_guarantees(0, montants_an_precedent, eligible, sortie = part_garantie)
 
 
 class dsr_exclue_fraction_bourg_centre_agglomeration(Variable):
@@ -60,17 +74,7 @@ class dsr_exclue_fraction_bourg_centre_pfi(Variable):
         potentiel_financier_par_habitant = commune('potentiel_financier_par_habitant', period)
         ratio_max_potentiel_financier = parameters(period).dotation_solidarite_rurale.bourg_centre.eligibilite.exclusion.seuil_rapport_pfi_10000
 
-        outre_mer = commune('outre_mer', period)
-        potentiel_financier = commune('potentiel_financier', period)
-        population_dgf = commune('population_dgf', period)
-
-        taille_max_commune = parameters(period).dotation_solidarite_rurale.seuil_nombre_habitants
-        # oui le taille_max_commune est le même que pour le seuil d'éligibilité, notre paramétrisation est ainsi
-        communes_moins_10000 = (~outre_mer) * (population_dgf < taille_max_commune)
-        if sum_(communes_moins_10000 * population_dgf) != 0:
-            pot_fin_10000 = sum_(communes_moins_10000 * potentiel_financier) / sum_(communes_moins_10000 * population_dgf)
-        else:
-            pot_fin_10000 = 0
+        pot_fin_10000 = single_etat_value(commune.etat('dsr_potentiel_financier_par_habitant_moyen_10000', period))
         return potentiel_financier_par_habitant >= (ratio_max_potentiel_financier * pot_fin_10000)
 
 
@@ -219,13 +223,11 @@ class dsr_score_attribution_fraction_bourg_centre(Variable):
 
     def formula(commune, period, parameters):
         population_dgf_plafonnee = commune("population_dgf_plafonnee", period)  # cf. Article L2334-21
-        potentiel_financier = commune('potentiel_financier', period)
         potentiel_financier_par_habitant = commune('potentiel_financier_par_habitant', period)
         effort_fiscal = commune('effort_fiscal', period)
         zrr = commune('zrr', period)
         dsr_eligible_fraction_bourg_centre = commune("dsr_eligible_fraction_bourg_centre", period)
-        outre_mer = commune('outre_mer', period)
-        population_dgf = commune('population_dgf', period)
+        pot_fin_10000 = single_etat_value(commune.etat('dsr_potentiel_financier_par_habitant_moyen_10000', period))
 
         parameters_dsr = parameters(period).dotation_solidarite_rurale
 
@@ -235,12 +237,6 @@ class dsr_score_attribution_fraction_bourg_centre(Variable):
 
         coefficient_zrr = parameters_dsr.bourg_centre.attribution.coefficient_zrr
 
-        # oui le taille_max_commune est le même que pour le seuil d'éligibilité, notre paramétrisation est ainsi
-        taille_max_commune = parameters_dsr.seuil_nombre_habitants
-        communes_moins_10000 = (~outre_mer) * (population_dgf < taille_max_commune)
-        pot_fin_10000 = (sum_(communes_moins_10000 * potentiel_financier)
-                / sum_(communes_moins_10000 * population_dgf))
-
         facteur_pot_fin = max_(0, 2 - potentiel_financier_par_habitant / pot_fin_10000)
         facteur_zrr = where(zrr, coefficient_zrr, 1.0)
         facteur_effort_fiscal = min_(plafond_effort_fiscal, effort_fiscal)
@@ -323,7 +319,7 @@ class dsr_montant_total_eligibles_fraction_bourg_centre(Variable):
         dsr_montant_garantie_non_eligible_fraction_bourg_centre = etat.members('dsr_montant_garantie_non_eligible_fraction_bourg_centre', period)
         dsr_eligible_fraction_bourg_centre = etat.members('dsr_eligible_fraction_bourg_centre', period)
 
-        montant_total_a_attribuer = dsr_montant_total_fraction_bourg_centre - max_((~dsr_eligible_fraction_bourg_centre) * dsr_garantie_commune_nouvelle_fraction_bourg_centre, dsr_montant_garantie_non_eligible_fraction_bourg_centre).sum()
+        montant_total_a_attribuer = dsr_montant_total_fraction_bourg_centre - max_((~dsr_eligible_fraction_bourg_centre) * dsr_garantie_commune_nouvelle_fraction_bourg_centre, dsr_montant_garantie_non_eligible_fraction_bourg_centre).sum(axis = 0)
         return montant_total_a_attribuer
 
 
@@ -337,7 +333,7 @@ class dsr_valeur_point_fraction_bourg_centre(Variable):
     def formula(etat, period, parameters):
         montant_total_a_attribuer = etat("dsr_montant_total_eligibles_fraction_bourg_centre", period)
         dsr_score_attribution_fraction_bourg_centre = etat.members("dsr_score_attribution_fraction_bourg_centre", period)
-        score_total = dsr_score_attribution_fraction_bourg_centre.sum()
+        score_total = dsr_score_attribution_fraction_bourg_centre.sum(axis = 0)
         return montant_total_a_attribuer / score_total
 
 
@@ -373,7 +369,8 @@ class dsr_montant_eligible_fraction_bourg_centre(Variable):
         plafond_progression = parameters(period).dotation_solidarite_rurale.bourg_centre.attribution.plafond_ratio_progression
         montant_an_precedent = commune("dsr_montant_eligible_fraction_bourg_centre", period.last_year)
         dsr_montant_hors_garanties_fraction_bourg_centre = commune("dsr_montant_hors_garanties_fraction_bourg_centre", period)
-        return where((dsr_montant_hors_garanties_fraction_bourg_centre > 0) & (montant_an_precedent > 0), max_(plancher_progression * montant_an_precedent, min_(plafond_progression * montant_an_precedent, dsr_montant_hors_garanties_fraction_bourg_centre)), dsr_montant_hors_garanties_fraction_bourg_centre)
+        montants, _ = garantie_stabilite_fraction_bourg_centre(dsr_montant_hors_garanties_fraction_bourg_centre, montant_an_precedent, plancher_progression, plafond_progression)
+        return montants
 
 
 class dsr_garantie_commune_nouvelle_fraction_bourg_centre(Variable):
@@ -405,8 +402,27 @@ class dsr_montant_garantie_non_eligible_fraction_bourg_centre(Variable):
     def formula(commune, period, parameters):
         dsr_eligible_fraction_bourg_centre = commune("dsr_eligible_fraction_bourg_centre", period)
         montant_an_precedent = commune("dsr_montant_eligible_fraction_bourg_centre", period.last_year)
-        part_garantie = 0.5
-        return (~dsr_eligible_fraction_bourg_centre) * montant_an_precedent * part_garantie
+        montants, _ = garantie_sortie_fraction_bourg_centre(montant_an_precedent, dsr_eligible_fraction_bourg_centre)
+        return montants
+
+
+class dsr_regle_garantie_fraction_bourg_centre(Variable):
+    value_type = Enum
+    possible_values = RegleGarantie
+    default_value = RegleGarantie.aucune
+    entity = Commune
+    definition_period = YEAR
+    label = "Garantie appliquée à la commune au titre de la fraction bourg-centre de la DSR (stabilité ou sortie)"
+
+    def formula(commune, period, parameters):
+        plancher_progression = parameters(period).dotation_solidarite_rurale.bourg_centre.attribution.plancher_ratio_progression
+        plafond_progression = parameters(period).dotation_solidarite_rurale.bourg_centre.attribution.plafond_ratio_progression
+        dsr_eligible_fraction_bourg_centre = commune("dsr_eligible_fraction_bourg_centre", period)
+        montant_an_precedent = commune("dsr_montant_eligible_fraction_bourg_centre", period.last_year)
+        dsr_montant_hors_garanties_fraction_bourg_centre = commune("dsr_montant_hors_garanties_fraction_bourg_centre", period)
+        _, regles_stabilite = garantie_stabilite_fraction_bourg_centre(dsr_montant_hors_garanties_fraction_bourg_centre, montant_an_precedent, plancher_progression, plafond_progression)
+        _, regles_sortie = garantie_sortie_fraction_bourg_centre(montant_an_precedent, dsr_eligible_fraction_bourg_centre)
+        return where(dsr_eligible_fraction_bourg_centre, regles_stabilite, regles_sortie)
 
 
 class dsr_fraction_bourg_centre(Variable):
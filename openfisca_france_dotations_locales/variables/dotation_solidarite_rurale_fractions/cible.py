@@ -1,7 +1,14 @@
 from openfisca_core.model_api import *
 from openfisca_france_dotations_locales.entities import *
 import numpy as np
-from openfisca_france_dotations_locales.variables.base import safe_divide
+from openfisca_france_dotations_locales.variables.base import RegleGarantie, allocate, apply_guarantees, rank, safe_divide, single_etat_value
+
+
+# Garantie de sortie de la fraction cible, appelée par dsr_montant_garantie_non_eligible_fraction_cible
+# et par dsr_regle_garantie_fraction_cible : montants et règles retenues proviennent du même calcul.
+
+def garantie_sortie_fraction_cible(montants_an_precedent, eligible, ratio_garantie):
+    return apply_guarantees(0, montants_an_precedent, eligible, sortie = ratio_garantie)
 
 
 class indice_synthetique_dsr_cible(Variable):
@@ -49,14 +56,8 @@ class rang_indice_synthetique_dsr_cible(Variable):
 
     def formula(commune, period, parameters):
         indice_synthetique_dsr_cible = commune("indice_synthetique_dsr_cible", period)
-        # L'utilisation d'un double argsort renvoie un tableau qui contient
-        # la statistique d'ordre (indexée par 0) du tableau d'entrée dans
-        # l'ordre croissant (cf par exemple
-        # https://www.berkayantmen.com/rank.html).
-        # On l'applique sur l'opposé de l'indice synthétique
-        # pour obtenir un classement dans l'ordre décroissant.
-        # les communes de même indice synthétique auront un rang différent (non spécifié par la loi)
-        return (-indice_synthetique_dsr_cible).argsort().argsort() + 1
+        # Les communes de même indice synthétique sont classées dans leur ordre initial (non spécifié par la loi).
+        return rank(indice_synthetique_dsr_cible)
 
 
 class dsr_eligible_fraction_cible(Variable):
@@ -91,20 +92,20 @@ pourcentage_accroissement_dsr_cible = (360_336_634 - 323_780_451) / 90_000_000
 
 class dsr_montant_total_fraction_cible(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Montant disponible pour communes éligibles DSR fraction cible"
     reference = "http://www.dotations-dgcl.interieur.gouv.fr/consultation/documentAffichage.php?id=94"
 
-    def formula_2013_01(commune, period, parameters):
-        montants_an_prochain = commune('dsr_montant_total_fraction_cible', period.offset(1, 'year'))
+    def formula_2013_01(etat, period, parameters):
+        montants_an_prochain = etat('dsr_montant_total_fraction_cible', period.offset(1, 'year'))
         accroissement = parameters(period.offset(1, 'year')).dotation_solidarite_rurale.augmentation_montant
         return montants_an_prochain - accroissement * pourcentage_accroissement_dsr_cible
 
-    def formula_2019_01(commune, period, parameters):
+    def formula_2019_01(etat, period, parameters):
         return 323_780_451
 
-    # def formula_2020_01(commune, period, parameters):
+    # def formula_2020_01(etat, period, parameters):
     #    return 360_336_634
 
     # A partir de 2020, formule récursive qui bouge en
@@ -115,81 +116,81 @@ class dsr_montant_total_fraction_cible(Variable):
     # La variation sera égale à pourcentage_accroissement *
     # valeur du paramètre "accroissement" pour cette année là.
 
-    def formula_2020_01(commune, period, parameters):
-        montants_an_precedent = commune('dsr_montant_total_fraction_cible', period.last_year)
+    def formula_2020_01(etat, period, parameters):
+        montants_an_precedent = etat('dsr_montant_total_fraction_cible', period.last_year)
         accroissement = parameters(period).dotation_solidarite_rurale.augmentation_montant
         return montants_an_precedent + accroissement * pourcentage_accroissement_dsr_cible
 
 
 class dsr_montant_total_eligibles_fraction_cible(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Montant disponible pour communes éligibles DSR fraction cible"
     reference = "http://www.dotations-dgcl.interieur.gouv.fr/consultation/documentAffichage.php?id=94"
 
-    def formula(commune, period, parameters):
-        dsr_montant_total_fraction_cible = commune('dsr_montant_total_fraction_cible', period)
-        dsr_garantie_commune_nouvelle_fraction_cible = commune('dsr_garantie_commune_nouvelle_fraction_cible', period)
-        dsr_montant_garantie_non_eligible_fraction_cible = commune('dsr_montant_garantie_non_eligible_fraction_cible', period)
-        dsr_eligible_fraction_cible = commune('dsr_eligible_fraction_cible', period)
+    def formula(etat, period, parameters):
+        dsr_montant_total_fraction_cible = etat('dsr_montant_total_fraction_cible', period)
+        dsr_garantie_commune_nouvelle_fraction_cible = etat.members('dsr_garantie_commune_nouvelle_fraction_cible', period)
+        dsr_montant_garantie_non_eligible_fraction_cible = etat.members('dsr_montant_garantie_non_eligible_fraction_cible', period)
+        dsr_eligible_fraction_cible = etat.members('dsr_eligible_fraction_cible', period)
         montant_total_a_attribuer = dsr_montant_total_fraction_cible - max_(
             (~dsr_eligible_fraction_cible) * dsr_garantie_commune_nouvelle_fraction_cible,  # garantie issue du passé des composantes de la commune nouvelle
             dsr_montant_garantie_non_eligible_fraction_cible
-            ).sum()
+            ).sum(axis = 0)
         return montant_total_a_attribuer
 
 
 class dsr_montant_total_eligibles_fraction_cible_part_potentiel_financier_par_habitant(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Montant total DSR fraction cible - potentiel financier par habitant:\
         Valeur totale attribuée (hors garanties de stabilité) aux communes éligibles à la fraction cible de la DSR au titre du potentiel financier par habitant"
     reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000037994647&cidTexte=LEGITEXT000006070633"
 
-    def formula(commune, period, parameters):
+    def formula(etat, period, parameters):
         poids = parameters(period).dotation_solidarite_rurale.attribution.poids_potentiel_financier_par_habitant
-        return commune('dsr_montant_total_eligibles_fraction_cible', period) * poids
+        return etat('dsr_montant_total_eligibles_fraction_cible', period) * poids
 
 
 class dsr_montant_total_eligibles_fraction_cible_part_longueur_voirie(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Montant total DSR fraction cible - longueur voirie:\
         Valeur totale attribuée (hors garanties de stabilité) aux communes éligibles à la fraction cible de la DSR au titre de la longueur de voirie"
     reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000037994647&cidTexte=LEGITEXT000006070633"
 
-    def formula(commune, period, parameters):
+    def formula(etat, period, parameters):
         poids = parameters(period).dotation_solidarite_rurale.attribution.poids_longueur_voirie
-        return commune('dsr_montant_total_eligibles_fraction_cible', period) * poids
+        return etat('dsr_montant_total_eligibles_fraction_cible', period) * poids
 
 
 class dsr_montant_total_eligibles_fraction_cible_part_enfants(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Montant total DSR fraction cible - nombre d'enfants:\
         Valeur totale attribuée (hors garanties de stabilité) aux communes éligibles à la fraction cible de la DSR au titre du nombre d'enfants"
     reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000037994647&cidTexte=LEGITEXT000006070633"
 
-    def formula(commune, period, parameters):
+    def formula(etat, period, parameters):
         poids = parameters(period).dotation_solidarite_rurale.attribution.poids_enfants
-        return commune('dsr_montant_total_eligibles_fraction_cible', period) * poids
+        return etat('dsr_montant_total_eligibles_fraction_cible', period) * poids
 
 
 class dsr_montant_total_eligibles_fraction_cible_part_potentiel_financier_par_hectare(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Montant total DSR fraction cible - potentiel financier par hectare:\
         Valeur totale attribuée (hors garanties de stabilité) aux communes éligibles à la fraction cible de la DSR au titre du potentiel financier par hectare"
     reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000037994647&cidTexte=LEGITEXT000006070633"
 
-    def formula(commune, period, parameters):
+    def formula(etat, period, parameters):
         poids = parameters(period).dotation_solidarite_rurale.attribution.poids_potentiel_financier_par_hectare
-        return commune('dsr_montant_total_eligibles_fraction_cible', period) * poids
+        return etat('dsr_montant_total_eligibles_fraction_cible', period) * poids
 
 
 class dsr_score_attribution_cible_part_potentiel_financier_par_habitant(Variable):
@@ -282,17 +283,10 @@ class dsr_score_attribution_cible_part_potentiel_financier_par_hectare(Variable)
         financier moyen par hectare des communes de moins de 10 000 habitants."""
 
     def formula(commune, period, parameters):
-        potentiel_financier = commune('potentiel_financier', period)
-        outre_mer = commune('outre_mer', period)
         potentiel_financier_par_habitant = commune('potentiel_financier_par_hectare', period)
         dsr_eligible_fraction_cible = commune("dsr_eligible_fraction_cible", period)
         population_dgf = commune('population_dgf', period)
-        # oui le taille_max_commune est le même que pour le seuil d'éligibilité, notre paramétrisation est ainsi
-        taille_max_commune = parameters(period).dotation_solidarite_rurale.seuil_nombre_habitants
-        superficie = commune('superficie', period)
-        communes_moins_10000 = (~outre_mer) * (population_dgf < taille_max_commune)
-
-        pot_fin_par_hectare_10000 = safe_divide(np.sum(communes_moins_10000 * potentiel_financier), np.sum(communes_moins_10000 * superficie))
+        pot_fin_par_hectare_10000 = single_etat_value(commune.etat('dsr_potentiel_financier_par_hectare_moyen_10000', period))
 
         facteur_pot_fin = max_(0, safe_divide((2 * pot_fin_par_hectare_10000 - potentiel_financier_par_habitant), pot_fin_par_hectare_10000, 0))
 
@@ -301,57 +295,57 @@ class dsr_score_attribution_cible_part_potentiel_financier_par_hectare(Variable)
 
 class dsr_valeur_point_fraction_cible_part_potentiel_financier_par_habitant(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Valeur du point DSR fraction cible - part potentiel financier par habitant"
     reference = "http://www.dotations-dgcl.interieur.gouv.fr/consultation/documentAffichage.php?id=94"
 
-    def formula(commune, period, parameters):
-        montant_total_a_attribuer = commune("dsr_montant_total_eligibles_fraction_cible_part_potentiel_financier_par_habitant", period)
-        dsr_score_attribution = commune("dsr_score_attribution_cible_part_potentiel_financier_par_habitant", period)
-        score_total = dsr_score_attribution.sum()
+    def formula(etat, period, parameters):
+        montant_total_a_attribuer = etat("dsr_montant_total_eligibles_fraction_cible_part_potentiel_financier_par_habitant", period)
+        dsr_score_attribution = etat.members("dsr_score_attribution_cible_part_potentiel_financier_par_habitant", period)
+        score_total = dsr_score_attribution.sum(axis = 0)
         return montant_total_a_attribuer / score_total
 
 
 class dsr_valeur_point_fraction_cible_part_longueur_voirie(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Valeur du point DSR fraction cible - part longueur de voirie"
     reference = "http://www.dotations-dgcl.interieur.gouv.fr/consultation/documentAffichage.php?id=94"
 
-    def formula(commune, period, parameters):
-        montant_total_a_attribuer = commune("dsr_montant_total_eligibles_fraction_cible_part_longueur_voirie", period)
-        dsr_score_attribution = commune("dsr_score_attribution_cible_part_longueur_voirie", period)
-        score_total = dsr_score_attribution.sum()
+    def formula(etat, period, parameters):
+        montant_total_a_attribuer = etat("dsr_montant_total_eligibles_fraction_cible_part_longueur_voirie", period)
+        dsr_score_attribution = etat.members("dsr_score_attribution_cible_part_longueur_voirie", period)
+        score_total = dsr_score_attribution.sum(axis = 0)
         return montant_total_a_attribuer / score_total
 
 
 class dsr_valeur_point_fraction_cible_part_enfants(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Valeur du point DSR fraction cible - part enfants"
     reference = "http://www.dotations-dgcl.interieur.gouv.fr/consultation/documentAffichage.php?id=94"
 
-    def formula(commune, period, parameters):
-        montant_total_a_attribuer = commune("dsr_montant_total_eligibles_fraction_cible_part_enfants", period)
-        dsr_score_attribution = commune("dsr_score_attribution_cible_part_enfants", period)
-        score_total = dsr_score_attribution.sum()
+    def formula(etat, period, parameters):
+        montant_total_a_attribuer = etat("dsr_montant_total_eligibles_fraction_cible_part_enfants", period)
+        dsr_score_attribution = etat.members("dsr_score_attribution_cible_part_enfants", period)
+        score_total = dsr_score_attribution.sum(axis = 0)
         return montant_total_a_attribuer / score_total
 
 
 class dsr_valeur_point_fraction_cible_part_potentiel_financier_par_hectare(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Valeur du point DSR fraction cible - part potentiel financier par hectare"
     reference = "http://www.dotations-dgcl.interieur.gouv.fr/consultation/documentAffichage.php?id=94"
 
-    def formula(commune, period, parameters):
-        montant_total_a_attribuer = commune("dsr_montant_total_eligibles_fraction_cible_part_potentiel_financier_par_hectare", period)
-        dsr_score_attribution = commune("dsr_score_attribution_cible_part_potentiel_financier_par_hectare", period)
-        score_total = dsr_score_attribution.sum()
+    def formula(etat, period, parameters):
+        montant_total_a_attribuer = etat("dsr_montant_total_eligibles_fraction_cible_part_potentiel_financier_par_hectare", period)
+        dsr_score_attribution = etat.members("dsr_score_attribution_cible_part_potentiel_financier_par_hectare", period)
+        score_total = dsr_score_attribution.sum(axis = 0)
         return montant_total_a_attribuer / score_total
 
 
@@ -364,7 +358,7 @@ class dsr_fraction_cible_part_potentiel_financier_par_habitant(Variable):
 
     def formula(commune, period, parameters):
         scores = commune("dsr_score_attribution_cible_part_potentiel_financier_par_habitant", period)
-        valeur_point = commune("dsr_valeur_point_fraction_cible_part_potentiel_financier_par_habitant", period)
+        valeur_point = single_etat_value(commune.etat("dsr_valeur_point_fraction_cible_part_potentiel_financier_par_habitant", period))
         return scores * valeur_point
 
 
@@ -377,7 +371,7 @@ class dsr_fraction_cible_part_longueur_voirie(Variable):
 
     def formula(commune, period, parameters):
         scores = commune("dsr_score_attribution_cible_part_longueur_voirie", period)
-        valeur_point = commune("dsr_valeur_point_fraction_cible_part_longueur_voirie", period)
+        valeur_point = single_etat_value(commune.etat("dsr_valeur_point_fraction_cible_part_longueur_voirie", period))
         return scores * valeur_point
 
 
@@ -390,7 +384,7 @@ class dsr_fraction_cible_part_enfants(Variable):
 
     def formula(commune, period, parameters):
         scores = commune("dsr_score_attribution_cible_part_enfants", period)
-        valeur_point = commune("dsr_valeur_point_fraction_cible_part_enfants", period)
+        valeur_point = single_etat_value(commune.etat("dsr_valeur_point_fraction_cible_part_enfants", period))
         return scores * valeur_point
 
 
@@ -403,7 +397,7 @@ class dsr_fraction_cible_part_potentiel_financier_par_hectare(Variable):
 
     def formula(commune, period, parameters):
         scores = commune("dsr_score_attribution_cible_part_potentiel_financier_par_hectare", period)
-        valeur_point = commune("dsr_valeur_point_fraction_cible_part_potentiel_financier_par_hectare", period)
+        valeur_point = single_etat_value(commune.etat("dsr_valeur_point_fraction_cible_part_potentiel_financier_par_hectare", period))
         return scores * valeur_point
 
 
@@ -414,14 +408,20 @@ class dsr_montant_hors_garanties_fraction_cible(Variable):
     definition_period = YEAR
 
     def formula(commune, period, parameters):
-        part_potentiel_financier_par_habitant = commune('dsr_fraction_cible_part_potentiel_financier_par_habitant', period)
-        part_longueur_voirie = commune('dsr_fraction_cible_part_longueur_voirie', period)
-        part_enfants = commune('dsr_fraction_cible_part_enfants', period)
-        part_potentiel_financier_par_hectare = commune('dsr_fraction_cible_part_potentiel_financier_par_hectare', period)
-        return (part_potentiel_financier_par_habitant
-        + part_longueur_voirie
-        + part_enfants
-        + part_potentiel_financier_par_hectare)
+        scores = [
+            commune('dsr_score_attribution_cible_part_potentiel_financier_par_habitant', period),
+            commune('dsr_score_attribution_cible_part_longueur_voirie', period),
+            commune('dsr_score_attribution_cible_part_enfants', period),
+            commune('dsr_score_attribution_cible_part_potentiel_financier_par_hectare', period),
+            ]
+        valeurs_point = [
+            single_etat_value(commune.etat('dsr_valeur_point_fraction_cible_part_potentiel_financier_par_habitant', period)),
+            single_etat_value(commune.etat('dsr_valeur_point_fraction_cible_part_longueur_voirie', period)),
+            single_etat_value(commune.etat('dsr_valeur_point_fraction_cible_part_enfants', period)),
+            single_etat_value(commune.etat('dsr_valeur_point_fraction_cible_part_potentiel_financier_par_hectare', period)),
+            ]
+        # Matrice (communes, parts) des montants de chaque part, sommée par commune
+        return allocate(scores, valeurs_point).sum(axis = -1)
 
 
 class dsr_garantie_commune_nouvelle_fraction_cible(Variable):
@@ -454,7 +454,24 @@ class dsr_montant_garantie_non_eligible_fraction_cible(Variable):
         dsr_eligible_fraction_cible = commune("dsr_eligible_fraction_cible", period)
         montant_an_precedent = commune("dsr_montant_hors_garanties_fraction_cible", period.last_year)
         ratio_garantie = parameters(period).dotation_solidarite_rurale.cible.attribution.ratio_garantie
-        return (~dsr_eligible_fraction_cible) * montant_an_precedent * ratio_garantie
+        montants, _ = garantie_sortie_fraction_cible(montant_an_precedent, dsr_eligible_fraction_cible, ratio_garantie)
+        return montants
+
+
+class dsr_regle_garantie_fraction_cible(Variable):
+    value_type = Enum
+    possible_values = RegleGarantie
+    default_value = RegleGarantie.aucune
+    entity = Commune
+    definition_period = YEAR
+    label = "Garantie de sortie appliquée à la commune au titre de la fraction cible de la DSR"
+
+    def formula(commune, period, parameters):
+        dsr_eligible_fraction_cible = commune("dsr_eligible_fraction_cible", period)
+        montant_an_precedent = commune("dsr_montant_hors_garanties_fraction_cible", period.last_year)
+        ratio_garantie = parameters(period).dotation_solidarite_rurale.cible.attribution.ratio_garantie
+        _, regles = garantie_sortie_fraction_cible(montant_an_precedent, dsr_eligible_fraction_cible, ratio_garantie)
+        return regles
 
 
 class dsr_fraction_cible(Variable):
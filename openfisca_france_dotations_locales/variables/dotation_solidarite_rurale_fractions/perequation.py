@@ -1,7 +1,14 @@
 from openfisca_core.model_api import *
 from openfisca_france_dotations_locales.entities import *
-from numpy import sum as sum_, where
-from openfisca_france_dotations_locales.variables.base import safe_divide
+from numpy import where
+from openfisca_france_dotations_locales.variables.base import RegleGarantie, allocate, apply_guarantees, safe_divide, single_etat_value
+
+
+# Garantie de stabilité de la fraction péréquation, appelée par dsr_montant_eligible_fraction_perequation
+# et par dsr_regle_garantie_fraction_perequation : montants et règles retenues proviennent du même calcul.
+
+def garantie_stabilite_fraction_perequation(montants, montants_an_precedent, plancher_progression, plafond_progression):
+    return apply_guarantees(montants, montants_an_precedent, plancher = plancher_progression, plafond = plafond_progression)
 
 
 class dsr_eligible_fraction_perequation(Variable):
@@ -18,15 +25,12 @@ class dsr_eligible_fraction_perequation(Variable):
     '''
 
     def formula(commune, period, parameters):
-        seuil_nombre_habitants = parameters(period).dotation_solidarite_rurale.seuil_nombre_habitants
-        population_dgf = commune('population_dgf', period)
-
         potentiel_financier_par_habitant = commune('potentiel_financier_par_habitant', period)
         potentiel_financier_par_habitant_strate = commune('potentiel_financier_par_habitant_moyen', period)
         plafond_ratio_pot_fin = parameters(period).dotation_solidarite_rurale.perequation.seuil_rapport_potentiel_financier
         plafond = plafond_ratio_pot_fin * potentiel_financier_par_habitant_strate
-        outre_mer = commune('outre_mer', period)
-        return (~outre_mer) * (population_dgf < seuil_nombre_habitants) * (potentiel_financier_par_habitant <= plafond)
+        communes_moins_10000 = commune('dsr_commune_moins_10000_habitants', period)
+        return communes_moins_10000 * (potentiel_financier_par_habitant <= plafond)
 
 
 pourcentage_accroissement_dsr_pq = (653_174_468 - 645_050_872) / 90_000_000
@@ -34,7 +38,7 @@ pourcentage_accroissement_dsr_pq = (653_174_468 - 645_050_872) / 90_000_000
 
 class dsr_montant_total_fraction_perequation(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Montant disponible pour communes éligibles DSR fraction péréquation en métropole"
     reference = "http://www.dotations-dgcl.interieur.gouv.fr/consultation/documentAffichage.php?id=94"
@@ -44,12 +48,12 @@ class dsr_montant_total_fraction_perequation(Variable):
     aux communes nouvelles inéligibles s’élève à 7 403 713 €.
     '''
 
-    def formula_2013_01(commune, period, parameters):
-        montants_an_prochain = commune('dsr_montant_total_fraction_perequation', period.offset(1, 'year'))
+    def formula_2013_01(etat, period, parameters):
+        montants_an_prochain = etat('dsr_montant_total_fraction_perequation', period.offset(1, 'year'))
         accroissement = parameters(period.offset(1, 'year')).dotation_solidarite_rurale.augmentation_montant
         return montants_an_prochain - accroissement * pourcentage_accroissement_dsr_pq
 
-    def formula_2019_01(commune, period, parameters):
+    def formula_2019_01(etat, period, parameters):
         return 645_050_872
 
     # A partir de 2020, formule récursive qui bouge en
@@ -60,15 +64,15 @@ class dsr_montant_total_fraction_perequation(Variable):
     # La variation sera égale à pourcentage_accroissement *
     # valeur du paramètre "accroissement" pour cette année là.
 
-    def formula_2020_01(commune, period, parameters):
-        montants_an_precedent = commune('dsr_montant_total_fraction_perequation', period.last_year)
+    def formula_2020_01(etat, period, parameters):
+        montants_an_precedent = etat('dsr_montant_total_fraction_perequation', period.last_year)
         accroissement = parameters(period).dotation_solidarite_rurale.augmentation_montant
         return montants_an_precedent + accroissement * pourcentage_accroissement_dsr_pq
 
 
 class dsr_montant_total_eligibles_fraction_perequation(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Montant disponible pour communes éligibles DSR fraction péréquation en métropole"
     reference = "http://www.dotations-dgcl.interieur.gouv.fr/consultation/documentAffichage.php?id=94"
@@ -78,65 +82,65 @@ class dsr_montant_total_eligibles_fraction_perequation(Variable):
     2020 : 653 174 468 € au titre de la fraction « péréquation » (soit 1,26 % de plus qu’en 2019)
     '''
 
-    def formula(commune, period, parameters):
-        dsr_montant_total_fraction_perequation = commune('dsr_montant_total_fraction_perequation', period)
-        dsr_garantie_commune_nouvelle_fraction_perequation = commune('dsr_garantie_commune_nouvelle_fraction_perequation', period)
-        dsr_eligible_fraction_perequation = commune('dsr_eligible_fraction_perequation', period)
-        montant_total_a_attribuer = dsr_montant_total_fraction_perequation - ((~dsr_eligible_fraction_perequation) * dsr_garantie_commune_nouvelle_fraction_perequation).sum()
+    def formula(etat, period, parameters):
+        dsr_montant_total_fraction_perequation = etat('dsr_montant_total_fraction_perequation', period)
+        dsr_garantie_commune_nouvelle_fraction_perequation = etat.members('dsr_garantie_commune_nouvelle_fraction_perequation', period)
+        dsr_eligible_fraction_perequation = etat.members('dsr_eligible_fraction_perequation', period)
+        montant_total_a_attribuer = dsr_montant_total_fraction_perequation - ((~dsr_eligible_fraction_perequation) * dsr_garantie_commune_nouvelle_fraction_perequation).sum(axis = 0)
 
         return montant_total_a_attribuer
 
 
 class dsr_montant_total_eligibles_fraction_perequation_part_potentiel_financier_par_habitant(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Montant total DSR fraction péréquation - potentiel financier par habitant:\
         Valeur totale attribuée (hors garanties de stabilité) aux communes éligibles à la fraction péréquation de la DSR au titre du potentiel financier par habitant"
     reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000036433094&cidTexte=LEGITEXT000006070633"
 
-    def formula(commune, period, parameters):
+    def formula(etat, period, parameters):
         poids = parameters(period).dotation_solidarite_rurale.attribution.poids_potentiel_financier_par_habitant
-        return commune('dsr_montant_total_eligibles_fraction_perequation', period) * poids
+        return etat('dsr_montant_total_eligibles_fraction_perequation', period) * poids
 
 
 class dsr_montant_total_eligibles_fraction_perequation_part_longueur_voirie(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Montant total DSR fraction péréquation - longueur voirie:\
         Valeur totale attribuée (hors garanties de stabilité) aux communes éligibles à la fraction péréquation de la DSR au titre de la longueur de voirie"
     reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000036433094&cidTexte=LEGITEXT000006070633"
 
-    def formula(commune, period, parameters):
+    def formula(etat, period, parameters):
         poids = parameters(period).dotation_solidarite_rurale.attribution.poids_longueur_voirie
-        return commune('dsr_montant_total_eligibles_fraction_perequation', period) * poids
+        return etat('dsr_montant_total_eligibles_fraction_perequation', period) * poids
 
 
 class dsr_montant_total_eligibles_fraction_perequation_part_enfants(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Montant total DSR fraction péréquation - nombre d'enfants:\
         Valeur totale attribuée (hors garanties de stabilité) aux communes éligibles à la fraction péréquation de la DSR au titre du nombre d'enfants"
     reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000036433094&cidTexte=LEGITEXT000006070633"
 
-    def formula(commune, period, parameters):
+    def formula(etat, period, parameters):
         poids = parameters(period).dotation_solidarite_rurale.attribution.poids_enfants
-        return commune('dsr_montant_total_eligibles_fraction_perequation', period) * poids
+        return etat('dsr_montant_total_eligibles_fraction_perequation', period) * poids
 
 
 class dsr_montant_total_eligibles_fraction_perequation_part_potentiel_financier_par_hectare(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Montant total DSR fraction péréquation - potentiel financier par hectare:\
         Valeur totale attribuée (hors garanties de stabilité) aux communes éligibles à la fraction péréquation de la DSR au titre du potentiel financier par hectare"
     reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000036433094&cidTexte=LEGITEXT000006070633"
 
-    def formula(commune, period, parameters):
+    def formula(etat, period, parameters):
         poids = parameters(period).dotation_solidarite_rurale.attribution.poids_potentiel_financier_par_hectare
-        return commune('dsr_montant_total_eligibles_fraction_perequation', period) * poids
+        return etat('dsr_montant_total_eligibles_fraction_perequation', period) * poids
 
 
 class dsr_score_attribution_perequation_part_potentiel_financier_par_habitant(Variable):
@@ -229,18 +233,10 @@ class dsr_score_attribution_perequation_part_potentiel_financier_par_hectare(Var
     financier moyen par hectare des communes de moins de 10 000 habitants."""
 
     def formula(commune, period, parameters):
-        potentiel_financier = commune('potentiel_financier', period)
-        outre_mer = commune('outre_mer', period)
         potentiel_financier_par_habitant = commune('potentiel_financier_par_hectare', period)
         dsr_eligible_fraction_perequation = commune("dsr_eligible_fraction_perequation", period)
         population_dgf = commune('population_dgf', period)
-        # oui le taille_max_commune est le même que pour le seuil d'éligibilité, notre paramétrisation est ainsi
-        taille_max_commune = parameters(period).dotation_solidarite_rurale.seuil_nombre_habitants
-        superficie = commune('superficie', period)
-        communes_moins_10000 = (~outre_mer) * (population_dgf < taille_max_commune)
-
-        pot_fin_par_hectare_10000 = (sum_(communes_moins_10000 * potentiel_financier)
-                / sum_(communes_moins_10000 * superficie))
+        pot_fin_par_hectare_10000 = single_etat_value(commune.etat('dsr_potentiel_financier_par_hectare_moyen_10000', period))
 
         facteur_pot_fin = max_(0, 2 - potentiel_financier_par_habitant / pot_fin_par_hectare_10000)
 
@@ -249,57 +245,57 @@ class dsr_score_attribution_perequation_part_potentiel_financier_par_hectare(Var
 
 class dsr_valeur_point_fraction_perequation_part_potentiel_financier_par_habitant(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Valeur du point DSR fraction péréquation - part potentiel financier par habitant"
     reference = "http://www.dotations-dgcl.interieur.gouv.fr/consultation/documentAffichage.php?id=94"
 
-    def formula(commune, period, parameters):
-        montant_total_a_attribuer = commune("dsr_montant_total_eligibles_fraction_perequation_part_potentiel_financier_par_habitant", period)
-        dsr_score_attribution = commune("dsr_score_attribution_perequation_part_potentiel_financier_par_habitant", period)
-        score_total = dsr_score_attribution.sum()
+    def formula(etat, period, parameters):
+        montant_total_a_attribuer = etat("dsr_montant_total_eligibles_fraction_perequation_part_potentiel_financier_par_habitant", period)
+        dsr_score_attribution = etat.members("dsr_score_attribution_perequation_part_potentiel_financier_par_habitant", period)
+        score_total = dsr_score_attribution.sum(axis = 0)
         return montant_total_a_attribuer / score_total
 
 
 class dsr_valeur_point_fraction_perequation_part_longueur_voirie(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Valeur du point DSR fraction péréquation - part longueur de voirie"
     reference = "http://www.dotations-dgcl.interieur.gouv.fr/consultation/documentAffichage.php?id=94"
 
-    def formula(commune, period, parameters):
-        montant_total_a_attribuer = commune("dsr_montant_total_eligibles_fraction_perequation_part_longueur_voirie", period)
-        dsr_score_attribution = commune("dsr_score_attribution_perequation_part_longueur_voirie", period)
-        score_total = dsr_score_attribution.sum()
+    def formula(etat, period, parameters):
+        montant_total_a_attribuer = etat("dsr_montant_total_eligibles_fraction_perequation_part_longueur_voirie", period)
+        dsr_score_attribution = etat.members("dsr_score_attribution_perequation_part_longueur_voirie", period)
+        score_total = dsr_score_attribution.sum(axis = 0)
         return montant_total_a_attribuer / score_total
 
 
 class dsr_valeur_point_fraction_perequation_part_enfants(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Valeur du point DSR fraction péréquation - part enfants"
     reference = "http://www.dotations-dgcl.interieur.gouv.fr/consultation/documentAffichage.php?id=94"
 
-    def formula(commune, period, parameters):
-        montant_total_a_attribuer = commune("dsr_montant_total_eligibles_fraction_perequation_part_enfants", period)
-        dsr_score_attribution = commune("dsr_score_attribution_perequation_part_enfants", period)
-        score_total = dsr_score_attribution.sum()
+    def formula(etat, period, parameters):
+        montant_total_a_attribuer = etat("dsr_montant_total_eligibles_fraction_perequation_part_enfants", period)
+        dsr_score_attribution = etat.members("dsr_score_attribution_perequation_part_enfants", period)
+        score_total = dsr_score_attribution.sum(axis = 0)
         return montant_total_a_attribuer / score_total
 
 
 class dsr_valeur_point_fraction_perequation_part_potentiel_financier_par_hectare(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Valeur du point DSR fraction péréquation - part potentiel financier par hectare"
     reference = "http://www.dotations-dgcl.interieur.gouv.fr/consultation/documentAffichage.php?id=94"
 
-    def formula(commune, period, parameters):
-        montant_total_a_attribuer = commune("dsr_montant_total_eligibles_fraction_perequation_part_potentiel_financier_par_hectare", period)
-        dsr_score_attribution = commune("dsr_score_attribution_perequation_part_potentiel_financier_par_hectare", period)
-        score_total = dsr_score_attribution.sum()
+    def formula(etat, period, parameters):
+        montant_total_a_attribuer = etat("dsr_montant_total_eligibles_fraction_perequation_part_potentiel_financier_par_hectare", period)
+        dsr_score_attribution = etat.members("dsr_score_attribution_perequation_part_potentiel_financier_par_hectare", period)
+        score_total = dsr_score_attribution.sum(axis = 0)
         return montant_total_a_attribuer / score_total
 
 
@@ -312,7 +308,7 @@ class dsr_fraction_perequation_part_potentiel_financier_par_habitant(Variable):
 
     def formula(commune, period, parameters):
         scores = commune("dsr_score_attribution_perequation_part_potentiel_financier_par_habitant", period)
-        valeur_point = commune("dsr_valeur_point_fraction_perequation_part_potentiel_financier_par_habitant", period)
+        valeur_point = single_etat_value(commune.etat("dsr_valeur_point_fraction_perequation_part_potentiel_financier_par_habitant", period))
         return scores * valeur_point
 
 
@@ -325,7 +321,7 @@ class dsr_fraction_perequation_part_longueur_voirie(Variable):
 
     def formula(commune, period, parameters):
         scores = commune("dsr_score_attribution_perequation_part_longueur_voirie", period)
-        valeur_point = commune("dsr_valeur_point_fraction_perequation_part_longueur_voirie", period)
+        valeur_point = single_etat_value(commune.etat("dsr_valeur_point_fraction_perequation_part_longueur_voirie", period))
         return scores * valeur_point
 
 
@@ -338,7 +334,7 @@ class dsr_fraction_perequation_part_enfants(Variable):
 
     def formula(commune, period, parameters):
         scores = commune("dsr_score_attribution_perequation_part_enfants", period)
-        valeur_point = commune("dsr_valeur_point_fraction_perequation_part_enfants", period)
+        valeur_point = single_etat_value(commune.etat("dsr_valeur_point_fraction_perequation_part_enfants", period))
         return scores * valeur_point
 
 
@@ -351,7 +347,7 @@ class dsr_fraction_perequation_part_potentiel_financier_par_hectare(Variable):
 
     def formula(commune, period, parameters):
         scores = commune("dsr_score_attribution_perequation_part_potentiel_financier_par_hectare", period)
-        valeur_point = commune("dsr_valeur_point_fraction_perequation_part_potentiel_financier_par_hectare", period)
+        valeur_point = single_etat_value(commune.etat("dsr_valeur_point_fraction_perequation_part_potentiel_financier_par_hectare", period))
         return scores * valeur_point
 
 
@@ -362,14 +358,20 @@ class dsr_montant_hors_garanties_fraction_perequation(Variable):
     definition_period = YEAR
 
     def formula(commune, period, parameters):
-        part_potentiel_financier_par_habitant = commune('dsr_fraction_perequation_part_potentiel_financier_par_habitant', period)
-        part_longueur_voirie = commune('dsr_fraction_perequation_part_longueur_voirie', period)
-        part_enfants = commune('dsr_fraction_perequation_part_enfants', period)
-        part_potentiel_financier_par_hectare = commune('dsr_fraction_perequation_part_potentiel_financier_par_hectare', period)
-        return (part_potentiel_financier_par_habitant
-        + part_longueur_voirie
-        + part_enfants
-        + part_potentiel_financier_par_hectare)
+        scores = [
+            commune('dsr_score_attribution_perequation_part_potentiel_financier_par_habitant', period),
+            commune('dsr_score_attribution_perequation_part_longueur_voirie', period),
+            commune('dsr_score_attribution_perequation_part_enfants', period),
+            commune('dsr_score_attribution_perequation_part_potentiel_financier_par_hectare', period),
+            ]
+        valeurs_point = [
+            single_etat_value(commune.etat('dsr_valeur_point_fraction_perequation_part_potentiel_financier_par_habitant', period)),
+            single_etat_value(commune.etat('dsr_valeur_point_fraction_perequation_part_longueur_voirie', period)),
+            single_etat_value(commune.etat('dsr_valeur_point_fraction_perequation_part_enfants', period)),
+            single_etat_value(commune.etat('dsr_valeur_point_fraction_perequation_part_potentiel_financier_par_hectare', period)),
+            ]
+        # Matrice (communes, parts) des montants de chaque part, sommée par commune
+        return allocate(scores, valeurs_point).sum(axis = -1)
 
 
 class dsr_montant_eligible_fraction_perequation(Variable):
@@ -390,7 +392,8 @@ class dsr_montant_eligible_fraction_perequation(Variable):
         plafond_progression = parameters(period).dotation_solidarite_rurale.perequation.attribution.plafond_ratio_progression
         montant_an_precedent = commune("dsr_montant_eligible_fraction_perequation", period.last_year)
         dsr_montant_hors_garanties_fraction_perequation = commune("dsr_montant_hors_garanties_fraction_perequation", period)
-        return where((dsr_montant_hors_garanties_fraction_perequation > 0) & (montant_an_precedent > 0), max_(plancher_progression * montant_an_precedent, min_(plafond_progression * montant_an_precedent, dsr_montant_hors_garanties_fraction_perequation)), dsr_montant_hors_garanties_fraction_perequation)
+        montants, _ = garantie_stabilite_fraction_perequation(dsr_montant_hors_garanties_fraction_perequation, montant_an_precedent, plancher_progression, plafond_progression)
+        return montants
 
 
 class dsr_garantie_commune_nouvelle_fraction_perequation(Variable):
@@ -407,6 +410,23 @@ class dsr_garantie_commune_nouvelle_fraction_perequation(Variable):
         précédant la création de la commune nouvelle.'''
 
 
+class dsr_regle_garantie_fraction_perequation(Variable):
+    value_type = Enum
+    possible_values = RegleGarantie
+    default_value = RegleGarantie.aucune
+    entity = Commune
+    definition_period = YEAR
+    label = "Garantie de stabilité appliquée à la commune au titre de la fraction péréquation de la DSR"
+
+    def formula(commune, period, parameters):
+        plancher_progression = parameters(period).dotation_solidarite_rurale.perequation.attribution.plancher_ratio_progression
+        plafond_progression = parameters(period).dotation_solidarite_rurale.perequation.attribution.plafond_ratio_progression
+        montant_an_precedent = commune("dsr_montant_eligible_fraction_perequation", period.last_year)
+        dsr_montant_hors_garanties_fraction_perequation = commune("dsr_montant_hors_garanties_fraction_perequation", period)
+        _, regles = garantie_stabilite_fraction_perequation(dsr_montant_hors_garanties_fraction_perequation, montant_an_precedent, plancher_progression, plafond_progression)
+        return regles
+
+
 class dsr_fraction_perequation(Variable):
     value_type = float
     entity = Commune
@@ -1,7 +1,150 @@
 from openfisca_core.model_api import *
 from openfisca_france_dotations_locales.entities import *
 import numpy as np
-from openfisca_france_dotations_locales.variables.base import safe_divide
+from openfisca_france_dotations_locales.variables.base import DoublePrecision, RegleGarantie, apply_guarantees, masked_ratio, rank, safe_divide, single_etat_value
+
+
+class dsu_groupe_seuil_bas(Variable):
+    value_type = bool
+    entity = Commune
+    definition_period = YEAR
+    label = "Groupe seuil bas DSU:\
+        Commune de métropole de 5 000 à 9 999 habitants, classée parmi les communes du seuil bas de la DSU"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000038834291&cidTexte=LEGITEXT000006070633"
+
+    def formula(commune, period, parameters):
+        population_dgf = commune("population_dgf", period)
+        outre_mer = commune('outre_mer', period)
+        seuil_bas = parameters(period).dotation_solidarite_urbaine.eligibilite.seuil_bas_nombre_habitants
+        seuil_haut = parameters(period).dotation_solidarite_urbaine.eligibilite.seuil_haut_nombre_habitants
+        return (~outre_mer) * (seuil_bas <= population_dgf) * (seuil_haut > population_dgf)
+
+
+class dsu_groupe_seuil_haut(Variable):
+    value_type = bool
+    entity = Commune
+    definition_period = YEAR
+    label = "Groupe seuil haut DSU:\
+        Commune de métropole de 10 000 habitants et plus, classée parmi les communes du seuil haut de la DSU"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000038834291&cidTexte=LEGITEXT000006070633"
+
+    def formula(commune, period, parameters):
+        population_dgf = commune("population_dgf", period)
+        outre_mer = commune('outre_mer', period)
+        seuil_haut = parameters(period).dotation_solidarite_urbaine.eligibilite.seuil_haut_nombre_habitants
+        return (~outre_mer) * (seuil_haut <= population_dgf)
+
+
+class dsu_potentiel_financier_par_habitant_moyen_seuil_bas(DoublePrecision, Variable):
+    value_type = float
+    entity = Etat
+    definition_period = YEAR
+    label = "Potentiel financier moyen par habitant des communes du seuil bas de la DSU"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000038834291&cidTexte=LEGITEXT000006070633"
+
+    def formula(etat, period, parameters):
+        groupe = etat.members('dsu_groupe_seuil_bas', period)
+        potentiel_financier = etat.members('potentiel_financier', period)
+        population_dgf = etat.members('population_dgf', period)
+        return masked_ratio(groupe, potentiel_financier, population_dgf)
+
+
+class dsu_potentiel_financier_par_habitant_moyen_seuil_haut(DoublePrecision, Variable):
+    value_type = float
+    entity = Etat
+    definition_period = YEAR
+    label = "Potentiel financier moyen par habitant des communes du seuil haut de la DSU"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000038834291&cidTexte=LEGITEXT000006070633"
+
+    def formula(etat, period, parameters):
+        groupe = etat.members('dsu_groupe_seuil_haut', period)
+        potentiel_financier = etat.members('potentiel_financier', period)
+        population_dgf = etat.members('population_dgf', period)
+        return masked_ratio(groupe, potentiel_financier, population_dgf)
+
+
+class dsu_part_logements_sociaux_moyenne_seuil_bas(DoublePrecision, Variable):
+    value_type = float
+    entity = Etat
+    definition_period = YEAR
+    label = "Part moyenne des logements sociaux des communes du seuil bas de la DSU"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000038834291&cidTexte=LEGITEXT000006070633"
+
+    def formula(etat, period, parameters):
+        groupe = etat.members('dsu_groupe_seuil_bas', period)
+        nombre_logements_sociaux = etat.members('nombre_logements_sociaux', period)
+        nombre_logements = etat.members('nombre_logements', period)
+        return masked_ratio(groupe, nombre_logements_sociaux, nombre_logements)
+
+
+class dsu_part_logements_sociaux_moyenne_seuil_haut(DoublePrecision, Variable):
+    value_type = float
+    entity = Etat
+    definition_period = YEAR
+    label = "Part moyenne des logements sociaux des communes du seuil haut de la DSU"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000038834291&cidTexte=LEGITEXT000006070633"
+
+    def formula(etat, period, parameters):
+        groupe = etat.members('dsu_groupe_seuil_haut', period)
+        nombre_logements_sociaux = etat.members('nombre_logements_sociaux', period)
+        nombre_logements = etat.members('nombre_logements', period)
+        return masked_ratio(groupe, nombre_logements_sociaux, nombre_logements)
+
+
+class dsu_part_aides_logement_moyenne_seuil_bas(DoublePrecision, Variable):
+    value_type = float
+    entity = Etat
+    definition_period = YEAR
+    label = "Part moyenne des bénéficiaires d'aides au logement des communes du seuil bas de la DSU"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000038834291&cidTexte=LEGITEXT000006070633"
+
+    def formula(etat, period, parameters):
+        groupe = etat.members('dsu_groupe_seuil_bas', period)
+        nombre_beneficiaires_aides_au_logement = etat.members('nombre_beneficiaires_aides_au_logement', period)
+        nombre_logements = etat.members('nombre_logements', period)
+        return masked_ratio(groupe, nombre_beneficiaires_aides_au_logement, nombre_logements)
+
+
+class dsu_part_aides_logement_moyenne_seuil_haut(DoublePrecision, Variable):
+    value_type = float
+    entity = Etat
+    definition_period = YEAR
+    label = "Part moyenne des bénéficiaires d'aides au logement des communes du seuil haut de la DSU"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000038834291&cidTexte=LEGITEXT000006070633"
+
+    def formula(etat, period, parameters):
+        groupe = etat.members('dsu_groupe_seuil_haut', period)
+        nombre_beneficiaires_aides_au_logement = etat.members('nombre_beneficiaires_aides_au_logement', period)
+        nombre_logements = etat.members('nombre_logements', period)
+        return masked_ratio(groupe, nombre_beneficiaires_aides_au_logement, nombre_logements)
+
+
+class dsu_revenu_par_habitant_moyen_seuil_bas(DoublePrecision, Variable):
+    value_type = float
+    entity = Etat
+    definition_period = YEAR
+    label = "Revenu moyen par habitant des communes du seuil bas de la DSU"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000038834291&cidTexte=LEGITEXT000006070633"
+
+    def formula(etat, period, parameters):
+        groupe = etat.members('dsu_groupe_seuil_bas', period)
+        revenu_total = etat.members('revenu_total', period)
+        population_insee = etat.members('population_insee', period)
+        return masked_ratio(groupe, revenu_total, population_insee)
+
+
+class dsu_revenu_par_habitant_moyen_seuil_haut(DoublePrecision, Variable):
+    value_type = float
+    entity = Etat
+    definition_period = YEAR
+    label = "Revenu moyen par habitant des communes du seuil haut de la DSU"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000038834291&cidTexte=LEGITEXT000006070633"
+
+    def formula(etat, period, parameters):
+        groupe = etat.members('dsu_groupe_seuil_haut', period)
+        revenu_total = etat.members('revenu_total', period)
+        population_insee = etat.members('population_insee', period)
+        return masked_ratio(groupe, revenu_total, population_insee)
 
 
 class indice_synthetique_dsu(Variable):
@@ -13,53 +156,33 @@ class indice_synthetique_dsu(Variable):
     reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000038834291&cidTexte=LEGITEXT000006070633"
 
     def formula(commune, period, parameters):
-        population_dgf = commune("population_dgf", period)
-        outre_mer = commune('outre_mer', period)
-        potentiel_financier = commune('potentiel_financier', period)
+        groupe_bas = commune('dsu_groupe_seuil_bas', period)
+        groupe_haut = commune('dsu_groupe_seuil_haut', period)
         potentiel_financier_par_habitant = commune('potentiel_financier_par_habitant', period)
         nombre_logements = commune('nombre_logements', period)
         nombre_logements_sociaux = commune('nombre_logements_sociaux', period)
         nombre_aides_au_logement = commune('nombre_beneficiaires_aides_au_logement', period)
-        revenu = commune('revenu_total', period)
-        population_insee = commune('population_insee', period)
         revenu_par_habitant = commune('revenu_par_habitant', period)
 
-        seuil_bas = parameters(period).dotation_solidarite_urbaine.eligibilite.seuil_bas_nombre_habitants
-        seuil_haut = parameters(period).dotation_solidarite_urbaine.eligibilite.seuil_haut_nombre_habitants
         ratio_max_pot_fin = parameters(period).dotation_solidarite_urbaine.eligibilite.seuil_rapport_potentiel_financier
         poids_pot_fin = parameters(period).dotation_solidarite_urbaine.eligibilite.indice_synthetique.poids_potentiel_financier
         poids_logements_sociaux = parameters(period).dotation_solidarite_urbaine.eligibilite.indice_synthetique.poids_logements_sociaux
         poids_aides_au_logement = parameters(period).dotation_solidarite_urbaine.eligibilite.indice_synthetique.poids_aides_au_logement
         poids_revenu = parameters(period).dotation_solidarite_urbaine.eligibilite.indice_synthetique.poids_revenu
 
-        groupe_bas = (~outre_mer) * (seuil_bas <= population_dgf) * (seuil_haut > population_dgf)
-        groupe_haut = (~outre_mer) * (seuil_haut <= population_dgf)
-
-        pot_fin_bas = (np.sum(groupe_bas * potentiel_financier)
-                / np.sum(groupe_bas * population_dgf)) if np.sum(groupe_bas * population_dgf) > 0 else 0
-        pot_fin_haut = (np.sum(groupe_haut * potentiel_financier)
-                / np.sum(groupe_haut * population_dgf)) if np.sum(groupe_haut * population_dgf) > 0 else 0
+        pot_fin_bas = single_etat_value(commune.etat('dsu_potentiel_financier_par_habitant_moyen_seuil_bas', period))
+        pot_fin_haut = single_etat_value(commune.etat('dsu_potentiel_financier_par_habitant_moyen_seuil_haut', period))
+        part_logements_sociaux_bas = single_etat_value(commune.etat('dsu_part_logements_sociaux_moyenne_seuil_bas', period))
+        part_logements_sociaux_haut = single_etat_value(commune.etat('dsu_part_logements_sociaux_moyenne_seuil_haut', period))
+        part_aides_logement_bas = single_etat_value(commune.etat('dsu_part_aides_logement_moyenne_seuil_bas', period))
+        part_aides_logement_haut = single_etat_value(commune.etat('dsu_part_aides_logement_moyenne_seuil_haut', period))
+        revenu_moyen_bas = single_etat_value(commune.etat('dsu_revenu_par_habitant_moyen_seuil_bas', period))
+        revenu_moyen_haut = single_etat_value(commune.etat('dsu_revenu_par_habitant_moyen_seuil_haut', period))
 
         # Retrait des communes au potentiel financier trop élevé, les communes restantes ont droit à un indice synthétique
         groupe_bas_score_positif = groupe_bas * (potentiel_financier_par_habitant < ratio_max_pot_fin * pot_fin_bas)
         groupe_haut_score_positif = groupe_haut * (potentiel_financier_par_habitant < ratio_max_pot_fin * pot_fin_haut)
 
-        # Calcul des ratios moyens nécessaires au calcul de l'indice synthétique
-        part_logements_sociaux_bas = (np.sum(groupe_bas * nombre_logements_sociaux)
-                / np.sum(groupe_bas * nombre_logements)) if np.sum(groupe_bas * nombre_logements) > 0 else 0
-        part_logements_sociaux_haut = (np.sum(groupe_haut * nombre_logements_sociaux)
-                / np.sum(groupe_haut * nombre_logements)) if np.sum(groupe_haut * nombre_logements) > 0 else 0
-
-        part_aides_logement_bas = (np.sum(groupe_bas * nombre_aides_au_logement)
-                / np.sum(groupe_bas * nombre_logements)) if np.sum(groupe_bas * nombre_logements) > 0 else 0
-        part_aides_logement_haut = (np.sum(groupe_haut * nombre_aides_au_logement)
-                / np.sum(groupe_haut * nombre_logements)) if np.sum(groupe_haut * nombre_logements) > 0 else 0
-
-        revenu_moyen_bas = (np.sum(groupe_bas * revenu)
-                / np.sum(groupe_bas * population_insee)) if np.sum(groupe_bas * population_insee) > 0 else 0
-        revenu_moyen_haut = (np.sum(groupe_haut * revenu)
-                / np.sum(groupe_haut * population_insee)) if np.sum(groupe_haut * population_insee) > 0 else 0
-
         part_logements_sociaux_commune = safe_divide(nombre_logements_sociaux, nombre_logements)
         part_aides_logement_commune = safe_divide(nombre_aides_au_logement, nombre_logements)
 
@@ -88,18 +211,12 @@ class rang_indice_synthetique_dsu_seuil_haut(Variable):
     reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000038834291&cidTexte=LEGITEXT000006070633"
 
     def formula(commune, period, parameters):
-        seuil_haut = parameters(period).dotation_solidarite_urbaine.eligibilite.seuil_haut_nombre_habitants
         indice_synthetique_dsu = commune('indice_synthetique_dsu', period)
-        population_dgf = commune('population_dgf', period)
-        # L'utilisation d'un double argsort renvoie un tableau qui contient
-        # la statistique d'ordre (indexée par 0) du tableau d'entrée dans
-        # l'ordre croissant (cf par exemple
-        # https://www.berkayantmen.com/rank.html).
-        # On l'applique sur l'opposé de l'indice synthétique
-        # pour obtenir un classement dans l'ordre décroissant.
-        # les communes de même indice synthétique auront un rang différent (non spécifié par la loi)
-        score_a_classer = (indice_synthetique_dsu) * (seuil_haut <= population_dgf)
-        return (-score_a_classer).argsort().argsort() + 1
+        groupe_haut = commune('dsu_groupe_seuil_haut', period)
+        # Classement complet : le rang sert aussi au facteur de classement du montant.
+        # Les communes de même indice synthétique sont classées dans leur ordre initial (non spécifié par la loi).
+        score_a_classer = indice_synthetique_dsu * groupe_haut
+        return rank(score_a_classer)
 
 
 class rang_indice_synthetique_dsu_seuil_bas(Variable):
@@ -111,60 +228,46 @@ class rang_indice_synthetique_dsu_seuil_bas(Variable):
     reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000038834291&cidTexte=LEGITEXT000006070633"
 
     def formula(commune, period, parameters):
-        seuil_bas = parameters(period).dotation_solidarite_urbaine.eligibilite.seuil_bas_nombre_habitants
-        seuil_haut = parameters(period).dotation_solidarite_urbaine.eligibilite.seuil_haut_nombre_habitants
         indice_synthetique_dsu = commune('indice_synthetique_dsu', period)
-        population_dgf = commune('population_dgf', period)
-        # L'utilisation d'un double argsort renvoie un tableau qui contient
-        # la statistique d'ordre (indexée par 0) du tableau d'entrée dans
-        # l'ordre croissant (cf par exemple
-        # https://www.berkayantmen.com/rank.html).
-        # On l'applique sur l'opposé de l'indice synthétique
-        # pour obtenir un classement dans l'ordre décroissant.
-        # les communes de même indice synthétique auront un rang différent (non spécifié par la loi)
-        score_a_classer = (indice_synthetique_dsu) * (seuil_haut > population_dgf) * (seuil_bas <= population_dgf)
-        return (-score_a_classer).argsort().argsort() + 1
+        groupe_bas = commune('dsu_groupe_seuil_bas', period)
+        # Classement complet : le rang sert aussi au facteur de classement du montant.
+        # Les communes de même indice synthétique sont classées dans leur ordre initial (non spécifié par la loi).
+        score_a_classer = indice_synthetique_dsu * groupe_bas
+        return rank(score_a_classer)
 
 
 class dsu_nombre_communes_eligibles_seuil_bas(Variable):
     value_type = int
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Nombres de communes du seuil bas éligible à la DSU:\
         Nombre de communes éligibles à la dsu dans le seuil bas"
     reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000038834291&cidTexte=LEGITEXT000006070633"
 
-    def formula(commune, period, parameters):
-        population_dgf = commune("population_dgf", period)
-        outre_mer = commune('outre_mer', period)
-
-        seuil_bas = parameters(period).dotation_solidarite_urbaine.eligibilite.seuil_bas_nombre_habitants
-        seuil_haut = parameters(period).dotation_solidarite_urbaine.eligibilite.seuil_haut_nombre_habitants
+    def formula(etat, period, parameters):
+        groupe_bas = etat.members('dsu_groupe_seuil_bas', period)
         pourcentage_eligible_bas = parameters(period).dotation_solidarite_urbaine.eligibilite.part_eligible_seuil_bas
 
-        nombre_communes_seuil_bas = ((~outre_mer) * (population_dgf >= seuil_bas) * (population_dgf < seuil_haut)).sum()
+        nombre_communes_seuil_bas = groupe_bas.sum(axis = 0)
 
-        return int(nombre_communes_seuil_bas * pourcentage_eligible_bas + 0.99)  # 0.99 pour arrondi supérieur
+        return np.floor(nombre_communes_seuil_bas * pourcentage_eligible_bas + 0.99)  # 0.99 pour arrondi supérieur
 
 
 class dsu_nombre_communes_eligibles_seuil_haut(Variable):
     value_type = int
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "Nombres de communes du seuil haut éligible à la DSU:\
         Nombre de communes éligibles à la dsu dans le seuil haut"
     reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000038834291&cidTexte=LEGITEXT000006070633"
 
-    def formula(commune, period, parameters):
-        population_dgf = commune("population_dgf", period)
-        outre_mer = commune('outre_mer', period)
-
-        seuil_haut = parameters(period).dotation_solidarite_urbaine.eligibilite.seuil_haut_nombre_habitants
+    def formula(etat, period, parameters):
+        groupe_haut = etat.members('dsu_groupe_seuil_haut', period)
         pourcentage_eligible_haut = parameters(period).dotation_solidarite_urbaine.eligibilite.part_eligible_seuil_haut
 
-        nombre_communes_seuil_haut = ((~outre_mer) * (population_dgf >= seuil_haut)).sum()
+        nombre_communes_seuil_haut = groupe_haut.sum(axis = 0)
 
-        return int(nombre_communes_seuil_haut * pourcentage_eligible_haut + 0.99)  # 0.99 pour arrondi supérieur
+        return np.floor(nombre_communes_seuil_haut * pourcentage_eligible_haut + 0.99)  # 0.99 pour arrondi supérieur
 
 
 class dsu_eligible(Variable):
@@ -180,8 +283,8 @@ class dsu_eligible(Variable):
         rang_indice_synthetique_dsu_seuil_bas = commune('rang_indice_synthetique_dsu_seuil_bas', period)
         rang_indice_synthetique_dsu_seuil_haut = commune('rang_indice_synthetique_dsu_seuil_haut', period)
 
-        nombre_elig_seuil_bas = commune('dsu_nombre_communes_eligibles_seuil_bas', period)
-        nombre_elig_seuil_haut = commune('dsu_nombre_communes_eligibles_seuil_haut', period)
+        nombre_elig_seuil_bas = commune.etat('dsu_nombre_communes_eligibles_seuil_bas', period)
+        nombre_elig_seuil_haut = commune.etat('dsu_nombre_communes_eligibles_seuil_haut', period)
         elig_seuil_bas = (indice_synthetique_dsu > 0) * (rang_indice_synthetique_dsu_seuil_bas <= nombre_elig_seuil_bas)
         elig_seuil_haut = (indice_synthetique_dsu > 0) * (rang_indice_synthetique_dsu_seuil_haut <= nombre_elig_seuil_haut)
         return elig_seuil_bas | elig_seuil_haut
@@ -192,7 +295,7 @@ pourcentage_accroissement_dsu = (2_164_552_909 - 2_079_328_714) / 90_000_000
 
 class dsu_montant_total(Variable):
     value_type = float
-    entity = Commune
+    entity = Etat
     definition_period = YEAR
     label = "DSU Montant hors garanties:\
         Valeur totale attribuée (hors garanties) aux communes éligibles à la DSU en métropole"
@@ -215,7 +318,7 @@ class dsu_montant_total(Variable):
     '''
     # Est un montant fixe pour 2019
 
-    def formula_2019_01(commune, period, parameters):
+    def formula_2019_01(etat, period, parameters):
         montant_total_a_attribuer = 2_164_552_909
         return montant_total_a_attribuer
 
@@ -227,13 +330,13 @@ class dsu_montant_total(Variable):
     # La variation sera égale à pourcentage_accroissement *
     # valeur du paramètre "accroissement" pour cette année là.
 
-    def formula_2020_01(commune, period, parameters):
-        montants_an_precedent = commune('dsu_montant_total', period.last_year)
+    def formula_2020_01(etat, period, parameters):
+        montants_an_precedent = etat('dsu_montant_total', period.last_year)
         accroissement = parameters(period).dotation_solidarite_urbaine.augmentation_montant
         return montants_an_precedent + accroissement * pourcentage_accroissement_dsu
 
-    def formula_2013_01(commune, period, parameters):
-        montants_an_prochain = commune('dsu_montant_total', period.offset(1, 'year'))
+    def formula_2013_01(etat, period, parameters):
+        montants_an_prochain = etat('dsu_montant_total', period.offset(1, 'year'))
         accroissement = parameters(period.offset(1, 'year')).dotation_solidarite_urbaine.augmentation_montant
         return montants_an_prochain - accroissement * pourcentage_accroissement_dsu
 
@@ -261,11 +364,57 @@ class dsu_montant_garantie_pluriannuelle(Variable):
     éligible par un coefficient égal à 90 % la première année et diminuant ensuite d'un
     dixième chaque année. """
 
-# Bon OK peut être je dis bien peut-être que je peux :
-# prendre montant total à attribuer
-# trouver somehow le montant des garanties du futur
-# retirer ce montant des garanties
-# retirer le montant des dotations spontanées
+    def formula_2019_01(commune, period, parameters):
+        # La garantie ne dépend que de l'historique de l'année précédente (dernier montant perçu et nombre d'années écoulées),
+        # sans remonter les neuf exercices précédents.
+        montant_derniere_annee_eligible = commune('dsu_montant_derniere_annee_eligible', period.last_year)
+        nombre_annees_depuis_eligibilite = commune('dsu_nombre_annees_depuis_eligibilite', period.last_year) + 1
+        population_dgf = commune('population_dgf', period)
+        seuil_bas = parameters(period).dotation_solidarite_urbaine.eligibilite.seuil_bas_nombre_habitants
+        coefficient_premiere_annee = parameters(period).dotation_solidarite_urbaine.garantie_pluriannuelle.coefficient_premiere_annee
+        diminution_annuelle = parameters(period).dotation_solidarite_urbaine.garantie_pluriannuelle.diminution_annuelle
+        nombre_exercices = parameters(period).dotation_solidarite_urbaine.garantie_pluriannuelle.nombre_exercices
+
+        coefficient = max_(0, coefficient_premiere_annee - diminution_annuelle * (nombre_annees_depuis_eligibilite - 1))
+        return (population_dgf < seuil_bas) * (nombre_annees_depuis_eligibilite <= nombre_exercices) * coefficient * montant_derniere_annee_eligible
+
+
+class dsu_montant_derniere_annee_eligible(Variable):
+    value_type = float
+    entity = Commune
+    definition_period = YEAR
+    label = "DSU Montant de la dernière année d'éligibilité:\
+        Montant perçu au titre de l'éligibilité à la DSU la dernière année, jusqu'à l'année N incluse, où la commune était éligible"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000033814534&cidTexte=LEGITEXT000006070633"
+    documentation = """Mise à jour chaque année à partir de sa valeur de l'année précédente.
+    Avant 2019, première année calculée, la variable n'a pas de formule : l'historique de l'année
+    qui précède la première année simulée doit être renseigné en entrée, à défaut il vaut 0
+    (aucune commune n'a perdu son éligibilité)."""
+
+    def formula_2019_01(commune, period, parameters):
+        dsu_montant_eligible = commune('dsu_montant_eligible', period)
+        montant_an_precedent = commune('dsu_montant_derniere_annee_eligible', period.last_year)
+        return np.where(dsu_montant_eligible > 0, dsu_montant_eligible, montant_an_precedent)
+
+
+class dsu_nombre_annees_depuis_eligibilite(Variable):
+    value_type = int
+    entity = Commune
+    definition_period = YEAR
+    label = "DSU Nombre d'années depuis l'éligibilité:\
+        Nombre d'années écoulées depuis la dernière année d'éligibilité à la DSU, 0 si la commune est éligible l'année N"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000033814534&cidTexte=LEGITEXT000006070633"
+    documentation = """Mise à jour chaque année à partir de sa valeur de l'année précédente.
+    Avant 2019, première année calculée, la variable n'a pas de formule : l'historique de l'année
+    qui précède la première année simulée doit être renseigné en entrée, à défaut il vaut 0
+    (toutes les communes sont considérées éligibles cette année-là)."""
+
+    def formula_2019_01(commune, period, parameters):
+        dsu_montant_eligible = commune('dsu_montant_eligible', period)
+        nombre_an_precedent = commune('dsu_nombre_annees_depuis_eligibilite', period.last_year)
+        nombre_exercices = parameters(period).dotation_solidarite_urbaine.garantie_pluriannuelle.nombre_exercices
+        # Au-delà de la durée de la garantie, le décompte n'a plus d'effet : il est borné pour ne pas croître indéfiniment
+        return np.where(dsu_montant_eligible > 0, 0, min_(nombre_an_precedent + 1, nombre_exercices + 1))
 
 
 class dsu_montant_garantie_annuelle(Variable):
@@ -299,25 +448,25 @@ class dsu_montant_garantie_non_eligible(Variable):
 
 class dsu_montant_total_eligibles(Variable):
     value_type = float
-    entity = Commune  # une valeur unique valable pour la métropole
+    entity = Etat
     definition_period = YEAR
     label = "DSU Montant hors garanties:\
         Valeur totale attribuée (hors garanties) aux communes éligibles à la DSU"
     reference = "https://www.collectivites-locales.gouv.fr/files/files/dgcl_v2/FLAE/Circulaires_2019/note_dinformation_2019_dsu.pdf"
 
-    def formula_2019_01(commune, period, parameters):
-        dsu_montant_total = commune('dsu_montant_total', period)
-        dsu_montant_garantie_non_eligible = commune('dsu_montant_garantie_non_eligible', period)
+    def formula_2019_01(etat, period, parameters):
+        dsu_montant_total = etat('dsu_montant_total', period)
+        dsu_montant_garantie_non_eligible = etat.members('dsu_montant_garantie_non_eligible', period)
         # retrait des montants garantis, le reste est à distribuer entre communes éligibles
-        return dsu_montant_total - sum(dsu_montant_garantie_non_eligible)
+        return dsu_montant_total - dsu_montant_garantie_non_eligible.sum(axis = 0)
 
 
-class dsu_montant_eligible(Variable):
+class dsu_montant_eligible_hors_garanties(Variable):
     value_type = float
     entity = Commune
     definition_period = YEAR
-    label = "DSU au titre de l'éligibilité:\
-        Montant total reçu par la commune au titre de son éligibilité à la DSU (incluant part spontanée et augmentation)"
+    label = "DSU au titre de l'éligibilité hors garanties:\
+        Montant reçu par la commune au titre de son éligibilité à la DSU, avant plafonnement de l'augmentation"
     reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000033814543&cidTexte=LEGITEXT000006070633"
 
     # La vraie clef de répartition n'est pas claire : les dotations sont distribuées
@@ -337,16 +486,16 @@ class dsu_montant_eligible(Variable):
     # On veut donc :  VP(augmentation) / VP(dotation spontanée) = montant augmentation / montant an dernier
     # Ca correspond grosso modo (mais pas exactement) à la répartition de facto
     def formula_2019_01(commune, period, parameters):
-        dsu_montant_total = commune('dsu_montant_total', period)
-        dsu_an_precedent = commune('dsu_montant_total', period.last_year)
+        dsu_montant_total = commune.etat('dsu_montant_total', period)
+        dsu_an_precedent = commune.etat('dsu_montant_total', period.last_year)
         montants_an_precedent = commune('dsu_montant_eligible', period.last_year)
         dsu_eligible = commune('dsu_eligible', period)
-        total_a_distribuer = commune('dsu_montant_total_eligibles', period)
+        total_a_distribuer = commune.etat('dsu_montant_total_eligibles', period)
         rang_indice_synthetique_dsu_seuil_bas = commune('rang_indice_synthetique_dsu_seuil_bas', period)
         rang_indice_synthetique_dsu_seuil_haut = commune('rang_indice_synthetique_dsu_seuil_haut', period)
 
-        nombre_elig_seuil_bas = commune('dsu_nombre_communes_eligibles_seuil_bas', period)
-        nombre_elig_seuil_haut = commune('dsu_nombre_communes_eligibles_seuil_haut', period)
+        nombre_elig_seuil_bas = commune.etat('dsu_nombre_communes_eligibles_seuil_bas', period)
+        nombre_elig_seuil_haut = commune.etat('dsu_nombre_communes_eligibles_seuil_haut', period)
         effort_fiscal = commune('effort_fiscal', period)
         population_insee = commune('population_insee', period)
         population_qpv = commune('population_qpv', period)
@@ -359,14 +508,13 @@ class dsu_montant_eligible(Variable):
         poids_quartiers_prioritaires_ville = parameters(period).dotation_solidarite_urbaine.attribution.poids_quartiers_prioritaires_ville
         poids_zone_franche_urbaine = parameters(period).dotation_solidarite_urbaine.attribution.poids_zone_franche_urbaine
         plafond_effort_fiscal = parameters(period).dotation_solidarite_urbaine.attribution.plafond_effort_fiscal
-        augmentation_max = parameters(period).dotation_solidarite_urbaine.attribution.augmentation_max
-        seuil_bas = parameters(period).dotation_solidarite_urbaine.eligibilite.seuil_bas_nombre_habitants
-        seuil_haut = parameters(period).dotation_solidarite_urbaine.eligibilite.seuil_haut_nombre_habitants
+        groupe_bas = commune('dsu_groupe_seuil_bas', period)
+        groupe_haut = commune('dsu_groupe_seuil_haut', period)
 
         pourcentage_augmentation_dsu = dsu_montant_total / dsu_an_precedent - 1
 
-        eligible_groupe_haut = dsu_eligible * (seuil_haut <= population_dgf)
-        eligible_groupe_bas = dsu_eligible * (seuil_bas <= population_dgf) * (seuil_haut > population_dgf)
+        eligible_groupe_haut = dsu_eligible * groupe_haut
+        eligible_groupe_bas = dsu_eligible * groupe_bas
         toujours_eligible_groupe_bas = eligible_groupe_bas * (montants_an_precedent > 0)
         toujours_eligible_groupe_haut = eligible_groupe_haut * (montants_an_precedent > 0)
         nouvellement_eligible_groupe_bas = eligible_groupe_bas * (montants_an_precedent == 0)
@@ -385,32 +533,75 @@ class dsu_montant_eligible(Variable):
         score_anciens_eligibles_groupe_bas = (score_attribution * toujours_eligible_groupe_bas)
         score_nouveaux_eligibles_groupe_bas = (score_attribution * nouvellement_eligible_groupe_bas)
         # clef de répartition groupe haut/groupe bas
-        total_pop_eligible_augmentation_groupe_bas = (toujours_eligible_groupe_bas * population_dgf).sum()
-        total_pop_eligible_augmentation_groupe_haut = (toujours_eligible_groupe_haut * population_dgf).sum()
-        total_pop_eligible_augmentation = total_pop_eligible_augmentation_groupe_haut + total_pop_eligible_augmentation_groupe_bas
+        total_pop_eligible_augmentation_groupe_bas = (toujours_eligible_groupe_bas * population_dgf).sum(axis = 0)
+        total_pop_eligible_augmentation_groupe_haut = (toujours_eligible_groupe_haut * population_dgf).sum(axis = 0)
         # s'il n'y a pas de population, on répartit selon la population totale des groupes (non spécifié par la loi)
-        if not total_pop_eligible_augmentation:
-            total_pop_eligible_augmentation_groupe_bas = (eligible_groupe_bas * population_dgf).sum()
-            total_pop_eligible_augmentation_groupe_haut = (eligible_groupe_haut * population_dgf).sum()
-            total_pop_eligible_augmentation = total_pop_eligible_augmentation_groupe_haut + total_pop_eligible_augmentation_groupe_bas
+        sans_population_eligible_augmentation = (total_pop_eligible_augmentation_groupe_haut + total_pop_eligible_augmentation_groupe_bas) == 0
+        total_pop_eligible_augmentation_groupe_bas = np.where(sans_population_eligible_augmentation, (eligible_groupe_bas * population_dgf).sum(axis = 0), total_pop_eligible_augmentation_groupe_bas)
+        total_pop_eligible_augmentation_groupe_haut = np.where(sans_population_eligible_augmentation, (eligible_groupe_haut * population_dgf).sum(axis = 0), total_pop_eligible_augmentation_groupe_haut)
+        total_pop_eligible_augmentation = total_pop_eligible_augmentation_groupe_haut + total_pop_eligible_augmentation_groupe_bas
 
-        part_augmentation_groupe_bas = total_pop_eligible_augmentation_groupe_bas / total_pop_eligible_augmentation
+        part_augmentation_groupe_bas = safe_divide(total_pop_eligible_augmentation_groupe_bas, total_pop_eligible_augmentation)
         part_augmentation_groupe_haut = 1 - part_augmentation_groupe_bas
         # clef de répartition : on attribue une valeur des points d'augmentation égale au pourcentage
         # d'augmentation de la DSU
         rapport_valeur_point = pourcentage_augmentation_dsu  # Le rapport valeur point dépend
         # probablement du groupe, mais on ignore les détails de son calcul
-        total_points_groupe_bas = (score_anciens_eligibles_groupe_bas * rapport_valeur_point + score_nouveaux_eligibles_groupe_bas).sum()
-        total_points_groupe_haut = (score_anciens_eligibles_groupe_haut * rapport_valeur_point + score_nouveaux_eligibles_groupe_haut).sum()
+        total_points_groupe_bas = (score_anciens_eligibles_groupe_bas * rapport_valeur_point + score_nouveaux_eligibles_groupe_bas).sum(axis = 0)
+        total_points_groupe_haut = (score_anciens_eligibles_groupe_haut * rapport_valeur_point + score_nouveaux_eligibles_groupe_haut).sum(axis = 0)
         # Détermination de la valeur du point
-        montant_garanti_eligible = (toujours_eligible * montants_an_precedent).sum()
-        valeur_point_groupe_bas = (total_a_distribuer - montant_garanti_eligible) * part_augmentation_groupe_bas / total_points_groupe_bas if total_points_groupe_bas else 0
-        valeur_point_groupe_haut = (total_a_distribuer - montant_garanti_eligible) * part_augmentation_groupe_haut / total_points_groupe_haut if total_points_groupe_haut else 0
-        montant_toujours_eligible_groupe_bas = (min_(valeur_point_groupe_bas * rapport_valeur_point * score_attribution, augmentation_max) + montants_an_precedent) * toujours_eligible_groupe_bas
-        montant_toujours_eligible_groupe_haut = (min_(valeur_point_groupe_haut * rapport_valeur_point * score_attribution, augmentation_max) + montants_an_precedent) * toujours_eligible_groupe_haut
-        montant_nouvellement_eligible_groupe_bas = valeur_point_groupe_bas * score_attribution * nouvellement_eligible_groupe_bas
-        montant_nouvellement_eligible_groupe_haut = valeur_point_groupe_haut * score_attribution * nouvellement_eligible_groupe_haut
-        return montant_toujours_eligible_groupe_bas + montant_toujours_eligible_groupe_haut + montant_nouvellement_eligible_groupe_bas + montant_nouvellement_eligible_groupe_haut
+        montant_garanti_eligible = (toujours_eligible * montants_an_precedent).sum(axis = 0)
+        valeur_point_groupe_bas = safe_divide((total_a_distribuer - montant_garanti_eligible) * part_augmentation_groupe_bas, total_points_groupe_bas)
+        valeur_point_groupe_haut = safe_divide((total_a_distribuer - montant_garanti_eligible) * part_augmentation_groupe_haut, total_points_groupe_haut)
+        valeur_point = valeur_point_groupe_bas * groupe_bas + valeur_point_groupe_haut * groupe_haut
+        # Les communes toujours éligibles perçoivent le montant de l'an dernier, plus une augmentation
+        # plafonnée par dsu_montant_eligible
+        montant_toujours_eligible = montants_an_precedent + valeur_point * rapport_valeur_point * score_attribution
+        montant_nouvellement_eligible = valeur_point * score_attribution * (nouvellement_eligible_groupe_bas | nouvellement_eligible_groupe_haut)
+        return montant_toujours_eligible * toujours_eligible + montant_nouvellement_eligible
+
+
+# Plafonnement de l'augmentation des communes toujours éligibles, appelé par dsu_montant_eligible
+# et par dsu_regle_garantie : montants et règles retenues proviennent du même calcul.
+
+def garantie_augmentation_dsu(montants, montants_an_precedent, eligible, augmentation_max):
+    return apply_guarantees(montants, montants_an_precedent, eligible, augmentation_max = augmentation_max)
+
+
+class dsu_montant_eligible(Variable):
+    value_type = float
+    entity = Commune
+    definition_period = YEAR
+    label = "DSU au titre de l'éligibilité:\
+        Montant total reçu par la commune au titre de son éligibilité à la DSU (incluant part spontanée et augmentation)"
+    reference = "https://www.legifrance.gouv.fr/affichCodeArticle.do?idArticle=LEGIARTI000033814543&cidTexte=LEGITEXT000006070633"
+
+    def formula_2019_01(commune, period, parameters):
+        augmentation_max = parameters(period).dotation_solidarite_urbaine.attribution.augmentation_max
+        montants_an_precedent = commune('dsu_montant_eligible', period.last_year)
+        dsu_eligible = commune('dsu_eligible', period)
+        dsu_montant_eligible_hors_garanties = commune('dsu_montant_eligible_hors_garanties', period)
+        montants, _ = garantie_augmentation_dsu(dsu_montant_eligible_hors_garanties, montants_an_precedent, dsu_eligible, augmentation_max)
+        return montants
+
+
+class dsu_regle_garantie(Variable):
+    value_type = Enum
+    possible_values = RegleGarantie
+    default_value = RegleGarantie.aucune
+    entity = Commune
+    definition_period = YEAR
+    label = "Garantie appliquée à la commune au titre de la DSU (augmentation plafonnée ou sortie)"
+
+    def formula_2019_01(commune, period, parameters):
+        augmentation_max = parameters(period).dotation_solidarite_urbaine.attribution.augmentation_max
+        montants_an_precedent = commune('dsu_montant_eligible', period.last_year)
+        dsu_eligible = commune('dsu_eligible', period)
+        dsu_montant_eligible_hors_garanties = commune('dsu_montant_eligible_hors_garanties', period)
+        dsu_montant_garantie_non_eligible = commune('dsu_montant_garantie_non_eligible', period)
+        _, regles = garantie_augmentation_dsu(dsu_montant_eligible_hors_garanties, montants_an_precedent, dsu_eligible, augmentation_max)
+        # Garanties annuelle et pluriannuelle des communes non éligibles
+        return np.where(dsu_montant_garantie_non_eligible > 0, RegleGarantie.sortie.index, regles)
 
 
 class dsu_montant(Variable):
@@ -1,5 +1,6 @@
 from openfisca_core.model_api import *
 from openfisca_france_dotations_locales.entities import *
+from openfisca_france_dotations_locales.variables.base import bracket_amount
 
 
 class strate_demographique(Variable):
@@ -13,25 +14,10 @@ class strate_demographique(Variable):
         ]
 
     def formula(commune, period, parameters):
-        pop = commune('population_dgf', period)
-
-        return (
-            + 1 * (pop <= 499)
-            + 2 * (499 < pop) * (pop <= 999)
-            + 3 * (999 < pop) * (pop <= 1999)
-            + 4 * (1999 < pop) * (pop <= 3499)
-            + 5 * (3499 < pop) * (pop <= 4999)
-            + 6 * (4999 < pop) * (pop <= 7499)
-            + 7 * (7499 < pop) * (pop <= 9999)
-            + 8 * (9999 < pop) * (pop <= 14999)
-            + 9 * (14999 < pop) * (pop <= 19999)
-            + 10 * (19999 < pop) * (pop <= 34999)
-            + 11 * (34999 < pop) * (pop <= 49999)
-            + 12 * (49999 < pop) * (pop <= 74999)
-            + 13 * (74999 < pop) * (pop <= 99999)
-            + 14 * (99999 < pop) * (pop <= 199999)
-            + 15 * (199999 < pop)
-            )
+        population_dgf = commune('population_dgf', period)
+        strates_demographiques = parameters(period).population.strates_demographiques
+
+        return bracket_amount(strates_demographiques, population_dgf)
 
 
 class population_insee(Variable):
@@ -89,7 +75,7 @@ class population_dgf_plafonnee(Variable):
         bareme_plafond_dgf = parameters(period).population.plafond_dgf
 
         # pour les communes  à la population insee < à la clef, la population dgf est plafonnée à value
-        return min_(bareme_plafond_dgf.calc(population_insee), population_dgf)
+        return min_(bracket_amount(bareme_plafond_dgf, population_insee), population_dgf)
 
 
 class population_dgf_majoree(Variable):
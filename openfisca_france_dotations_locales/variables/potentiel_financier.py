@@ -2,6 +2,7 @@ import numpy as np
 
 from openfisca_core.model_api import *
 from openfisca_france_dotations_locales.entities import *
+from openfisca_france_dotations_locales.variables.base import group_ratio
 
 
 class potentiel_financier(Variable):
@@ -24,18 +25,8 @@ class potentiel_financier_par_habitant_moyen(Variable):
         population_dgf = commune('population_dgf', period)
         outre_mer = commune('outre_mer', period)
 
-        liste_strates = list(range(1 + int(strate_demographique.max())))
-        potentiel_financier_par_habitant_moyen_par_strate = np.fromiter(
-            (
-                (np.sum((~outre_mer) * (strate == strate_demographique) * potentiel_financier)
-                / np.sum((~outre_mer) * (strate == strate_demographique) * population_dgf))
-                if np.sum((~outre_mer) * (strate == strate_demographique) * population_dgf) > 0.01
-                else 0
-                for strate in liste_strates
-                ),
-            dtype = float
-            )
-        return (~outre_mer) * potentiel_financier_par_habitant_moyen_par_strate[strate_demographique]
+        potentiel_financier_par_habitant_moyen_par_strate = group_ratio(strate_demographique, potentiel_financier, population_dgf, where = ~outre_mer)
+        return (~outre_mer) * np.take_along_axis(potentiel_financier_par_habitant_moyen_par_strate, strate_demographique, axis = 0)
 
 
 class potentiel_financier_par_habitant(Variable):
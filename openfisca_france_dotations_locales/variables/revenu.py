@@ -2,7 +2,7 @@ import numpy as np
 
 from openfisca_core.model_api import *
 from openfisca_france_dotations_locales.entities import *
-from openfisca_france_dotations_locales.variables.base import safe_divide
+from openfisca_france_dotations_locales.variables.base import group_ratio, safe_divide
 
 
 class revenu_total(Variable):
@@ -34,18 +34,8 @@ class revenu_par_habitant_moyen(Variable):
         population_insee = commune('population_insee', period)
         outre_mer = commune('outre_mer', period)
 
-        liste_strates = list(range(1 + int(strate_demographique.max())))
-        revenu_par_habitant_moyen_par_strate = np.fromiter(
-            (
-                (np.sum((~outre_mer) * (strate == strate_demographique) * revenu)
-                / np.sum((~outre_mer) * (strate == strate_demographique) * population_insee))
-                if np.sum((~outre_mer) * (strate == strate_demographique) * population_insee) > 0.01
-                else 0
-                for strate in liste_strates
-                ),
-            dtype = float
-            )
-        return (~outre_mer) * revenu_par_habitant_moyen_par_strate[strate_demographique]
+        revenu_par_habitant_moyen_par_strate = group_ratio(strate_demographique, revenu, population_insee, where = ~outre_mer)
+        return (~outre_mer) * np.take_along_axis(revenu_par_habitant_moyen_par_strate, strate_demographique, axis = 0)
 
 
 class revenu_par_habitant(Variable):
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from openfisca_france_dotations_locales import CountryTaxBenefitSystem
+
+
+NOMBRE_COMMUNES = 50
+
+
+@pytest.fixture(scope = 'session')
+def tax_benefit_system():
+    return CountryTaxBenefitSystem()
+
+
+@pytest.fixture
+def inputs():
+    aleatoire = np.random.RandomState(0)
+    population = (aleatoire.pareto(1.2, NOMBRE_COMMUNES) * 1000 + 100).astype(int)
+    return {
+        'population_dgf': population,
+        'population_insee': population,
+        'potentiel_financier': population * aleatoire.uniform(500, 1500, NOMBRE_COMMUNES),
+        'revenu_total': population * aleatoire.uniform(8000, 20000, NOMBRE_COMMUNES),
+        'superficie': aleatoire.uniform(100, 5000, NOMBRE_COMMUNES),
+        'effort_fiscal': aleatoire.uniform(0.5, 1.5, NOMBRE_COMMUNES),
+        'zrr': aleatoire.uniform(size = NOMBRE_COMMUNES) < 0.5,
+        'chef_lieu_de_canton': aleatoire.uniform(size = NOMBRE_COMMUNES) < 0.3,
+        'nombre_logements': population // 2,
+        'nombre_logements_sociaux': population // 10,
+        'nombre_beneficiaires_aides_au_logement': population // 8,
+        'longueur_voirie': population * 10,
+        'population_enfants': population // 6,
+        'dsr_montant_eligible_fraction_bourg_centre': {'2019': population * 20.},
+        'dsu_montant_eligible': {'2019': (population >= 5000) * population * 40.},
+        }
+
+
+@pytest.fixture
+def variants():
+    return {
+        'dotation_solidarite_rurale.augmentation_montant': [0, 90_000_000, 180_000_000],
+        'dotation_solidarite_rurale.bourg_centre.attribution.coefficient_zrr': [1.3, 1, 2],
+        }
@@ -1,4 +1,5 @@
 import numpy as np
+from openfisca_france_dotations_locales.simulations.base import ReformSimulation, build_simulation
 from openfisca_france_dotations_locales.variables.base import safe_divide
 
 
@@ -7,3 +8,11 @@ def test_safe_divide():
     b = np.array([1, 0, 2, 0, -1])
     assert all(safe_divide(a, b) == [1, 0, 0, 0, 1])
     assert all(safe_divide(a, b, 12) == [1, 12, 0, 12, 1])
+
+
+def test_rang_indice_synthetique_dsr_cible_ranks_all_communes(tax_benefit_system, inputs):
+    overrides = {'dotation_solidarite_rurale.cible.eligibilite.seuil_classement': 2}
+    simulation = build_simulation(tax_benefit_system, inputs, '2020', simulation_class = ReformSimulation, parameter_overrides = overrides)
+    rang = simulation.calculate('rang_indice_synthetique_dsr_cible', '2020')
+    np.testing.assert_array_equal(np.sort(rang), np.arange(1, len(rang) + 1))
+    assert simulation.calculate('dsr_eligible_fraction_cible', '2020').sum() <= 2
@@ -0,0 +1,35 @@
+import numpy as np
+
+from openfisca_france_dotations_locales import CountryTaxBenefitSystem
+from openfisca_france_dotations_locales.simulations.base import build_simulation
+from openfisca_france_dotations_locales.simulations.batch import build_batch_simulation
+
+from conftest import NOMBRE_COMMUNES
+
+
+def test_batch_simulation_matches_sequential_simulations(tax_benefit_system, inputs, variants):
+    simulation = build_batch_simulation(tax_benefit_system, inputs, '2020', variants)
+    resultats = {
+        variable_name: simulation.calculate_variants(variable_name, '2020')
+        for variable_name in ['dotation_solidarite_rurale', 'dsu_montant', 'rang_indice_synthetique_dsr_cible']
+        }
+
+    for index in range(3):
+        reforme = CountryTaxBenefitSystem()
+        for path, values in variants.items():
+            parameter = reforme.parameters
+            for key in path.split('.'):
+                parameter = parameter.children[key]
+            parameter.update(period = 'year:2000:30', value = values[index])
+        simulation_sequentielle = build_simulation(reforme, inputs, '2020')
+        for variable_name, resultat in resultats.items():
+            assert resultat.shape == (3, NOMBRE_COMMUNES)
+            np.testing.assert_allclose(resultat[index], simulation_sequentielle.calculate(variable_name, '2020'), rtol = 1e-5)
+
+
+def test_batch_simulation_shares_intermediates(tax_benefit_system, inputs, variants):
+    simulation = build_batch_simulation(tax_benefit_system, inputs, '2020', variants)
+    simulation.calculate('dotation_solidarite_rurale', '2020')
+    # Les variables qui ne dépendent pas des paramètres modifiés ne sont calculées qu'une fois
+    assert simulation.get_array('strate_demographique', '2020').shape == (NOMBRE_COMMUNES, 1)
+    assert simulation.get_array('dsr_score_attribution_fraction_bourg_centre', '2020').shape == (NOMBRE_COMMUNES, 3)
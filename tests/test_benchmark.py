@@ -0,0 +1,31 @@
+import json
+
+from openfisca_france_dotations_locales.simulations.benchmark import VARIABLES, main
+
+
+def test_benchmark_reports_each_variable_and_year(tmp_path):
+    output = str(tmp_path / 'resultats.json')
+    main(['--communes', '200', '--annee', '2019', '--annee', '2020', '--output', output])
+
+    with open(output) as file:
+        resultats = json.load(file)
+    assert resultats['metadata']['communes'] == 200
+    assert [(resultat['variable'], resultat['period']) for resultat in resultats['results']] \
+        == [(variable_name, annee) for annee in ['2019', '2020'] for variable_name in VARIABLES]
+    for resultat in resultats['results']:
+        assert resultat['wall_time'] >= 0
+        assert resultat['computed_arrays'] > 0
+    peaks = [resultat['cumulative_peak_rss'] for resultat in resultats['results']]
+    assert peaks == sorted(peaks)
+
+
+def test_benchmark_with_liveness(tmp_path):
+    output = str(tmp_path / 'resultats.json')
+    main(['--communes', '200', '--annee', '2020', '--variable', 'dotation_solidarite_rurale', '--output', output])
+    main(['--communes', '200', '--annee', '2020', '--variable', 'dotation_solidarite_rurale', '--liveness', '--output', output + '.liveness'])
+
+    with open(output) as file:
+        resultat, = json.load(file)['results']
+    with open(output + '.liveness') as file:
+        resultat_liveness, = json.load(file)['results']
+    assert resultat_liveness['cached_bytes'] < resultat['cached_bytes']
@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+
+from openfisca_core.indexed_enums import EnumArray
+
+from openfisca_france_dotations_locales.simulations.base import build_simulation
+from openfisca_france_dotations_locales.simulations.cache import CachedSimulation, ResultCache
+
+
+class CountingSimulation(CachedSimulation):
+
+    def __init__(self, *args, **kwargs):
+        super(CountingSimulation, self).__init__(*args, **kwargs)
+        self.formulas_run = set()
+
+    def _run_formula(self, variable, population, period):
+        self.formulas_run.add(variable.name)
+        return super(CountingSimulation, self)._run_formula(variable, population, period)
+
+
+def build_cached_simulation(tax_benefit_system, inputs, cache, parameter_overrides = None):
+    return build_simulation(
+        tax_benefit_system, inputs, '2020',
+        simulation_class = CountingSimulation,
+        cache = cache,
+        parameter_overrides = parameter_overrides,
+        )
+
+
+def test_cached_simulation_reuses_results(tax_benefit_system, inputs, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    reference = build_simulation(tax_benefit_system, inputs, '2020')
+
+    premiere = build_cached_simulation(tax_benefit_system, inputs, cache)
+    seconde = build_cached_simulation(tax_benefit_system, inputs, cache)
+    for variable_name in ['dotation_solidarite_rurale', 'dsu_montant', 'dotation_forfaitaire']:
+        attendu = reference.calculate(variable_name, '2020')
+        np.testing.assert_array_equal(premiere.calculate(variable_name, '2020'), attendu)
+        np.testing.assert_array_equal(seconde.calculate(variable_name, '2020'), attendu)
+
+    assert 'dotation_solidarite_rurale' in premiere.formulas_run
+    assert 'dotation_solidarite_rurale' not in seconde.formulas_run
+    assert 'dsu_montant' not in seconde.formulas_run
+
+
+def test_cached_simulation_returns_enum_arrays(tax_benefit_system, inputs, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    variable_name = 'dsr_regle_garantie_fraction_bourg_centre'
+    attendu = build_simulation(tax_benefit_system, inputs, '2020').calculate(variable_name, '2020')
+    for _ in range(2):
+        simulation = build_cached_simulation(tax_benefit_system, inputs, cache)
+        resultat = simulation.calculate(variable_name, '2020')
+        assert isinstance(resultat, EnumArray)
+        assert resultat.possible_values is attendu.possible_values
+        np.testing.assert_array_equal(resultat.decode_to_str(), attendu.decode_to_str())
+    assert variable_name not in simulation.formulas_run
+
+
+def test_cached_simulation_invalidates_dependent_results(tax_benefit_system, inputs, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    for variable_name in ['dotation_solidarite_rurale', 'dsu_montant']:
+        build_cached_simulation(tax_benefit_system, inputs, cache).calculate(variable_name, '2020')
+
+    overrides = {'dotation_solidarite_urbaine.eligibilite.indice_synthetique.poids_revenu': 0.5}
+    simulation = build_cached_simulation(tax_benefit_system, inputs, cache, overrides)
+    simulation.calculate('dotation_solidarite_rurale', '2020')
+    simulation.calculate('dsu_montant', '2020')
+
+    assert 'dotation_solidarite_rurale' not in simulation.formulas_run
+    assert 'indice_synthetique_dsu' in simulation.formulas_run
+    assert 'dsu_montant' in simulation.formulas_run
+
+
+def test_cached_simulation_invalidates_results_on_input_change(tax_benefit_system, inputs, tmp_path):
+    cache = ResultCache(str(tmp_path))
+    build_cached_simulation(tax_benefit_system, inputs, cache).calculate('dotation_solidarite_rurale', '2020')
+
+    inputs = dict(inputs, population_enfants = inputs['population_enfants'] * 2)
+    attendu = build_simulation(tax_benefit_system, inputs, '2020').calculate('dotation_solidarite_rurale', '2020')
+    simulation = build_cached_simulation(tax_benefit_system, inputs, cache)
+
+    np.testing.assert_array_equal(simulation.calculate('dotation_solidarite_rurale', '2020'), attendu)
+    assert 'dsr_score_attribution_cible_part_enfants' in simulation.formulas_run
+
+
+def test_result_cache_evicts_least_recently_used_arrays(tmp_path):
+    cache = ResultCache(str(tmp_path), max_size = 3000)
+    for key in ['a', 'b', 'c']:
+        cache.put(key, np.zeros(100))  # 928 octets par fichier
+    os.utime(str(tmp_path / 'a.npy'), (0, 0))
+    os.utime(str(tmp_path / 'b.npy'), (1, 1))
+    assert cache.get('a') is not None  # 'a' devient le plus récemment utilisé
+
+    cache.put('d', np.zeros(100))
+
+    assert cache.get('b') is None
+    for key in ['a', 'c', 'd']:
+        assert cache.get(key) is not None
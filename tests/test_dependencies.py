@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from openfisca_france_dotations_locales.simulations.dependencies import (
+    Dependency,
+    DependencyGraph,
+    ParameterDependency,
+    main,
+    )
+
+
+@pytest.fixture(scope = 'module')
+def graph(tax_benefit_system):
+    return DependencyGraph.from_tax_benefit_system(tax_benefit_system)
+
+
+def test_dependencies_include_period_offsets(graph):
+    dependencies = graph.dependencies['dsr_montant_total_fraction_cible']
+    assert Dependency('dsr_montant_total_fraction_cible', -1) in dependencies
+    assert ParameterDependency('dotation_solidarite_rurale.augmentation_montant', 1) in graph.parameters['dsr_montant_total_fraction_cible']
+
+    # etat.members et commune.etat
+    assert Dependency('dsr_score_attribution_fraction_bourg_centre', 0) in graph.dependencies['dsr_valeur_point_fraction_bourg_centre']
+    assert Dependency('dsr_valeur_point_fraction_bourg_centre', 0) in graph.dependencies['dsr_montant_hors_garanties_fraction_bourg_centre']
+
+
+def test_previous_year_state(graph):
+    etat = graph.previous_year_state('dsu_montant')
+    assert {'dsu_montant_eligible', 'dsu_montant_total', 'dsu_montant_derniere_annee_eligible', 'dsu_nombre_annees_depuis_eligibilite'} <= etat
+    assert 'dotation_forfaitaire' not in etat
+
+
+def test_parameter_aliases_are_resolved(graph):
+    # parameters_dsr = parameters(period).dotation_solidarite_rurale
+    parameters = graph.parameters['dsr_score_attribution_fraction_bourg_centre']
+    assert ParameterDependency('dotation_solidarite_rurale.bourg_centre.attribution.coefficient_zrr', 0) in parameters
+    assert ParameterDependency('dotation_solidarite_rurale', 0) not in parameters
+
+
+def test_parameter_change_invalidates_downstream_variables(graph):
+    readers = graph.parameter_readers('dotation_solidarite_rurale.bourg_centre.attribution.coefficient_zrr')
+    assert readers == {'dsr_score_attribution_fraction_bourg_centre'}
+
+    downstream = graph.downstream(readers)
+    assert {'dsr_valeur_point_fraction_bourg_centre', 'dsr_fraction_bourg_centre', 'dotation_solidarite_rurale'} <= downstream
+    assert 'dsu_montant' not in downstream
+    assert 'dotation_forfaitaire' not in downstream
+    assert 'zrr' in graph.upstream('dotation_solidarite_rurale')
+
+
+def test_topological_order(graph):
+    order = graph.topological_order()
+    position = {variable_name: index for index, variable_name in enumerate(order)}
+    assert set(order) == set(graph.dependencies)
+    for variable_name, dependencies in graph.dependencies.items():
+        for dependency in dependencies:
+            if dependency.period_offset == 0:
+                assert position[dependency.variable] < position[variable_name]
+
+
+def test_command_line(capsys):
+    main(['dsr_valeur_point_fraction_bourg_centre', '--json'])
+    graph_json = json.loads(capsys.readouterr().out)
+    assert {'variable': 'dsr_score_attribution_fraction_bourg_centre', 'period_offset': 0} \
+        in graph_json['dsr_valeur_point_fraction_bourg_centre']['dependencies']
@@ -0,0 +1,79 @@
+import numpy as np
+
+from openfisca_france_dotations_locales.variables.base import RegleGarantie, allocate, apply_guarantees, bracket_amount, bracket_index, group_count, group_ratio, group_sum, group_weighted_mean, masked_ratio, masked_ratios, rank
+
+
+def test_group_reductions():
+    groups = np.array([0, 2, 2, 1, 2])
+    values = np.array([1., 2., 3., 4., 5.])
+    where = np.array([True, True, False, True, True])
+
+    np.testing.assert_array_equal(group_sum(groups, values), [1, 4, 10])
+    np.testing.assert_array_equal(group_sum(groups, values, where = where), [1, 4, 7])
+    np.testing.assert_array_equal(group_count(groups, where = where, size = 4), [1, 1, 2, 0])
+    np.testing.assert_array_equal(group_ratio(groups, values, np.array([1, 0, 1, 0, 1]), size = 4), [1, 0, 5, 0])
+    np.testing.assert_allclose(group_weighted_mean(groups, values, np.array([1, 1, 3, 1, 1])), [1, 4, (2 + 9 + 5) / 5])
+
+
+def test_group_reductions_by_variant():
+    # Colonnes (communes, variantes) d'une BatchSimulation
+    groups = np.array([[0], [1], [1]])
+    values = np.array([[1., 10.], [2., 20.], [3., 30.]])
+
+    sums = group_sum(groups, values)
+    np.testing.assert_array_equal(sums, [[1, 10], [5, 50]])
+    np.testing.assert_array_equal(np.take_along_axis(sums, groups, axis = 0), [[1, 10], [5, 50], [5, 50]])
+    np.testing.assert_array_equal(group_count(groups), [[1], [2]])
+
+
+def test_bracket_index_matches_tax_scale(tax_benefit_system):
+    plafond_dgf = tax_benefit_system.parameters('2020-01-01').population.plafond_dgf
+    population_insee = np.array([0, 99, 100, 499, 500, 1499, 1500, 100000])
+
+    np.testing.assert_array_equal(bracket_index(plafond_dgf, population_insee), [0, 0, 1, 1, 2, 2, 3, 3])
+    np.testing.assert_array_equal(bracket_amount(plafond_dgf, population_insee), plafond_dgf.calc(population_insee))
+
+
+def test_rank_breaks_ties_by_commune_order():
+    scores = np.array([2., 5., 2., 0., 5.])
+
+    np.testing.assert_array_equal(rank(scores), [3, 1, 4, 5, 2])
+    np.testing.assert_array_equal(rank(scores, top = 3), [3, 1, 4, 4, 2])
+    np.testing.assert_array_equal(rank(np.stack([scores, -scores], axis = 1), top = 2), [[3, 2], [1, 3], [3, 3], [3, 1], [2, 3]])
+
+
+def test_masked_ratios():
+    bas = np.array([True, True, False, False])
+    haut = np.array([False, False, True, True])
+    logements = np.array([10, 20, 30, 0])
+    logements_sociaux = np.array([1, 5, 6, 0])
+    population = np.array([100, 200, 300, 400])
+
+    np.testing.assert_array_equal(masked_ratios([bas, haut], [(logements_sociaux, logements), (logements, population)]), [[0.2, 0.1], [0.2, 30 / 700]])
+    # Masque commun et colonnes par variante
+    np.testing.assert_array_equal(masked_ratios([bas], [(logements_sociaux.reshape(-1, 1) * [1, 2], logements)]), [[[0.2, 0.4]]])
+    assert masked_ratio(haut, logements, population) == 30 / 700
+
+
+def test_allocate():
+    scores = [np.array([3., 7.]), np.array([1., 3.])]
+    np.testing.assert_array_equal(allocate(scores, [10., 20.]), [[30, 20], [70, 60]])
+    # Scores (communes, variantes), une valeur du point par variante
+    montants = allocate([scores[0].reshape(-1, 1) * [1, 3], scores[1].reshape(-1, 1)], [np.array([10., 5.]), 20.])
+    assert montants.shape == (2, 2, 2)
+    np.testing.assert_array_equal(montants.sum(axis = -1), [[50, 65], [130, 165]])
+
+
+def test_apply_guarantees():
+    montants = np.array([1000., 1000., 1000., 0., 1000.], dtype = np.float32)
+    montants_an_precedent = np.array([0., 600., 2000., 1000., 1000.])
+    eligible = np.array([True, True, True, False, True])
+    resultat, codes = apply_guarantees(montants, montants_an_precedent, eligible, plancher = 0.9, plafond = 1.2, sortie = 0.5, augmentation_max = 50)
+    assert resultat.dtype == np.float64
+    np.testing.assert_array_equal(resultat, [1000, 650, 1800, 500, 1000])
+    regles = [RegleGarantie.aucune, RegleGarantie.augmentation_max, RegleGarantie.plancher, RegleGarantie.sortie, RegleGarantie.aucune]
+    np.testing.assert_array_equal(codes, [regle.index for regle in regles])
+    # Montants par variante, les montants d'entrée ne sont pas modifiés
+    resultat, codes = apply_guarantees(montants.reshape(-1, 1) * [1, 2], montants_an_precedent.reshape(-1, 1), plafond = 1.2)
+    np.testing.assert_array_equal(resultat[:, 1], [2000, 720, 2000, 0, 1200])
+    np.testing.assert_array_equal(montants, [1000, 1000, 1000, 0, 1000])
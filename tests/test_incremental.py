@@ -0,0 +1,36 @@
+import numpy as np
+
+from openfisca_france_dotations_locales.simulations.base import ReformSimulation, build_simulation
+from openfisca_france_dotations_locales.simulations.incremental import IncrementalSimulation
+
+
+COEFFICIENT_ZRR = 'dotation_solidarite_rurale.bourg_centre.attribution.coefficient_zrr'
+OUTPUTS = ['dotation_solidarite_rurale', 'dsu_montant', 'dotation_forfaitaire']
+
+
+def test_update_parameters_recomputes_downstream_variables(tax_benefit_system, inputs):
+    simulation = build_simulation(tax_benefit_system, inputs, '2020', simulation_class = IncrementalSimulation)
+    for output in OUTPUTS:
+        simulation.calculate(output, '2020')
+    dsu_montant = simulation.get_array('dsu_montant', '2020')
+
+    invalidated = simulation.update_parameters({COEFFICIENT_ZRR: 2})
+
+    assert {
+        'dsr_score_attribution_fraction_bourg_centre',
+        'dsr_valeur_point_fraction_bourg_centre',
+        'dsr_fraction_bourg_centre',
+        'dotation_solidarite_rurale',
+        } <= invalidated
+    assert simulation.get_array('dotation_solidarite_rurale', '2020') is None
+    assert simulation.get_array('dsu_montant', '2020') is dsu_montant
+    # Les données d'entrée des années précédentes sont conservées
+    assert simulation.get_array('dsr_montant_eligible_fraction_bourg_centre', '2019') is not None
+
+    reference = build_simulation(
+        tax_benefit_system, inputs, '2020',
+        simulation_class = ReformSimulation,
+        parameter_overrides = {COEFFICIENT_ZRR: 2},
+        )
+    for output in OUTPUTS:
+        np.testing.assert_allclose(simulation.calculate(output, '2020'), reference.calculate(output, '2020'))
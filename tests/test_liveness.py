@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from openfisca_france_dotations_locales.simulations.base import ReformSimulation, build_simulation
+from openfisca_france_dotations_locales.simulations.batch import build_batch_simulation
+from openfisca_france_dotations_locales.simulations.projection import VARIABLES, project
+from openfisca_france_dotations_locales.simulations.synthetic import generate_communes
+
+
+OUTPUTS = ['dotation_solidarite_rurale', 'dsu_montant', 'dotation_forfaitaire']
+
+
+def test_intermediates_are_released(tax_benefit_system, inputs):
+    reference = build_simulation(tax_benefit_system, inputs, '2020', simulation_class = ReformSimulation)
+    simulation = build_simulation(tax_benefit_system, inputs, '2020', simulation_class = ReformSimulation, outputs = OUTPUTS)
+    for output in OUTPUTS:
+        np.testing.assert_array_equal(simulation.calculate(output, '2020'), reference.calculate(output, '2020'))
+
+    for variable_name in ['indice_synthetique_dsu', 'dsr_score_attribution_cible_part_enfants', 'rang_indice_synthetique_dsr_cible']:
+        assert reference.get_array(variable_name, '2020') is not None
+        assert simulation.get_array(variable_name, '2020') is None
+    # Les variables demandées et les données d'entrée sont conservées
+    assert simulation.get_array('dotation_solidarite_rurale', '2020') is not None
+    assert simulation.get_array('dsu_montant', '2020') is not None
+    assert simulation.get_array('population_dgf', '2020') is not None
+    assert simulation.get_array('dsr_montant_eligible_fraction_bourg_centre', '2019') is not None
+
+    # Une variable libérée n'est pas recalculée en silence
+    with pytest.raises(ValueError):
+        simulation.calculate('indice_synthetique_dsu', '2020')
+    # Une variable calculée avant les variables demandées n'est pas libérée
+    simulation = build_simulation(tax_benefit_system, inputs, '2020', simulation_class = ReformSimulation, outputs = OUTPUTS)
+    indice = simulation.calculate('indice_synthetique_dsu', '2020')
+    simulation.calculate('dsu_montant', '2020')
+    np.testing.assert_array_equal(simulation.calculate('indice_synthetique_dsu', '2020'), indice)
+
+
+def test_batch_simulation_releases_intermediates(tax_benefit_system, inputs, variants):
+    reference = build_batch_simulation(tax_benefit_system, inputs, '2020', variants)
+    simulation = build_batch_simulation(tax_benefit_system, inputs, '2020', variants, outputs = ['dotation_solidarite_rurale'])
+    np.testing.assert_array_equal(
+        simulation.calculate_variants('dotation_solidarite_rurale', '2020'),
+        reference.calculate_variants('dotation_solidarite_rurale', '2020'),
+        )
+    assert simulation.get_array('dsr_score_attribution_fraction_bourg_centre', '2020') is None
+
+
+def test_projection_with_liveness(tax_benefit_system):
+    inputs = generate_communes(2000, '2020', tax_benefit_system = tax_benefit_system)
+    reference = build_simulation(tax_benefit_system, inputs, '2020')
+    simulation = build_simulation(tax_benefit_system, inputs, '2020', simulation_class = ReformSimulation, outputs = VARIABLES)
+    for (annee, resultats), (_, resultats_reference) in zip(project(simulation, 2020, 2022), project(reference, 2020, 2022)):
+        for variable_name in VARIABLES:
+            np.testing.assert_array_equal(resultats[variable_name], resultats_reference[variable_name])
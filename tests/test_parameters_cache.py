@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from openfisca_france_dotations_locales import CountryTaxBenefitSystem, parameters_cache
+
+
+PARAMETRE = '''description: Nombre d'habitants.
+values:
+  2019-01-01:
+    value: {}
+'''
+
+
+def write_parameter(directory, value, mtime):
+    path = str(directory / 'seuil_nombre_habitants.yaml')
+    with open(path, 'w') as file:
+        file.write(PARAMETRE.format(value))
+    os.utime(path, (mtime, mtime))
+
+
+def test_parameter_tree_is_cached_until_a_file_changes(tmp_path, monkeypatch):
+    parameters_directory = tmp_path / 'parameters'
+    parameters_directory.mkdir()
+    cache_directory = str(tmp_path / 'cache')
+    write_parameter(parameters_directory, 10000, 1000)
+
+    lectures = []
+    parameter_node = parameters_cache.ParameterNode
+    monkeypatch.setattr(parameters_cache, 'ParameterNode', lambda *args, **kwargs: lectures.append(args) or parameter_node(*args, **kwargs))
+
+    def load():
+        return parameters_cache.load_parameter_tree(str(parameters_directory), cache_directory)
+
+    assert load().seuil_nombre_habitants('2020-01-01') == 10000
+    assert load().seuil_nombre_habitants('2020-01-01') == 10000
+    assert len(lectures) == 1
+
+    write_parameter(parameters_directory, 20000, 2000)
+    assert load().seuil_nombre_habitants('2020-01-01') == 20000
+    assert len(lectures) == 2
+
+
+def test_cache_is_not_read_from_a_shared_directory(tmp_path, monkeypatch):
+    parameters_directory = tmp_path / 'parameters'
+    parameters_directory.mkdir()
+    cache_directory = tmp_path / 'cache'
+    write_parameter(parameters_directory, 10000, 1000)
+    parameters_cache.load_parameter_tree(str(parameters_directory), str(cache_directory))
+    cache_directory.chmod(0o777)
+
+    monkeypatch.setattr(parameters_cache.pickle, 'load', lambda file: pytest.fail('cache lu depuis un répertoire partagé'))
+    assert parameters_cache.load_parameter_tree(str(parameters_directory), str(cache_directory)).seuil_nombre_habitants('2020-01-01') == 10000
+
+
+def test_cache_is_disabled_by_default(tmp_path, monkeypatch):
+    monkeypatch.delenv(parameters_cache.CACHE_DIRECTORY_VARIABLE, raising = False)
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+    assert parameters_cache.get_cache_directory() is None
+    CountryTaxBenefitSystem()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_parameters_are_preprocessed(monkeypatch, tmp_path):
+    monkeypatch.setenv(parameters_cache.CACHE_DIRECTORY_VARIABLE, str(tmp_path))
+    preprocessed = []
+    monkeypatch.setattr(CountryTaxBenefitSystem, 'preprocess_parameters', lambda self, parameters: preprocessed.append(parameters) or parameters)
+
+    for _ in range(2):  # cache écrit, puis lu
+        tax_benefit_system = CountryTaxBenefitSystem()
+        assert preprocessed[-1] is tax_benefit_system.parameters
+    assert len(preprocessed) == 2
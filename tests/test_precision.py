@@ -0,0 +1,48 @@
+import numpy as np
+
+from openfisca_france_dotations_locales.simulations.base import ReformSimulation, build_simulation
+from openfisca_france_dotations_locales.simulations.batch import build_batch_simulation
+from openfisca_france_dotations_locales.simulations.benchmark import run_precision_report
+from openfisca_france_dotations_locales.simulations.precision import DOUBLE, MONTANTS, MONTANTS_DOUBLE
+from openfisca_france_dotations_locales.simulations.synthetic import generate_communes
+
+
+def test_precision_profile_sets_storage_types(tax_benefit_system, inputs):
+    simulation = build_simulation(tax_benefit_system, inputs, '2020', simulation_class = ReformSimulation, dtypes = MONTANTS_DOUBLE)
+    assert simulation.calculate('dsu_montant', '2020').dtype == np.float64
+    assert simulation.calculate('indice_synthetique_dsu', '2020').dtype == np.float32
+    assert simulation.calculate('population_dgf', '2020').dtype == np.int32
+    assert simulation.calculate('dsu_eligible', '2020').dtype == np.bool_
+
+    simulation = build_simulation(tax_benefit_system, inputs, '2020', simulation_class = ReformSimulation, dtypes = DOUBLE)
+    assert simulation.calculate('indice_synthetique_dsu', '2020').dtype == np.float64
+    assert simulation.calculate('population_dgf', '2020').dtype == np.int64
+    # Le profil ne modifie pas le système socio-fiscal
+    assert tax_benefit_system.get_variable('dsu_montant').dtype == np.float32
+
+
+def test_national_averages_are_stored_as_double(tax_benefit_system, inputs):
+    simulation = build_simulation(tax_benefit_system, inputs, '2020', simulation_class = ReformSimulation)
+    moyennes = [
+        'dsr_potentiel_financier_par_habitant_moyen_10000',
+        'dsr_potentiel_financier_par_hectare_moyen_10000',
+        'dsu_potentiel_financier_par_habitant_moyen_seuil_bas',
+        'dsu_part_logements_sociaux_moyenne_seuil_haut',
+        'dsu_revenu_par_habitant_moyen_seuil_bas',
+        ]
+    for variable_name in moyennes:
+        assert tax_benefit_system.get_variable(variable_name).dtype == np.float64
+        assert simulation.calculate(variable_name, '2020').dtype == np.float64
+
+
+def test_batch_simulation_precision_profile(tax_benefit_system, inputs, variants):
+    simulation = build_batch_simulation(tax_benefit_system, inputs, '2020', variants, dtypes = DOUBLE)
+    assert simulation.calculate_variants('dotation_solidarite_rurale', '2020').dtype == np.float64
+
+
+def test_precision_report(tax_benefit_system):
+    rapport = run_precision_report(tax_benefit_system, generate_communes(5000, '2020'), '2020')
+    assert sorted(rapport) == sorted(MONTANTS)
+    for variable_name, ecarts in rapport.items():
+        assert ecarts['relative_deviation'] < 1e-5
+        assert ecarts['reference_bytes'] == 2 * ecarts['bytes']
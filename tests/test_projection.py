@@ -0,0 +1,35 @@
+import numpy as np
+
+from openfisca_core.periods import ETERNITY
+
+from openfisca_france_dotations_locales.simulations.base import build_simulation
+from openfisca_france_dotations_locales.simulations.projection import VARIABLES, project
+from openfisca_france_dotations_locales.simulations.synthetic import generate_communes
+
+
+def test_projection_keeps_only_the_previous_year(tax_benefit_system):
+    inputs = generate_communes(5000, '2020', tax_benefit_system = tax_benefit_system)
+    simulation = build_simulation(tax_benefit_system, inputs, '2020')
+    resultats = {}
+    for annee, resultats_annee in project(simulation, 2020, 2023):
+        resultats[annee] = resultats_annee
+        for variable_name, variable in tax_benefit_system.variables.items():
+            if variable.definition_period != ETERNITY:
+                assert all(str(period.start.year) == annee for period in simulation.get_holder(variable_name).get_known_periods())
+    assert list(resultats) == ['2020', '2021', '2022', '2023']
+
+    # Mêmes calculs, années dans l'ordre, dans une simulation qui garde toutes les années
+    donnees = {}
+    for variable_name, values in inputs.items():
+        values = dict(values) if isinstance(values, dict) else {'2020': values}
+        for annee in range(2021, 2024):
+            if str(annee - 1) in values:
+                values.setdefault(str(annee), values[str(annee - 1)])
+        donnees[variable_name] = values
+    simulation_complete = build_simulation(tax_benefit_system, donnees, '2020')
+    for variable_name in ['dsu_montant_total', 'dsr_montant_total_fraction_bourg_centre', 'dsr_montant_total_fraction_perequation', 'dsr_montant_total_fraction_cible']:
+        simulation_complete.calculate(variable_name, '2019')
+    for annee in resultats:
+        assert not np.isnan(resultats[annee]['dsu_montant']).any()
+        for variable_name in VARIABLES:
+            np.testing.assert_array_equal(resultats[annee][variable_name], simulation_complete.calculate(variable_name, annee))
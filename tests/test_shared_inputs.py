@@ -0,0 +1,28 @@
+import os
+
+import numpy as np
+
+from openfisca_france_dotations_locales.simulations.base import build_simulation
+from openfisca_france_dotations_locales.simulations.shared_inputs import SharedInputs
+from openfisca_france_dotations_locales.simulations.sweep import run_sweep
+
+
+def test_shared_inputs_are_used_without_copy(tax_benefit_system, inputs):
+    with SharedInputs.create(tax_benefit_system, inputs) as shared_inputs:
+        simulation = build_simulation(tax_benefit_system, shared_inputs.load(), '2020')
+        assert isinstance(simulation.get_array('population_dgf', '2020'), np.memmap)
+        assert isinstance(simulation.get_array('dsu_montant_eligible', '2019'), np.memmap)
+
+        reference = build_simulation(tax_benefit_system, inputs, '2020')
+        np.testing.assert_array_equal(
+            simulation.calculate('dotation_solidarite_rurale', '2020'),
+            reference.calculate('dotation_solidarite_rurale', '2020'),
+            )
+    assert not os.path.exists(shared_inputs.directory)
+
+
+def test_sweep_with_shared_inputs(tax_benefit_system, inputs, variants):
+    liste_variantes = [{path: values[index] for path, values in variants.items()} for index in range(3)]
+    with SharedInputs.create(tax_benefit_system, inputs) as shared_inputs:
+        resultats = run_sweep(shared_inputs, '2020', liste_variantes, ['dsu_montant'], max_workers = 2)
+    np.testing.assert_array_equal(resultats['dsu_montant'], run_sweep(inputs, '2020', liste_variantes, ['dsu_montant'], max_workers = 2)['dsu_montant'])
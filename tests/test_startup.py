@@ -0,0 +1,36 @@
+import json
+import subprocess
+import sys
+
+
+# Budgets larges : ils détectent une régression importante (ex. lecture de fichiers à l'import), pas quelques millisecondes
+BUDGET_IMPORT = 5  # secondes
+BUDGET_SYSTEME = 3  # secondes
+
+MESURE = '''
+import json, sys, time
+debut = time.perf_counter()
+import openfisca_france_dotations_locales
+import_termine = time.perf_counter()
+openfisca_france_dotations_locales.CountryTaxBenefitSystem()
+fin = time.perf_counter()
+print(json.dumps({
+    'import': import_termine - debut,
+    'systeme': fin - import_termine,
+    'exemples_charges': 'openfisca_france_dotations_locales.situation_examples' in sys.modules,
+    }))
+'''
+
+
+def test_startup_time_budget():
+    # Un processus neuf, pour mesurer l'import hors des modules déjà chargés par pytest
+    mesures = json.loads(subprocess.check_output([sys.executable, '-c', MESURE]))
+    assert mesures['import'] < BUDGET_IMPORT
+    assert mesures['systeme'] < BUDGET_SYSTEME
+    assert not mesures['exemples_charges']
+
+
+def test_open_api_config_is_loaded_on_first_access(tax_benefit_system):
+    open_api_config = tax_benefit_system.open_api_config
+    assert open_api_config['variable_example'] == 'population_dgf_plafonnee'
+    assert 'communes' in open_api_config['simulation_example']
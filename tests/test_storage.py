@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+
+from openfisca_france_dotations_locales.simulations.base import ReformSimulation, build_simulation
+from openfisca_france_dotations_locales.simulations.batch import build_batch_simulation
+
+
+def test_large_arrays_are_spilled_to_disk(tax_benefit_system, inputs, variants, tmp_path):
+    reference = build_batch_simulation(tax_benefit_system, inputs, '2020', variants)
+    with build_batch_simulation(tax_benefit_system, inputs, '2020', variants, spill_threshold = 500, spill_directory = str(tmp_path)) as simulation:
+        np.testing.assert_array_equal(
+            simulation.calculate_variants('dotation_solidarite_rurale', '2020'),
+            reference.calculate_variants('dotation_solidarite_rurale', '2020'),
+            )
+        spill_directory = simulation.spill_directory
+        assert os.path.dirname(spill_directory) == str(tmp_path)
+        # Tableau (communes, variantes) : sur disque
+        assert isinstance(simulation.get_array('dsr_score_attribution_fraction_bourg_centre', '2020'), np.memmap)
+        assert os.listdir(os.path.join(spill_directory, 'dsr_score_attribution_fraction_bourg_centre'))
+        # Petit tableau : en mémoire
+        assert not isinstance(simulation.get_array('dsr_montant_total_fraction_bourg_centre', '2020'), np.memmap)
+    assert not os.path.exists(spill_directory)
+
+
+def test_spill_thresholds_by_variable(tax_benefit_system, inputs, tmp_path):
+    simulation = build_simulation(
+        tax_benefit_system, inputs, '2020',
+        simulation_class = ReformSimulation,
+        outputs = ['dsu_montant'],
+        spill_threshold = {'indice_synthetique_dsu': 0, 'dsu_montant': 0},
+        spill_directory = str(tmp_path),
+        )
+    simulation.calculate('dsu_montant', '2020')
+    assert isinstance(simulation.get_array('dsu_montant', '2020'), np.memmap)
+    assert not isinstance(simulation.get_array('rang_indice_synthetique_dsu_seuil_haut', '2020'), np.memmap)
+    # Un résultat intermédiaire libéré est supprimé du disque
+    assert simulation.get_array('indice_synthetique_dsu', '2020') is None
+    assert not os.listdir(os.path.join(simulation.spill_directory, 'indice_synthetique_dsu'))
+    simulation.close()
+    assert not os.listdir(str(tmp_path))
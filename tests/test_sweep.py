@@ -0,0 +1,21 @@
+import numpy as np
+
+from openfisca_france_dotations_locales.simulations.batch import build_batch_simulation
+from openfisca_france_dotations_locales.simulations.sweep import run_sweep
+
+from conftest import NOMBRE_COMMUNES
+
+
+def test_sweep_matches_batch_simulation(tax_benefit_system, inputs, variants):
+    outputs = ['dotation_solidarite_rurale', 'dsu_montant', 'dotation_forfaitaire']
+    liste_variantes = [
+        {path: values[index] for path, values in variants.items()}
+        for index in range(3)
+        ]
+
+    resultats = run_sweep(inputs, '2020', liste_variantes, outputs, max_workers = 2)
+
+    simulation = build_batch_simulation(tax_benefit_system, inputs, '2020', variants)
+    for output in outputs:
+        assert resultats[output].shape == (3, NOMBRE_COMMUNES)
+        np.testing.assert_allclose(resultats[output], simulation.calculate_variants(output, '2020'), rtol = 1e-5)
@@ -0,0 +1,42 @@
+import numpy as np
+
+from openfisca_france_dotations_locales.simulations.base import build_simulation
+from openfisca_france_dotations_locales.simulations.synthetic import generate_communes
+
+
+def test_generated_communes_cover_every_input_variable(tax_benefit_system):
+    inputs = generate_communes(5000, '2020', seed = 1, tax_benefit_system = tax_benefit_system)
+
+    variables_entree = {
+        variable_name
+        for variable_name, variable in tax_benefit_system.variables.items()
+        if not variable.formulas
+        }
+    assert variables_entree <= set(inputs)
+    assert inputs['dotation_forfaitaire'].keys() == {'2019'}
+
+    simulation = build_simulation(tax_benefit_system, inputs, '2020')
+    assert simulation.calculate('dotation_solidarite_rurale', '2020').sum() > 0
+    assert simulation.calculate('dsu_montant', '2020').sum() > 0
+
+
+def test_generated_communes_are_deterministic():
+    premier = generate_communes(500, '2020', seed = 3)
+    second = generate_communes(500, '2020', seed = 3)
+    autre = generate_communes(500, '2020', seed = 4)
+
+    np.testing.assert_array_equal(premier['population_dgf'], second['population_dgf'])
+    np.testing.assert_array_equal(premier['dsu_montant_eligible']['2019'], second['dsu_montant_eligible']['2019'])
+    assert not np.array_equal(premier['population_dgf'], autre['population_dgf'])
+
+
+def test_generated_territories_are_consistent():
+    inputs = generate_communes(5000, '2020')
+    population = inputs['population_dgf']
+
+    # Le chef-lieu de canton est la commune la plus peuplée de son canton
+    chefs_lieux = inputs['chef_lieu_de_canton']
+    np.testing.assert_array_equal(population[chefs_lieux], inputs['population_dgf_chef_lieu_de_canton'][chefs_lieux])
+    assert (inputs['part_population_canton'][chefs_lieux] > 0).all()
+    assert (inputs['population_dgf_agglomeration'] >= population).all()
+    assert (inputs['population_dgf_maximum_commune_agglomeration'] >= population).all()